@@ -0,0 +1,122 @@
+# backend/air_quality.py
+"""Air-quality layer: OpenWeather readings snapped to a grid and cached per provider update.
+
+OpenWeather's air pollution data is modelled on a coarse grid and refreshed
+hourly, so every point in an AQI_GRID_DEG cell shares one reading until the
+next update. A /recommend prefetches the cells covering its search area once
+instead of calling OpenWeather per candidate.
+"""
+import math
+import os
+import threading
+import time
+
+from cache import get_aqi_reading, set_aqi_reading
+from metrics import TracedExecutor
+from singleflight import SingleFlight
+
+AQI_GRID_DEG = float(os.environ.get("AQI_GRID_DEG", "0.05"))          # ~5.5 km cells
+AQI_UPDATE_S = int(os.environ.get("AQI_UPDATE_S", "3600"))            # provider refresh cadence
+AQI_UPDATE_OFFSET_S = int(os.environ.get("AQI_UPDATE_OFFSET_S", "600"))  # new data lands this long past the hour
+AQI_PREFETCH_MAX_CELLS = 16
+
+EARTH_M_PER_DEG = 6371000 * math.pi / 180
+
+_flights = SingleFlight("aqi")
+_prefetch_pool = TracedExecutor(max_workers=4, thread_name_prefix="aqi")
+_stats = {"hits": 0, "fetches": 0, "errors": 0}
+_stats_lock = threading.Lock()
+
+
+def _count(stat):
+    with _stats_lock:
+        _stats[stat] += 1
+
+
+def aqi_cell(lat, lon):
+    """(row, col) of the AQI grid cell containing the point"""
+    return (math.floor(lat / AQI_GRID_DEG), math.floor(lon / AQI_GRID_DEG))
+
+
+def cell_key(cell):
+    return f"{AQI_GRID_DEG:g}:{cell[0]}:{cell[1]}"
+
+
+def cell_center(cell):
+    return ((cell[0] + 0.5) * AQI_GRID_DEG, (cell[1] + 0.5) * AQI_GRID_DEG)
+
+
+def next_update(now=None):
+    """Epoch time of the provider's next update, when cached readings go stale"""
+    now = time.time() if now is None else now
+    return (math.floor((now - AQI_UPDATE_OFFSET_S) / AQI_UPDATE_S) + 1) * AQI_UPDATE_S + AQI_UPDATE_OFFSET_S
+
+
+def _fetch_cell(cell, deadline=None):
+    from utils_geo import fetch_air_quality_openweather
+
+    key = cell_key(cell)
+    reading = get_aqi_reading(key)
+    if reading is not None:
+        return tuple(reading)
+    _count("fetches")
+    try:
+        reading = fetch_air_quality_openweather(*cell_center(cell), deadline)
+    except Exception:
+        _count("errors")
+        raise
+    set_aqi_reading(key, next_update(), list(reading))
+    return reading
+
+
+def aqi_for_point(lat, lon, deadline=None):
+    """(aqi, pm25) for the point's cell; one upstream call per cell per update. Raises on failure."""
+    cell = aqi_cell(lat, lon)
+    reading = get_aqi_reading(cell_key(cell))
+    if reading is not None:
+        _count("hits")
+        return tuple(reading)
+    wait = None if deadline is None else deadline.remaining()
+    return _flights.do(cell, lambda: _fetch_cell(cell, deadline), wait)
+
+
+def current_aqi(base, lat, lon, deadline=None):
+    """base metrics with aqi/pm25 from the point's current reading
+
+    An uncached cell is fetched (joining the prefetch when one is in flight).
+    If that fails, the base's stored AQI - up to a day old - is not passed
+    off as current: "aqi" is listed in base["missing"] instead.
+    """
+    try:
+        aqi, pm25 = aqi_for_point(lat, lon, deadline)
+    except Exception as e:
+        print(f"⚠️ No current AQI for {lat:.4f},{lon:.4f}: {e}")
+        return dict(base, missing=list(base.get("missing", [])) + ["aqi"])
+    return dict(base, aqi=int(aqi), pm25=float(pm25) if pm25 is not None else None)
+
+
+def cells_covering(lat, lon, radius_m):
+    """Every AQI cell intersecting the search circle's bounding box"""
+    dlat = radius_m / EARTH_M_PER_DEG
+    dlon = radius_m / (EARTH_M_PER_DEG * max(0.01, math.cos(math.radians(lat))))
+    r0, c0 = aqi_cell(lat - dlat, lon - dlon)
+    r1, c1 = aqi_cell(lat + dlat, lon + dlon)
+    return [(r, c) for r in range(r0, r1 + 1) for c in range(c0, c1 + 1)]
+
+
+def prefetch_area(lat, lon, radius_m, deadline=None):
+    """✅ Warm every cell covering the search area in one parallel pass
+
+    Returns the futures so callers can ignore them (fire-and-forget) or wait.
+    """
+    cells = cells_covering(lat, lon, radius_m)[:AQI_PREFETCH_MAX_CELLS]
+    todo = [c for c in cells if get_aqi_reading(cell_key(c)) is None]
+    return [_prefetch_pool.submit(_flights.do, c, lambda c=c: _fetch_cell(c, deadline)) for c in todo]
+
+
+def aqi_stats():
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["grid_deg"] = AQI_GRID_DEG
+    stats["update_s"] = AQI_UPDATE_S
+    return stats
@@ -1,94 +1,441 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context
 from utils_geo import (
     nominatim_autocomplete,
     photon_autocomplete,
     nominatim_lookup,
+    rank_search_results,
     overpass_candidates_near,
-    compute_candidate_metrics,
+    iter_enriched_candidates,
+    enrich_candidates_multi,
+    fetch_metric_layers,
+    lookup_base_metrics,
     normalize_scores_and_rank,
     fallback_generate_empty_spaces
 )
 from flask_cors import CORS
-from cache import get_cached_result, set_cached_result, clear_expired_cache  # ← ADD THIS LINE
+from cache import get_cached_result, set_cached_result, get_cache_key, record_usage  # ← ADD THIS LINE
+from cache import get_enriched, set_enriched, cached_at
+from gazetteer import lookup_places
+from scoring import parse_weights, weights_signature, danger_candidates
+from deadline import Deadline, DeadlineExceeded, wait_timeout
+from singleflight import SingleFlight, FlightAbandoned
+from air_quality import prefetch_area
+from metrics import trace, span
+from warming import start_warmer
+from responses import respond, project, parse_fields, compress_response
+import json
 import os
 
 app = Flask(__name__)
 CORS(app)
 
-# Clean up expired cache on startup
-clear_expired_cache()  # ← ADD THIS LINE
+# gzip/brotli bodies per Accept-Encoding (see responses.py)
+app.after_request(compress_response)
 
+# Expired cache rows are pruned incrementally on every write (see cache.py)
+
+# Identical /recommend computations in flight at once share the first one's result
+recommend_flights = SingleFlight("recommend")
 
 @app.route("/autocomplete")
 def autocomplete():
     q = request.args.get("q", "")
     if not q:
         return jsonify({"results": []})
-    res = nominatim_autocomplete(q, limit=8)
-    if not res:
-        res = photon_autocomplete(q, limit=8)
-    return jsonify({"results": res})
+    with trace("autocomplete"):
+        # Served from the local prefix index when it can answer; no network
+        res = lookup_places(q, rank_search_results, limit=8)
+        if res is not None:
+            return respond({"results": res})
+        res = nominatim_autocomplete(q, limit=8)
+        if not res:
+            res = photon_autocomplete(q, limit=8)
+    return respond({"results": res})
 
 
-@app.route("/recommend")
-def recommend():
-    place = request.args.get("place")
-    infra = request.args.get("infra", "hospital")
-    radius_m = int(request.args.get("radius", "2500"))
+def resolve_origin(args, deadline=None):
+    """(lat, lon) from explicit coordinates, else a Nominatim lookup of `place`"""
+    lat = args.get("lat")
+    lon = args.get("lon")
+    if lat and lon:
+        return float(lat), float(lon)
+    loc = nominatim_lookup(args.get("place"), deadline)
+    if not loc:
+        return None
+    return float(loc["lat"]), float(loc["lon"])
 
-    lat = request.args.get("lat")
-    lon = request.args.get("lon")
 
-    if not lat or not lon:
-        loc = nominatim_lookup(place)
-        if not loc:
-            return jsonify({"error": "Place not found"})
-        lat = float(loc["lat"])
-        lon = float(loc["lon"])
-    else:
-        lat = float(lat)
-        lon = float(lon)
+def completeness_summary(candidates):
+    """Share of candidates that have each metric"""
+    flags = [c["completeness"] for c in candidates if "completeness" in c]
+    if not flags:
+        return {}
+    return {m: sum(f[m] for f in flags) / len(flags) for m in flags[0]}
 
+
+def recommend_events(lat, lon, infra, radius_m, weights, variant, deadline=None):
+    """The /recommend pipeline as a sequence of (event, payload) steps
+
+    Yields "candidates" once sites are known, "candidate" as each one is
+    enriched, and finally "result" with the ranked good/danger sets.
+    Metrics that fail or miss the deadline are imputed and flagged; the result
+    carries a "completeness" summary and is cached only when complete.
+    """
     # ✅ CHECK CACHE FIRST (ADD THIS BLOCK)
-    cached = get_cached_result(lat, lon, infra, radius_m)
+    cached = get_cached_result(lat, lon, infra, radius_m, variant)
     if cached:
         print("⚡ Returning cached result - INSTANT!")
-        return jsonify(cached)
+        yield "result", cached
+        return
     # ✅ END OF CACHE CHECK
 
-    # If not cached, compute normally
+    # Custom weights over a search already computed: re-rank its stored metrics, no upstream calls
+    if variant:
+        stored = get_enriched(lat, lon, infra, radius_m)
+        if stored:
+            yield "result", rerank(stored, lat, lon, weights)
+            return
+
+    # Same search already running (cache not written yet)? Wait for it instead.
+    # A deadline-bounded follower waits until its own deadline, then answers
+    # from its own (imputed) run; an unbounded one never settles for a partial result.
+    key = get_cache_key(lat, lon, infra, radius_m, variant)
+    while True:
+        flight, leader = recommend_flights.begin(key)
+        if leader:
+            break
+        print("🤝 Joining in-flight computation for the same search")
+        try:
+            result = flight.wait(wait_timeout(deadline))
+        except FlightAbandoned:
+            continue
+        except DeadlineExceeded:
+            if flight.done.is_set():
+                continue  # the leader ran out of its own budget; that says nothing about ours
+            print("⏳ In-flight computation missed our deadline; answering on our own")
+            result = yield from compute_recommendation(lat, lon, infra, radius_m, weights, variant, deadline)
+            yield "result", result
+            return
+        if deadline is None and not result.get("complete", True):
+            continue
+        yield "result", result
+        return
+
+    try:
+        result = yield from compute_recommendation(lat, lon, infra, radius_m, weights, variant, deadline)
+    except GeneratorExit:
+        # Streaming client went away mid-computation; a follower takes over
+        recommend_flights.finish(key, flight, ok=False)
+        raise
+    except Exception as e:
+        recommend_flights.finish(key, flight, error=e)
+        raise
+    recommend_flights.finish(key, flight, result=result)
+
+    yield "result", result
+
+
+def compute_recommendation(lat, lon, infra, radius_m, weights, variant, deadline=None):
+    """Fresh /recommend computation: yields the progress events, returns the result"""
     print("🔍 Computing fresh results (will be cached for next time)...")
-    
+
+    # AQI cells for the whole area load in the background while Overpass runs
+    prefetch_area(lat, lon, radius_m, deadline)
+
     # 1) First try Overpass
-    candidates = overpass_candidates_near(lat, lon, radius_m, infra)
+    candidates = overpass_candidates_near(lat, lon, radius_m, infra, deadline=deadline)
 
     # 2) FALLBACK if Overpass returns nothing
     if len(candidates) == 0:
-        candidates = fallback_generate_empty_spaces(lat, lon, radius_m)
+        candidates = fallback_generate_empty_spaces(lat, lon, radius_m, deadline=deadline)
+
+    yield "candidates", {"candidates": candidates}
+
+    # 3) Reuse infra-independent metrics already computed for these grid cells
+    with span("base_lookup"):
+        bases = lookup_base_metrics(candidates, deadline)
+    missing = [c for c, b in zip(candidates, bases) if b is None]
+
+    # 4) One Overpass round-trip for every candidate's remaining metric layers
+    layers = fetch_metric_layers(candidates, infra, base_points=missing, deadline=deadline)
+
+    # (streamed: includes the time each event spends being written out)
+    with span("enrich"):
+        for i, cand in iter_enriched_candidates(candidates, infra, (lat, lon), layers=layers, bases=bases,
+                                                deadline=deadline):
+            yield "candidate", {"index": i, "candidate": cand}
+    enriched = list(candidates)
+
+    return rank_and_store(lat, lon, infra, radius_m, enriched, weights, variant, deadline)
+
 
-    enriched = []
-    for cand in candidates:
-        metrics = compute_candidate_metrics(cand, infra, origin=(lat, lon))
-        cand.update(metrics)
-        enriched.append(cand)
+def unranked_copy(candidates):
+    # Ranking writes score/rank and prefixes the reason, so rank copies of stored candidates
+    return [dict(c, raw_scores=dict(c["raw_scores"])) for c in candidates]
 
-    ranked_full = normalize_scores_and_rank(enriched, topk=None)
 
-    good = ranked_full[:3]
-    danger_sorted = sorted(enriched, key=lambda x: x.get("danger_score", 0.0), reverse=True)
-    danger = danger_sorted[:2]
+def rank_result(lat, lon, enriched, weights):
+    """The good/danger result for enriched candidates under a weight set"""
+    ranked_full = normalize_scores_and_rank(enriched, topk=None, weights=weights)
 
-    result = {
-        "good": good,
-        "danger": danger
+    return {
+        "origin": {"lat": lat, "lon": lon},
+        "good": ranked_full[:3],
+        "danger": danger_candidates(enriched, k=2)
     }
 
-    # ✅ SAVE TO CACHE (ADD THIS BLOCK)
-    set_cached_result(lat, lon, infra, radius_m, result)
-    print("💾 Result saved to cache")
+
+def rerank(stored, lat, lon, weights):
+    """Re-score stored enriched candidates under new weights (no upstream calls)"""
+    with span("rerank"):
+        result = rank_result(lat, lon, unranked_copy(stored), weights)
+    result["reranked"] = True
+    return result
+
+
+def rank_and_store(lat, lon, infra, radius_m, enriched, weights, variant, deadline=None):
+    """Rank enriched candidates into the good/danger result and cache it
+
+    The unranked candidates are stored too, so other weightings can be
+    re-ranked from them (/rerank).
+    """
+    snapshot = unranked_copy(enriched)
+    result = rank_result(lat, lon, enriched, weights)
+    result["completeness"] = completeness_summary(enriched)
+    result["complete"] = all(v == 1 for v in result["completeness"].values())
+
+    # ✅ SAVE TO CACHE (ADD THIS BLOCK) - partial results (missed deadline or failed lookups) are never cached
+    if result["complete"]:
+        set_cached_result(lat, lon, infra, radius_m, result, variant)
+        set_enriched(lat, lon, infra, radius_m, snapshot)
+        print("💾 Result saved to cache")
     # ✅ END OF CACHE SAVE
 
-    return jsonify(result)
+    return result
+
+
+def batch_recommendations(lat, lon, infras, radius_m, weights, variant, deadline=None, refresh=False):
+    """/recommend for several infra types sharing one candidate set
+
+    Candidates, the infra-independent metrics and the layer query (with every
+    type's amenities) are computed once; only the same-type distance and the
+    scoring run per type. Types already in the result cache are served from it
+    unless `refresh` is set (cache warming). A refresh also recomputes the
+    grid-cell metrics instead of reusing cells as old as the results it replaces.
+    """
+    results = {}
+    for infra in ([] if refresh else infras):
+        cached = get_cached_result(lat, lon, infra, radius_m, variant)
+        if cached:
+            results[infra] = cached
+            continue
+        stored = get_enriched(lat, lon, infra, radius_m) if variant else None
+        if stored:
+            results[infra] = rerank(stored, lat, lon, weights)
+    todo = [t for t in infras if t not in results]
+    if not todo:
+        return results
+    print(f"🔍 Computing fresh results for {', '.join(todo)}...")
+    prefetch_area(lat, lon, radius_m, deadline)
+
+    candidates = overpass_candidates_near(lat, lon, radius_m, todo[0], deadline=deadline)
+    if len(candidates) == 0:
+        candidates = fallback_generate_empty_spaces(lat, lon, radius_m, deadline=deadline)
+
+    with span("base_lookup"):
+        bases = [None] * len(candidates) if refresh else lookup_base_metrics(candidates, deadline)
+    missing = [c for c, b in zip(candidates, bases) if b is None]
+    layers = fetch_metric_layers(candidates, todo, base_points=missing, deadline=deadline)
+
+    with span("enrich"):
+        per_infra = enrich_candidates_multi(candidates, todo, (lat, lon), layers=layers, bases=bases,
+                                            deadline=deadline)
+    for infra in todo:
+        results[infra] = rank_and_store(lat, lon, infra, radius_m, per_infra[infra], weights, variant, deadline)
+    return results
+
+
+# Popular searches are recomputed in the background before they expire (see warming.py)
+start_warmer(batch_recommendations)
+
+
+def traced_events(route, events, timings=False):
+    """Trace a streamed pipeline; the "result" event carries the timings when asked"""
+    with trace(route) as t:
+        for event, payload in events:
+            if event == "result" and timings:
+                payload = dict(payload, timings=t.summary())
+            yield event, payload
+
+
+def with_timings(result, t, timings):
+    # Copy: cached results are shared between requests
+    return dict(result, timings=t.summary()) if timings else result
+
+
+def ndjson_stream(events, fields=None):
+    """One JSON object per line, serialized as soon as each event is produced"""
+    for event, payload in events:
+        yield json.dumps({"event": event, **project(payload, fields)}) + "\n"
+
+
+@app.route("/recommend")
+def recommend():
+    infra = request.args.get("infra", "hospital")
+    radius_m = int(request.args.get("radius", "2500"))
+    try:
+        weights = parse_weights(request.args.get("weights"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    variant = weights_signature(weights)
+    # ?deadline_ms=3000 → rank from whatever metrics arrive within the budget
+    deadline = Deadline.from_ms(request.args.get("deadline_ms"))
+    # ?timings=1 → per-stage/upstream time breakdown in the result
+    timings = request.args.get("timings") in ("1", "true")
+    # ?fields=map or ?fields=lat,lon,score → only those keys per candidate (see responses.py)
+    fields = parse_fields(request.args.get("fields"))
+
+    # ?stream=1 → NDJSON: candidates, then each enriched candidate, then the result
+    if request.args.get("stream") in ("1", "true", "ndjson"):
+        origin = resolve_origin(request.args, deadline)
+        if not origin:
+            return jsonify({"error": "Place not found"})
+        record_usage(origin[0], origin[1], infra, radius_m, variant)
+        events = recommend_events(origin[0], origin[1], infra, radius_m, weights, variant, deadline)
+        return Response(
+            stream_with_context(ndjson_stream(traced_events("recommend_stream", events, timings), fields)),
+            mimetype="application/x-ndjson",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+
+    with trace("recommend") as t:
+        origin = resolve_origin(request.args, deadline)
+        if not origin:
+            return jsonify({"error": "Place not found"})
+        lat, lon = origin
+        record_usage(lat, lon, infra, radius_m, variant)
+
+        result = None
+        for event, payload in recommend_events(lat, lon, infra, radius_m, weights, variant, deadline):
+            if event == "result":
+                result = payload
+
+        # Served from (or just written to) the cache: validators follow the entry,
+        # so a client revalidating an unchanged result gets a 304
+        written = None if timings or not result.get("complete", True) else \
+            cached_at(lat, lon, infra, radius_m, variant)
+        if written is None:
+            return respond(with_timings(result, t, timings))
+        key = get_cache_key(lat, lon, infra, radius_m, variant)
+        return respond(result, etag=f"{key}@{written}", last_modified=written)
+
+
+@app.route("/recommend/batch")
+def recommend_batch():
+    # ?infra=hospital,school,park → {"results": {infra: {"good": [...], "danger": [...]}}}
+    infras = list(dict.fromkeys(t.strip() for t in request.args.get("infra", "hospital").split(",") if t.strip()))
+    if not infras:
+        return jsonify({"error": "No infra types given"}), 400
+    radius_m = int(request.args.get("radius", "2500"))
+    try:
+        weights = parse_weights(request.args.get("weights"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    variant = weights_signature(weights)
+    deadline = Deadline.from_ms(request.args.get("deadline_ms"))
+    timings = request.args.get("timings") in ("1", "true")
+
+    with trace("recommend_batch") as t:
+        origin = resolve_origin(request.args, deadline)
+        if not origin:
+            return jsonify({"error": "Place not found"})
+        lat, lon = origin
+        for infra in infras:
+            record_usage(lat, lon, infra, radius_m, variant)
+
+        results = batch_recommendations(lat, lon, infras, radius_m, weights, variant, deadline)
+        return respond(with_timings({"results": results}, t, timings))
+
+
+@app.route("/rerank")
+def rerank_endpoint():
+    # Same params as /recommend plus weights=...; ranks the search's stored metrics
+    # in place of recomputing them. Pass lat/lon (the result's "origin") to skip geocoding.
+    infra = request.args.get("infra", "hospital")
+    radius_m = int(request.args.get("radius", "2500"))
+    try:
+        weights = parse_weights(request.args.get("weights"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    origin = resolve_origin(request.args)
+    if not origin:
+        return jsonify({"error": "Place not found"})
+    stored = get_enriched(origin[0], origin[1], infra, radius_m)
+    if not stored:
+        return jsonify({"error": "No stored metrics for this search; run /recommend first"}), 404
+    return respond(rerank(stored, origin[0], origin[1], weights))
+
+
+@app.route("/bulk-score", methods=["POST"])
+def bulk_score():
+    # Body: GeoJSON FeatureCollection or CSV of sites → NDJSON of scored, then ranked, sites
+    from bulk import parse_sites, bulk_events, open_checkpoint
+
+    infra = request.args.get("infra", "hospital")
+    try:
+        weights = parse_weights(request.args.get("weights"))
+        fmt = "csv" if "csv" in (request.content_type or "") else request.args.get("format")
+        sites = parse_sites(request.get_data(as_text=True), fmt)
+        # ?job=<id> resumes a named job; rejected if malformed or started with other inputs
+        checkpoint = open_checkpoint(sites, infra, weights, request.args.get("job"))
+    except (ValueError, TypeError, AttributeError) as e:
+        return jsonify({"error": f"Invalid input: {e}"}), 400
+
+    events = traced_events("bulk_score", bulk_events(sites, infra, weights, checkpoint=checkpoint))
+    return Response(
+        stream_with_context(ndjson_stream(events)),
+        mimetype="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.route("/heatmap")
+def heatmap():
+    from heatmap import (suitability_surface, encode_uint8, encode_png, HEATMAP_DEFAULT_SIZE, HEATMAP_MAX_SIZE,
+                         HEATMAP_MIN_RADIUS, HEATMAP_MAX_RADIUS, NODATA)
+
+    infra = request.args.get("infra", "hospital")
+    try:
+        radius_m = int(request.args.get("radius", "2500"))
+        size = min(HEATMAP_MAX_SIZE, max(2, int(request.args.get("size", HEATMAP_DEFAULT_SIZE))))
+        weights = parse_weights(request.args.get("weights"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if not HEATMAP_MIN_RADIUS <= radius_m <= HEATMAP_MAX_RADIUS:
+        return jsonify({"error": f"radius must be {HEATMAP_MIN_RADIUS}-{HEATMAP_MAX_RADIUS} m"}), 400
+
+    with trace("heatmap"):
+        origin = resolve_origin(request.args)
+        if not origin:
+            return jsonify({"error": "Place not found"})
+
+        grid, surface = suitability_surface(origin[0], origin[1], radius_m, infra, size=size, weights=weights)
+    if surface is None:
+        return jsonify({"error": "Map data unavailable"}), 502
+
+    if request.args.get("format") == "png":
+        return Response(encode_png(surface, size), mimetype="image/png")
+
+    return jsonify({
+        "infra": infra,
+        "width": size,
+        "height": size,
+        "bounds": grid.bounds(),  # [south, west, north, east]; row 0 is north
+        "encoding": "uint8-base64",
+        "nodata": NODATA,
+        "data": encode_uint8(surface)
+    })
 
 
 # ✅ ADD THIS NEW ENDPOINT (OPTIONAL - for manual cache clearing)
@@ -100,5 +447,37 @@ def clear_cache_endpoint():
 # ✅ END OF NEW ENDPOINT
 
 
+@app.route("/cache-stats")
+def cache_stats_endpoint():
+    from cache import metric_cache_stats
+    from utils_geo import overpass_flights, data_source
+    from data_sources import source_stats
+    from air_quality import aqi_stats
+    from scheduler import scheduler_stats
+    from warming import warming_stats
+    return jsonify({
+        "metric_cache": metric_cache_stats(),
+        "aqi": aqi_stats(),
+        "coalesced": {"recommend": recommend_flights.stats(), "overpass": overpass_flights.stats()},
+        "upstream_queues": scheduler_stats(),
+        "overpass_endpoints": source_stats(data_source),
+        "warming": warming_stats()
+    })
+
+
+@app.route("/metrics")
+def metrics_endpoint():
+    # Prometheus scrape target: stage/upstream/request histograms and cache counters
+    from metrics import render
+    return Response(render(), mimetype="text/plain; version=0.0.4")
+
+
+@app.route("/traces")
+def traces_endpoint():
+    # Summaries of the most recent requests, newest last
+    from metrics import recent_traces
+    return jsonify({"traces": recent_traces()})
+
+
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=5000, debug=True)
@@ -0,0 +1,535 @@
+# backend/bench.py
+"""Hermetic load benchmark: drive the real app against a local stand-in for every upstream.
+
+The stand-in server answers Nominatim, Photon, Overpass and OpenWeather on
+127.0.0.1. Requests found in a fixtures file (recorded from the real APIs
+with --record) are replayed byte for byte; anything else is answered from a
+seeded synthetic city (Overpass via local_osm over a generated extract), so
+the same seed always sees the same data. Per-upstream latency and failure
+rates are injected at the stand-in, never inside the app.
+
+    python bench.py --requests 200 --concurrency 8 --latency overpass=400,openweather=80 --out bench/HEAD.json
+    python bench.py --compare bench/HEAD.json ...      # print deltas against an earlier run
+    python bench.py --record fixtures.jsonl ...        # proxy to the real APIs and save fixtures
+    python bench.py --mirror 300 --mirror 2000:0.3 ... # extra Overpass stand-ins (latency ms[:503 rate])
+
+Every run starts in a fresh working directory, so all caches start cold.
+"""
+import argparse
+import hashlib
+import json
+import logging
+import math
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+from xml.sax.saxutils import quoteattr
+
+import requests
+
+try:
+    import resource
+except ImportError:  # Windows: peak RSS is not reported
+    resource = None
+
+SYNTH_CENTER = (12.9716, 77.5946)
+SYNTH_SPAN_DEG = 0.08     # synthetic city covers center ± this
+INFRA_TYPES = ["hospital", "school", "park"]
+
+# Where the stand-in forwards to in --record mode
+REAL_UPSTREAMS = {
+    "nominatim": "https://nominatim.openstreetmap.org",
+    "photon": "https://photon.komoot.io",
+    "overpass": "https://overpass-api.de",
+    "openweather": "https://api.openweathermap.org"
+}
+
+# Path prefix -> upstream, longest first
+ROUTES = [
+    ("/api/interpreter", "overpass"),
+    ("/data/2.5/air_pollution", "openweather"),
+    ("/search", "nominatim"),
+    ("/api", "photon")
+]
+
+# Request params that never affect the answer (keys, cache busters)
+IGNORED_PARAMS = {"appid"}
+
+PLACES = [
+    "Indiranagar", "Koramangala", "Jayanagar", "Malleshwaram", "Basavanagudi", "Whitefield",
+    "Hebbal", "Yelahanka", "Banashankari", "Rajajinagar", "Marathahalli", "Ulsoor",
+    "Frazer Town", "Sadashivanagar", "BTM Layout", "HSR Layout", "Electronic City", "Vijayanagar",
+    "Kengeri", "Yeshwanthpur", "Shivajinagar", "Domlur", "Bellandur", "Hennur"
+]
+
+
+# ------------------------------------------------
+# SYNTHETIC CITY
+# ------------------------------------------------
+
+def _jitter(rng, span=SYNTH_SPAN_DEG):
+    return SYNTH_CENTER[0] + rng.uniform(-span, span), SYNTH_CENTER[1] + rng.uniform(-span, span)
+
+
+def write_synthetic_extract(path, seed=7):
+    """A small OSM XML city around Bengaluru: buildings, roads, water, parks, open land, amenities"""
+    rng = random.Random(seed)
+    nodes, ways = [], []
+
+    def node(lat, lon, tags=None):
+        nodes.append((len(nodes) + 1, lat, lon, tags or {}))
+        return len(nodes)
+
+    def polygon(tags, size):
+        lat, lon = _jitter(rng)
+        w, h = rng.uniform(0.3, 1) * size, rng.uniform(0.3, 1) * size
+        refs = [node(lat, lon), node(lat + h, lon), node(lat + h, lon + w), node(lat, lon + w)]
+        ways.append((len(ways) + 1, refs + refs[:1], tags))
+
+    def line(tags, size):
+        lat, lon = _jitter(rng)
+        refs = [node(lat, lon)]
+        for _ in range(rng.randint(2, 5)):
+            lat, lon = lat + rng.uniform(-size, size), lon + rng.uniform(-size, size)
+            refs.append(node(lat, lon))
+        ways.append((len(ways) + 1, refs, tags))
+
+    for _ in range(4000):
+        polygon({"building": "yes"}, 0.0003)
+    for _ in range(3000):
+        node(*_jitter(rng), {"building": "house"})
+    for _ in range(900):
+        line({"highway": rng.choice(["residential", "tertiary", "secondary", "primary"])}, 0.004)
+    for _ in range(25):
+        polygon({"natural": "water"}, 0.008)
+    for _ in range(200):
+        polygon({"leisure": "park"}, 0.004)
+    for _ in range(300):
+        polygon({"landuse": rng.choice(["grass", "meadow", "brownfield", "greenfield"])}, 0.003)
+    for amenity in ("hospital", "clinic", "school", "college", "pharmacy"):
+        for _ in range(40):
+            node(*_jitter(rng), {"amenity": amenity, "name": f"{amenity.title()} {rng.randrange(1000)}"})
+
+    with open(path, "w", encoding="utf-8") as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n<osm version="0.6">\n')
+        for nid, lat, lon, tags in nodes:
+            f.write(f'<node id="{nid}" lat="{lat:.7f}" lon="{lon:.7f}"')
+            if tags:
+                f.write(">" + "".join(f"<tag k={quoteattr(k)} v={quoteattr(v)}/>" for k, v in tags.items()) + "</node>\n")
+            else:
+                f.write("/>\n")
+        for wid, refs, tags in ways:
+            f.write(f'<way id="{wid}">' + "".join(f'<nd ref="{r}"/>' for r in refs)
+                    + "".join(f"<tag k={quoteattr(k)} v={quoteattr(v)}/>" for k, v in tags.items()) + "</way>\n")
+        f.write("</osm>\n")
+    return path
+
+
+def synthetic_places(seed=7):
+    rng = random.Random(seed)
+    return [{"name": name, "lat": lat, "lon": lon} for name, (lat, lon) in
+            ((name, _jitter(rng, SYNTH_SPAN_DEG * 0.8)) for name in PLACES)]
+
+
+# ------------------------------------------------
+# STAND-IN UPSTREAMS
+# ------------------------------------------------
+
+def fixture_key(upstream, method, path, query, body):
+    """Stable key for one upstream request; ignored params and param order don't matter"""
+    params = sorted((k, v) for k, v in parse_qsl(query, keep_blank_values=True) if k not in IGNORED_PARAMS)
+    if body and method == "POST":
+        params += sorted(parse_qsl(body.decode("utf-8", "replace"), keep_blank_values=True))
+    raw = json.dumps([upstream, method, path, params])
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+class Upstreams:
+    """Replay/synthetic answers for the four upstreams, with injected latency and failures"""
+
+    def __init__(self, workdir, seed=7, fixtures=None, record=None, latency=None, failures=None, jitter=0.2):
+        from local_osm import LocalOsm, ingest
+
+        self.seed = seed
+        self.latency = latency or {}      # upstream -> mean seconds
+        self.failures = failures or {}    # upstream -> probability of a 503
+        self.jitter = jitter
+        self.record = record
+        self.fixtures = {}
+        self.calls = Counter()
+        self.failed = Counter()
+        self._lock = threading.Lock()
+        self._rng = random.Random(seed)
+        if fixtures and os.path.exists(fixtures):
+            with open(fixtures, encoding="utf-8") as f:
+                for line in f:
+                    rec = json.loads(line)
+                    self.fixtures[rec["key"]] = rec
+        self.places = synthetic_places(seed)
+        db = os.path.join(workdir, "bench_osm.db")
+        ingest(write_synthetic_extract(os.path.join(workdir, "bench_city.osm"), seed), db)
+        self.osm = LocalOsm(db)
+
+    def reset_counters(self):
+        with self._lock:
+            self.calls.clear()
+            self.failed.clear()
+
+    def _delay(self, upstream, mean=None):
+        mean = self.latency.get(upstream, 0) if mean is None else mean
+        if mean <= 0:
+            return 0
+        with self._lock:
+            return max(0.0, self._rng.gauss(mean, mean * self.jitter))
+
+    def _should_fail(self, upstream, p=None):
+        p = self.failures.get(upstream, 0) if p is None else p
+        with self._lock:
+            return p > 0 and self._rng.random() < p
+
+    def handle(self, upstream, method, path, query, body, mirror=None):
+        """(status, content_type, bytes) for one request
+
+        mirror=(n, latency_s, fail_p) serves Overpass as mirror n with its own
+        latency and failure rate, counted as "overpass#n".
+        """
+        label, latency, fail = upstream, None, None
+        if mirror is not None and upstream == "overpass":
+            label, latency, fail = f"overpass#{mirror[0]}", mirror[1], mirror[2]
+        with self._lock:
+            self.calls[label] += 1
+        time.sleep(self._delay(upstream, latency))
+        if self._should_fail(upstream, fail):
+            with self._lock:
+                self.failed[label] += 1
+            return 503, "text/plain", b"injected failure"
+
+        key = fixture_key(upstream, method, path, query, body)
+        rec = self.fixtures.get(key)
+        if rec is not None:
+            return rec["status"], rec["content_type"], rec["body"].encode("utf-8")
+        if self.record:
+            return self._record(key, upstream, method, path, query, body)
+        payload = self._synthetic(upstream, dict(parse_qsl(query)), dict(parse_qsl(body.decode("utf-8", "replace"))))
+        return 200, "application/json", json.dumps(payload).encode("utf-8")
+
+    def _record(self, key, upstream, method, path, query, body):
+        url = REAL_UPSTREAMS[upstream] + path + (f"?{query}" if query else "")
+        r = requests.request(method, url, data=body or None, timeout=90,
+                             headers={"User-Agent": "UrbanInfraBench/1.0",
+                                      "Content-Type": "application/x-www-form-urlencoded"})
+        rec = {"key": key, "upstream": upstream, "method": method, "path": path, "query": query,
+               "status": r.status_code, "content_type": r.headers.get("Content-Type", "application/json"),
+               "body": r.text}
+        with self._lock:
+            self.fixtures[key] = rec
+            with open(self.record, "a", encoding="utf-8") as f:
+                f.write(json.dumps(rec) + "\n")
+        return rec["status"], rec["content_type"], r.content
+
+    def _matching_places(self, q):
+        words = [w for w in q.lower().replace(",", " ").split() if w not in ("bengaluru", "bangalore", "karnataka")]
+        if not words:
+            return []
+        return [p for p in self.places if all(any(n.startswith(w) for n in p["name"].lower().split()) or w in p["name"].lower() for w in words)]
+
+    def _synthetic(self, upstream, params, form):
+        if upstream == "overpass":
+            return self.osm.query(form.get("data", params.get("data", "")))
+        if upstream == "openweather":
+            lat, lon = float(params.get("lat", 0)), float(params.get("lon", 0))
+            h = int(hashlib.md5(f"{lat:.3f},{lon:.3f}".encode()).hexdigest(), 16)
+            return {"list": [{"main": {"aqi": 1 + h % 5}, "components": {"pm2_5": round(5 + h % 900 / 10, 1)}}]}
+        places = self._matching_places(params.get("q", ""))[:int(params.get("limit", 10))]
+        if upstream == "nominatim":
+            return [{"display_name": f"{p['name']}, Bengaluru, Bangalore Urban, Karnataka, India",
+                     "lat": f"{p['lat']:.7f}", "lon": f"{p['lon']:.7f}",
+                     "address": {"city": "Bengaluru", "county": "Bangalore Urban", "state": "Karnataka"}}
+                    for p in places]
+        return {"type": "FeatureCollection", "features": [{
+            "type": "Feature",
+            "geometry": {"type": "Point", "coordinates": [p["lon"], p["lat"]]},
+            "properties": {"name": p["name"], "city": "Bengaluru", "state": "Karnataka", "country": "India"}
+        } for p in places]}
+
+
+def _handler(upstreams, mirror=None):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _serve(self, method):
+            parts = urlsplit(self.path)
+            upstream = next((name for prefix, name in ROUTES if parts.path.startswith(prefix)), None)
+            length = int(self.headers.get("Content-Length") or 0)
+            body = self.rfile.read(length) if length else b""
+            if upstream is None:
+                status, ctype, data = 404, "text/plain", b"unknown upstream"
+            else:
+                status, ctype, data = upstreams.handle(upstream, method, parts.path, parts.query, body, mirror)
+            self.send_response(status)
+            self.send_header("Content-Type", ctype)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            self._serve("GET")
+
+        def do_POST(self):
+            self._serve("POST")
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def start_server(server):
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}"
+
+
+# ------------------------------------------------
+# LOAD
+# ------------------------------------------------
+
+def recommend_paths(n, seed, repeat=0.0):
+    """Distinct origins around the city (a `repeat` share reuses earlier ones)"""
+    rng = random.Random(seed)
+    paths = []
+    for i in range(n):
+        if paths and rng.random() < repeat:
+            paths.append(rng.choice(paths))
+            continue
+        lat, lon = _jitter(rng, SYNTH_SPAN_DEG * 0.6)
+        paths.append(f"/recommend?lat={lat:.5f}&lon={lon:.5f}&infra={INFRA_TYPES[i % len(INFRA_TYPES)]}&radius=2500")
+    return paths
+
+
+def autocomplete_paths(n, seed):
+    rng = random.Random(seed)
+    return [f"/autocomplete?q={name[:rng.randint(3, len(name))].replace(' ', '+')}"
+            for name in (rng.choice(PLACES) for _ in range(n))]
+
+
+SCENARIOS = {
+    "recommend": lambda n, seed: recommend_paths(n, seed),
+    "recommend_repeat": lambda n, seed: recommend_paths(n, seed, repeat=0.6),
+    "autocomplete": autocomplete_paths
+}
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * p / 100
+    lo, hi = math.floor(k), math.ceil(k)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+def run_scenario(app_url, paths, concurrency, timeout=120):
+    """Fire `paths` at the app with `concurrency` clients; per-request (seconds, ok)"""
+    session = requests.Session()
+    session.mount("http://", requests.adapters.HTTPAdapter(pool_maxsize=concurrency))
+
+    def one(path):
+        t0 = time.perf_counter()
+        try:
+            ok = session.get(app_url + path, timeout=timeout).status_code == 200
+        except requests.RequestException:
+            ok = False
+        return time.perf_counter() - t0, ok
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, paths))
+    return results, time.perf_counter() - t0
+
+
+def summarize(results, wall_s, calls, failed):
+    latencies = [dt * 1000 for dt, _ in results]
+    n = len(results)
+    return {
+        "requests": n,
+        "errors": sum(1 for _, ok in results if not ok),
+        "wall_s": round(wall_s, 3),
+        "throughput_rps": round(n / wall_s, 2) if wall_s else None,
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50), 1),
+            "p95": round(percentile(latencies, 95), 1),
+            "p99": round(percentile(latencies, 99), 1),
+            "mean": round(statistics.fmean(latencies), 1),
+            "max": round(max(latencies), 1)
+        },
+        "upstream_calls": dict(calls),
+        "upstream_calls_per_request": {k: round(v / n, 3) for k, v in sorted(calls.items())},
+        "injected_failures": dict(failed)
+    }
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+# ------------------------------------------------
+# REPORT
+# ------------------------------------------------
+
+def print_report(report):
+    print(f"\n📊 Benchmark @ {report['commit'] or 'unknown'} (seed {report['config']['seed']}, "
+          f"concurrency {report['config']['concurrency']})")
+    for name, s in report["scenarios"].items():
+        lat = s["latency_ms"]
+        calls = ", ".join(f"{k} {v}" for k, v in s["upstream_calls_per_request"].items()) or "none"
+        print(f"  {name:<17} {s['requests']:>5} req  {s['errors']:>3} err  {s['throughput_rps']:>7} rps  "
+              f"p50 {lat['p50']:>8} ms  p95 {lat['p95']:>8} ms  p99 {lat['p99']:>8} ms")
+        print(f"  {'':<17} upstream calls/request: {calls}")
+    print(f"  peak RSS: {report['peak_rss_mb']} MB")
+
+
+def _delta(old, new):
+    if old in (None, 0) or new is None:
+        return "n/a"
+    return f"{(new - old) / old * 100:+.1f}%"
+
+
+def print_comparison(old, new):
+    print(f"\n🔁 {old.get('commit') or 'baseline'} → {new.get('commit') or 'current'}")
+    for name, s in new["scenarios"].items():
+        o = old.get("scenarios", {}).get(name)
+        if not o:
+            continue
+        print(f"  {name:<17} p50 {_delta(o['latency_ms']['p50'], s['latency_ms']['p50']):>8}  "
+              f"p95 {_delta(o['latency_ms']['p95'], s['latency_ms']['p95']):>8}  "
+              f"p99 {_delta(o['latency_ms']['p99'], s['latency_ms']['p99']):>8}  "
+              f"rps {_delta(o['throughput_rps'], s['throughput_rps']):>8}")
+        for up in sorted(set(o["upstream_calls_per_request"]) | set(s["upstream_calls_per_request"])):
+            a, b = o["upstream_calls_per_request"].get(up), s["upstream_calls_per_request"].get(up)
+            print(f"  {'':<17} {up} calls/request {a} → {b}")
+    print(f"  peak RSS {old.get('peak_rss_mb')} → {new.get('peak_rss_mb')} MB")
+
+
+# ------------------------------------------------
+# CLI
+# ------------------------------------------------
+
+def _per_upstream(spec, scale=1.0):
+    """"overpass=400,openweather=80" -> {"overpass": 0.4, ...} (scale converts ms to s)"""
+    out = {}
+    for part in (spec or "").split(","):
+        if "=" in part:
+            name, value = part.split("=", 1)
+            out[name.strip()] = float(value) * scale
+    return out
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Hermetic load benchmark against stand-in upstreams")
+    parser.add_argument("--scenario", default="recommend,recommend_repeat,autocomplete",
+                        help=f"comma list of {', '.join(SCENARIOS)}")
+    parser.add_argument("--requests", type=int, default=120, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency", default="overpass=300,nominatim=80,photon=60,openweather=60",
+                        help="mean injected latency in ms per upstream")
+    parser.add_argument("--jitter", type=float, default=0.2, help="latency std-dev as a fraction of the mean")
+    parser.add_argument("--fail", default="", help="injected 503 probability per upstream, e.g. overpass=0.05")
+    parser.add_argument("--mirror", action="append", default=[], metavar="LATENCY_MS[:FAIL]",
+                        help="extra Overpass endpoint stand-in (repeatable); the app gets them via OVERPASS_URLS")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--fixtures", help="JSONL of recorded upstream responses to replay")
+    parser.add_argument("--record", help="proxy unmatched requests to the real APIs and append them here")
+    parser.add_argument("--env", action="append", default=[], help="extra app setting KEY=VALUE (repeatable)")
+    parser.add_argument("--out", help="write the JSON report here")
+    parser.add_argument("--compare", help="earlier JSON report to diff against")
+    args = parser.parse_args(argv)
+    for attr in ("fixtures", "record", "out", "compare"):
+        if getattr(args, attr):
+            setattr(args, attr, os.path.abspath(getattr(args, attr)))
+
+    workdir = tempfile.mkdtemp(prefix="urbaninfra-bench-")
+    upstreams = Upstreams(workdir, seed=args.seed, fixtures=args.fixtures or args.record, record=args.record,
+                          latency=_per_upstream(args.latency, 0.001), failures=_per_upstream(args.fail),
+                          jitter=args.jitter)
+    stand_in = start_server(ThreadingHTTPServer(("127.0.0.1", 0), _handler(upstreams)))
+    overpass_urls = [f"{stand_in}/api/interpreter"]
+    for n, spec in enumerate(args.mirror, 1):
+        latency_ms, _, fail = spec.partition(":")
+        mirror = start_server(ThreadingHTTPServer(
+            ("127.0.0.1", 0), _handler(upstreams, (n, float(latency_ms) / 1000, float(fail or 0)))))
+        overpass_urls.append(f"{mirror}/api/interpreter")
+
+    # The app reads these at import time and keeps its caches in the cwd
+    os.environ.update({
+        "NOMINATIM_URL": stand_in,
+        "PHOTON_URL": stand_in,
+        "OVERPASS_URL": f"{stand_in}/api/interpreter",
+        "OVERPASS_URLS": ",".join(overpass_urls),
+        "OPENWEATHER_URL": stand_in,
+        "GAZETTEER_FILE": os.path.join(workdir, "gazetteer.json")
+    })
+    os.environ.update(dict(kv.split("=", 1) for kv in args.env))
+    backend_dir = os.path.dirname(os.path.abspath(__file__))
+    sys.path.insert(0, backend_dir)
+    os.chdir(workdir)
+
+    from werkzeug.serving import make_server
+    from app import app
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)   # no per-request access log
+    app_server = make_server("127.0.0.1", 0, app, threaded=True)
+    app_url = start_server(app_server)
+    print(f"🧪 Stand-in upstreams at {stand_in}, app at {app_url}, workdir {workdir}")
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": int(time.time()),
+        "config": {"requests": args.requests, "concurrency": args.concurrency, "seed": args.seed,
+                   "latency_ms": _per_upstream(args.latency), "jitter": args.jitter,
+                   "fail": _per_upstream(args.fail), "mirrors": args.mirror, "fixtures": len(upstreams.fixtures),
+                   "env": args.env},
+        "scenarios": {}
+    }
+    for name in (s.strip() for s in args.scenario.split(",") if s.strip()):
+        if name not in SCENARIOS:
+            parser.error(f"unknown scenario {name}")
+        upstreams.reset_counters()
+        results, wall_s = run_scenario(app_url, SCENARIOS[name](args.requests, args.seed), args.concurrency)
+        report["scenarios"][name] = summarize(results, wall_s, upstreams.calls, upstreams.failed)
+        print(f"  ✓ {name}")
+    report["peak_rss_mb"] = peak_rss_mb()
+
+    app_server.shutdown()
+    print_report(report)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            print_comparison(json.load(f), report)
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"✅ Report written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,311 @@
+# backend/bulk.py
+"""Bulk site scoring: rank a GeoJSON/CSV list of parcels with the /recommend criteria.
+
+Sites are grouped by ~2 km cell and scored a chunk at a time (one
+batched layer query per chunk) on a worker pool. Every finished chunk is
+appended to a checkpoint file, so an interrupted job resumes where it left off.
+Sites scored with imputed metrics (an upstream failed) are not checkpointed,
+so a resumed job retries them instead of keeping the stand-in values.
+
+    python bulk.py parcels.geojson --infra school --out ranked.csv
+"""
+import argparse
+import csv
+import hashlib
+import io
+import json
+import math
+import os
+import re
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from shapely.geometry import shape
+
+from scheduler import priority
+from scoring import parse_weights, weights_signature
+from utils_geo import enrich_candidates, fetch_metric_layers, lookup_base_metrics, normalize_scores_and_rank
+
+BULK_DIR = os.environ.get("BULK_JOB_DIR", "bulk_jobs")
+BULK_WORKERS = int(os.environ.get("BULK_WORKERS", "4"))
+BULK_CHUNK = 40          # sites per batched layer query
+CHUNK_CELL_DEG = 0.02    # ~2.2 km cells; a chunk's sites come from as few cells as possible
+BULK_MAX_SITES = 20000
+JOB_ID_RE = re.compile(r"^[\w-]{1,64}$")    # job ids name files under BULK_DIR
+
+LAT_COLUMNS = ("lat", "latitude", "y")
+LON_COLUMNS = ("lon", "lng", "long", "longitude", "x")
+ID_COLUMNS = ("id", "site_id", "parcel_id", "name")
+
+# Fields written per site to checkpoints and outputs
+SITE_FIELDS = ["pop", "dist_m", "dist_road_m", "near_lake", "lake_dist_m", "green_pct", "aqi", "pm25",
+               "dist_to_same_infra_m", "raw_scores", "imputed", "reason"]
+
+
+# ------------------------------------------------
+# INPUT
+# ------------------------------------------------
+
+def _pick(row, names):
+    for key in row:
+        if key and key.strip().lower() in names:
+            return row[key]
+    return None
+
+
+def parse_geojson(text):
+    """Sites from a FeatureCollection; non-point geometries use a representative point"""
+    data = json.loads(text)
+    features = data.get("features", []) if data.get("type") == "FeatureCollection" else [data]
+    sites = []
+    for i, feat in enumerate(features):
+        geom = feat.get("geometry")
+        if not geom:
+            continue
+        try:
+            pt = shape(geom)
+            if pt.geom_type != "Point":
+                pt = pt.representative_point()
+        except Exception as e:   # shapely raises GeometryTypeError, KeyError, ... on malformed input
+            raise ValueError(f"Feature {i}: invalid geometry ({e})") from e
+        props = feat.get("properties") or {}
+        site_id = feat.get("id", _pick(props, ID_COLUMNS))
+        sites.append({"id": str(site_id) if site_id is not None else str(i),
+                      "lat": pt.y, "lon": pt.x, "tags": props})
+    return sites
+
+
+def parse_csv(text):
+    """Sites from a CSV with lat/lon (or latitude/longitude, y/x) columns"""
+    sites = []
+    for i, row in enumerate(csv.DictReader(io.StringIO(text))):
+        lat, lon = _pick(row, LAT_COLUMNS), _pick(row, LON_COLUMNS)
+        if lat in (None, "") or lon in (None, ""):
+            raise ValueError(f"Row {i + 1}: missing lat/lon")
+        site_id = _pick(row, ID_COLUMNS)
+        sites.append({"id": site_id or str(i), "lat": float(lat), "lon": float(lon), "tags": dict(row)})
+    return sites
+
+
+def parse_sites(text, fmt=None):
+    """GeoJSON or CSV text -> [{"id", "lat", "lon", "tags"}]; fmt is sniffed when None"""
+    if fmt is None:
+        fmt = "geojson" if text.lstrip().startswith("{") else "csv"
+    sites = parse_geojson(text) if fmt in ("geojson", "json") else parse_csv(text)
+    if not sites:
+        raise ValueError("No sites found")
+    if len(sites) > BULK_MAX_SITES:
+        raise ValueError(f"Too many sites ({len(sites)} > {BULK_MAX_SITES})")
+    return sites
+
+
+# ------------------------------------------------
+# CHECKPOINTS
+# ------------------------------------------------
+
+def inputs_digest(sites, infra, weights):
+    """Hash of sites + infra + weights; a checkpoint only resumes the inputs it was started with"""
+    h = hashlib.md5(f"{infra}|{weights_signature(weights)}".encode())
+    for s in sites:
+        h.update(f"|{s['id']}:{s['lat']:.6f},{s['lon']:.6f}".encode())
+    return h.hexdigest()
+
+
+def job_id_for(sites, infra, weights):
+    """Stable id for the same sites + infra + weights, so re-submitting resumes"""
+    return inputs_digest(sites, infra, weights)[:16]
+
+
+class Checkpoint:
+    """Append-only JSONL of scored sites: an {"inputs"} header line, then one line per site keyed by input index"""
+
+    def __init__(self, job_id, inputs):
+        if not JOB_ID_RE.match(job_id or ""):
+            raise ValueError(f"Invalid job id {job_id!r} (letters, digits, '_' and '-', at most 64)")
+        self.job_id = job_id
+        self.inputs = inputs
+        self.path = os.path.join(BULK_DIR, f"{job_id}.jsonl")
+        self.done = {}
+        self._lock = threading.Lock()
+
+    def load(self):
+        """Finished sites by index; ValueError when the file belongs to other inputs"""
+        done, header = {}, None
+        if not os.path.exists(self.path):
+            return done
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    continue  # torn last line from an interrupted write
+                if "inputs" in rec:
+                    header = rec["inputs"]
+                    continue
+                done[rec["index"]] = rec["metrics"]
+        if header != self.inputs and (header is not None or done):
+            raise ValueError(f"Job {self.job_id} was started with different sites, infra or weights")
+        return done
+
+    def append(self, records):
+        with self._lock:
+            os.makedirs(BULK_DIR, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                if f.tell() == 0:
+                    f.write(json.dumps({"inputs": self.inputs}) + "\n")
+                for index, metrics in records:
+                    f.write(json.dumps({"index": index, "metrics": metrics}) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+
+def open_checkpoint(sites, infra, weights, job_id=None):
+    """The job's checkpoint with its finished sites loaded
+
+    Raises ValueError for a malformed job id or one started with other inputs,
+    so callers can reject the request before scoring anything.
+    """
+    inputs = inputs_digest(sites, infra, weights)
+    checkpoint = Checkpoint(job_id or inputs[:16], inputs)
+    checkpoint.done = {i: m for i, m in checkpoint.load().items()
+                       if 0 <= i < len(sites) and not m.get("imputed")}
+    return checkpoint
+
+
+# ------------------------------------------------
+# SCORING
+# ------------------------------------------------
+
+def _cell_of(site):
+    return (math.floor(site["lat"] / CHUNK_CELL_DEG), math.floor(site["lon"] / CHUNK_CELL_DEG))
+
+
+def spatial_chunks(indices, sites, size=BULK_CHUNK):
+    """Chunks of nearby sites so each layer query covers a small area"""
+    ordered = sorted(indices, key=lambda i: (_cell_of(sites[i]), i))
+    return [ordered[k:k + size] for k in range(0, len(ordered), size)]
+
+
+def score_chunk(sites, chunk, infra, origin):
+    """compute_candidate_metrics for one chunk with a single batched layer query
+
+    Upstream calls run at batch priority, behind interactive traffic.
+    """
+    cands = [dict(sites[i]) for i in chunk]
+    with priority("batch"):
+        bases = lookup_base_metrics(cands)
+        missing = [c for c, b in zip(cands, bases) if b is None]
+        layers = fetch_metric_layers(cands, infra, base_points=missing)
+        enrich_candidates(cands, infra, origin, layers=layers, bases=bases)
+    return [(i, {k: c[k] for k in SITE_FIELDS}) for i, c in zip(chunk, cands)]
+
+
+def _score_and_checkpoint(checkpoint, sites, chunk, infra, origin):
+    # Checkpointed by the worker, so chunks still running when the consumer goes away are kept.
+    # Imputed sites stay out: a resumed job should retry them, not inherit stand-in values.
+    records = score_chunk(sites, chunk, infra, origin)
+    checkpoint.append([(i, m) for i, m in records if not m["imputed"]])
+    return records
+
+
+def bulk_events(sites, infra, weights=None, job_id=None, workers=BULK_WORKERS, checkpoint=None):
+    """Score and rank sites, yielding ("job"|"site"|"ranked"|"done", payload)
+
+    "site" events stream in as chunks finish (checkpointed sites first);
+    "ranked" events follow in rank order once every site is scored.
+    Closing the generator early cancels the chunks not yet started.
+    """
+    weights = weights or parse_weights(None)
+    checkpoint = checkpoint or open_checkpoint(sites, infra, weights, job_id)
+    job_id = checkpoint.job_id
+    done = dict(checkpoint.done)
+    origin = (sum(s["lat"] for s in sites) / len(sites), sum(s["lon"] for s in sites) / len(sites))
+
+    yield "job", {"job": job_id, "sites": len(sites), "resumed": len(done)}
+    for i, metrics in sorted(done.items()):
+        yield "site", {"index": i, "id": sites[i]["id"], **metrics}
+
+    todo = [i for i in range(len(sites)) if i not in done]
+    pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bulk")
+    try:
+        futures = [pool.submit(_score_and_checkpoint, checkpoint, sites, chunk, infra, origin)
+                   for chunk in spatial_chunks(todo, sites)]
+        for fut in as_completed(futures):
+            for i, metrics in fut.result():
+                done[i] = metrics
+                yield "site", {"index": i, "id": sites[i]["id"], **metrics}
+    finally:
+        # Client gone or a chunk failed: don't keep scoring queued chunks nobody will read
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    scored = [{"index": i, "id": sites[i]["id"], "lat": sites[i]["lat"], "lon": sites[i]["lon"],
+               **done[i], "raw_scores": dict(done[i]["raw_scores"])} for i in range(len(sites))]
+    for cand in normalize_scores_and_rank(scored, topk=None, weights=weights):
+        yield "ranked", cand
+    yield "done", {"job": job_id, "sites": len(sites)}
+
+
+# ------------------------------------------------
+# CLI
+# ------------------------------------------------
+
+CSV_OUT_FIELDS = ["rank", "id", "lat", "lon", "score"] + [f for f in SITE_FIELDS if f not in ("raw_scores", "imputed", "reason")] + ["reason"]
+
+
+def write_output(ranked, path):
+    """Ranked sites as CSV, GeoJSON or NDJSON depending on the file extension"""
+    ext = os.path.splitext(path)[1].lower()
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        if ext == ".csv":
+            w = csv.DictWriter(f, fieldnames=CSV_OUT_FIELDS, extrasaction="ignore")
+            w.writeheader()
+            w.writerows(ranked)
+        elif ext in (".geojson", ".json"):
+            json.dump({"type": "FeatureCollection", "features": [{
+                "type": "Feature",
+                "id": c["id"],
+                "geometry": {"type": "Point", "coordinates": [c["lon"], c["lat"]]},
+                "properties": {k: v for k, v in c.items() if k not in ("lat", "lon")}
+            } for c in ranked]}, f)
+        else:
+            for c in ranked:
+                f.write(json.dumps(c) + "\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Score and rank candidate sites from a GeoJSON or CSV file")
+    parser.add_argument("input", help="GeoJSON FeatureCollection or CSV with lat/lon columns")
+    parser.add_argument("--infra", default="hospital")
+    parser.add_argument("--weights", help="profile name or key:value,... (see scoring.py)")
+    parser.add_argument("--out", default="ranked.csv", help=".csv, .geojson or .ndjson")
+    parser.add_argument("--job", help="job id to resume (default: derived from the input)")
+    parser.add_argument("--workers", type=int, default=BULK_WORKERS)
+    args = parser.parse_args(argv)
+
+    with open(args.input, encoding="utf-8") as f:
+        sites = parse_sites(f.read(), "csv" if args.input.lower().endswith(".csv") else None)
+    weights = parse_weights(args.weights)
+
+    try:
+        checkpoint = open_checkpoint(sites, args.infra, weights, args.job)
+    except ValueError as e:
+        parser.error(str(e))
+
+    ranked = []
+    scored = 0
+    for event, payload in bulk_events(sites, args.infra, weights, workers=args.workers, checkpoint=checkpoint):
+        if event == "job":
+            print(f"📋 Job {payload['job']}: {payload['sites']} sites, {payload['resumed']} from checkpoint")
+        elif event == "site":
+            scored += 1
+            if scored % 100 == 0 or scored == len(sites):
+                print(f"   scored {scored}/{len(sites)}", file=sys.stderr)
+        elif event == "ranked":
+            ranked.append(payload)
+    write_output(ranked, args.out)
+    print(f"✅ Wrote {len(ranked)} ranked sites to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
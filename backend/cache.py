@@ -1,88 +1,603 @@
+import atexit
 import json
+import math
 import os
+import sqlite3
+import threading
 import time
+from collections import OrderedDict
 from hashlib import md5
 
-CACHE_FILE = "search_cache.json"
+from metrics import count_cache, timed
+
+CACHE_DB = "search_cache.db"
+LEGACY_CACHE_FILE = "search_cache.json"
 CACHE_DURATION = 86400  # 24 hours in seconds
+CACHE_MAX_ENTRIES = 5000  # rows kept on disk before the oldest are evicted
+LRU_SIZE = 256  # results kept in-process in front of SQLite
+EXPIRE_BATCH = 50  # expired rows removed per write
+METRIC_CELL_M = 50  # grid cell size (m) for infra-independent metric memoization
+METRIC_CACHE_DURATION = CACHE_DURATION
+USAGE_HALF_LIFE = 3 * 86400  # popularity of a search halves every 3 days without requests
+USAGE_MAX_ROWS = 5000  # least recently requested searches dropped beyond this
+USAGE_FLUSH_S = 30  # request counts are buffered in-process and written at most this often
+LRU_SYNC_S = 1.0  # how often a worker checks SQLite for other workers' clears and rewrites
+
+_local = threading.local()
+_lru = OrderedDict()
+_lru_lock = threading.Lock()
+_lru_generation = None   # clear_cache generation the LRU contents belong to
+_lru_synced = time.time()   # wall time of the last _sync_lru
+_writes = 0
+_usage_writes = 0
+_usage_pending = {}      # key -> [lat, lon, infra, radius, variant, count, last_seen] not yet written
+_usage_flushed = time.time()
+_usage_lock = threading.Lock()
+_metric_stats = {"hits": 0, "misses": 0, "expired": 0, "stores": 0}
+_stats_lock = threading.Lock()
+
+
+def _connect():
+    """One SQLite connection per thread; WAL lets workers read while one writes"""
+    conn = getattr(_local, "conn", None)
+    if conn is not None:
+        return conn
+    conn = sqlite3.connect(CACHE_DB, timeout=10)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS entries (
+            key TEXT PRIMARY KEY,
+            timestamp REAL NOT NULL,
+            lat REAL,
+            lon REAL,
+            infra TEXT,
+            radius INTEGER,
+            result TEXT NOT NULL,
+            readable_location TEXT
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS entries_timestamp ON entries(timestamp)")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS cell_metrics (
+            cell TEXT PRIMARY KEY,
+            timestamp REAL NOT NULL,
+            metrics TEXT NOT NULL
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS cell_metrics_timestamp ON cell_metrics(timestamp)")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS aqi_cells (
+            cell TEXT PRIMARY KEY,
+            expires REAL NOT NULL,
+            reading TEXT NOT NULL
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS aqi_cells_expires ON aqi_cells(expires)")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS usage (
+            key TEXT PRIMARY KEY,
+            lat REAL NOT NULL,
+            lon REAL NOT NULL,
+            infra TEXT NOT NULL,
+            radius INTEGER NOT NULL,
+            variant TEXT NOT NULL,
+            score REAL NOT NULL,
+            last_seen REAL NOT NULL
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS enriched (
+            key TEXT PRIMARY KEY,
+            timestamp REAL NOT NULL,
+            candidates TEXT NOT NULL
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS enriched_timestamp ON enriched(timestamp)")
+    conn.execute("CREATE TABLE IF NOT EXISTS warm_lease (id INTEGER PRIMARY KEY CHECK (id = 1), started REAL NOT NULL)")
+    conn.execute("CREATE TABLE IF NOT EXISTS generation (id INTEGER PRIMARY KEY CHECK (id = 1), value INTEGER NOT NULL)")
+    _local.conn = conn
+    _import_legacy_cache(conn)
+    return conn
 
-def load_cache():
-    """Load cache from file"""
-    if not os.path.exists(CACHE_FILE):
-        return {}
+
+def _import_legacy_cache(conn):
+    """One-off move of the old whole-file JSON cache into SQLite"""
+    if not os.path.exists(LEGACY_CACHE_FILE):
+        return
     try:
-        with open(CACHE_FILE, 'r') as f:
-            return json.load(f)
-    except:
-        return {}
+        with open(LEGACY_CACHE_FILE, 'r') as f:
+            legacy = json.load(f)
+        with conn:
+            for key, v in legacy.items():
+                conn.execute(
+                    "INSERT OR IGNORE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (key, v.get("timestamp", 0), v.get("lat"), v.get("lon"), v.get("infra"),
+                     v.get("radius"), json.dumps(v.get("result"), separators=(",", ":")),
+                     v.get("readable_location"))
+                )
+        os.replace(LEGACY_CACHE_FILE, LEGACY_CACHE_FILE + ".migrated")
+        print(f"📦 Imported {len(legacy)} entries from {LEGACY_CACHE_FILE}")
+    except Exception as e:
+        print(f"Legacy cache import error: {e}")
+
 
-def save_cache(cache):
-    """Save cache to file"""
+# (table, key column) of the LRU-fronted tables whose rows carry a write timestamp
+_SYNCED_TABLES = (("entries", "key"), ("cell_metrics", "cell"), ("enriched", "key"))
+
+
+def _sync_lru():
+    """Bring this worker's LRU in line with what other workers did in SQLite
+
+    Runs at most once per LRU_SYNC_S, so an LRU hit normally costs no query.
+    A clear_cache anywhere (new generation) empties the LRU; results, cells
+    and enriched rows rewritten since the last sync are dropped from it.
+    AQI readings are exempt from the rewrite check: whichever worker stored
+    one, it is the same provider update until it expires.
+    """
+    global _lru_generation, _lru_synced
+    now = time.time()
+    with _lru_lock:
+        if now - _lru_synced < LRU_SYNC_S:
+            return
+        since, _lru_synced = _lru_synced, now
     try:
-        with open(CACHE_FILE, 'w') as f:
-            json.dump(cache, f, indent=2)
+        conn = _connect()
+        row = conn.execute("SELECT value FROM generation WHERE id = 1").fetchone()
+        rewritten = []
+        # Overlap one interval: a row's timestamp is taken just before its commit
+        for table, column in _SYNCED_TABLES:
+            rewritten += conn.execute(f"SELECT {column}, timestamp FROM {table} WHERE timestamp >= ?",
+                                      (since - LRU_SYNC_S,)).fetchall()
     except Exception as e:
-        print(f"Cache save error: {e}")
+        print(f"Cache sync error: {e}")
+        return
+    generation = row[0] if row else 0
+    with _lru_lock:
+        if generation != _lru_generation:
+            _lru.clear()
+            _lru_generation = generation
+            return
+        for key, timestamp in rewritten:
+            entry = _lru.get(key)
+            if entry is not None and entry[0] != timestamp:
+                del _lru[key]
+
+
+def _lru_get(key):
+    _sync_lru()
+    with _lru_lock:
+        entry = _lru.get(key)
+        if entry is None:
+            return None
+        _lru.move_to_end(key)
+        return entry
 
-def get_cache_key(lat, lon, infra, radius):
-    """Generate unique cache key"""
+
+def _lru_put(key, timestamp, result):
+    with _lru_lock:
+        _lru[key] = (timestamp, result)
+        _lru.move_to_end(key)
+        while len(_lru) > LRU_SIZE:
+            _lru.popitem(last=False)
+
+
+def _lru_drop(key=None):
+    with _lru_lock:
+        if key is None:
+            _lru.clear()
+        else:
+            _lru.pop(key, None)
+
+
+def _expire_some(conn, now):
+    """Incremental TTL expiry: a small indexed batch per write instead of a full scan"""
+    conn.execute(
+        "DELETE FROM entries WHERE key IN "
+        "(SELECT key FROM entries WHERE timestamp < ? ORDER BY timestamp LIMIT ?)",
+        (now - CACHE_DURATION, EXPIRE_BATCH)
+    )
+
+
+def _evict_over_limit(conn):
+    """Drop the oldest rows once the table grows past CACHE_MAX_ENTRIES"""
+    conn.execute(
+        "DELETE FROM entries WHERE timestamp <= "
+        "(SELECT timestamp FROM entries ORDER BY timestamp DESC LIMIT 1 OFFSET ?)",
+        (CACHE_MAX_ENTRIES,)
+    )
+
+
+def get_cache_key(lat, lon, infra, radius, variant=""):
+    """Generate unique cache key (variant distinguishes e.g. custom weights)"""
     key_str = f"{lat:.5f}_{lon:.5f}_{infra}_{radius}"
+    if variant:
+        key_str += f"_{variant}"
     return md5(key_str.encode()).hexdigest()
 
-def get_cached_result(lat, lon, infra, radius):
+
+@timed("cache.read")
+def get_cached_result(lat, lon, infra, radius, variant=""):
     """Check if result exists in cache"""
-    cache = load_cache()
-    key = get_cache_key(lat, lon, infra, radius)
-    
-    if key in cache:
-        entry = cache[key]
+    key = get_cache_key(lat, lon, infra, radius, variant)
+    now = time.time()
+
+    entry = _lru_get(key)
+    if entry is None:
+        try:
+            row = _connect().execute(
+                "SELECT timestamp, result FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+        except Exception as e:
+            print(f"Cache read error: {e}")
+            row = None
+        if row is not None:
+            entry = (row[0], json.loads(row[1]))
+            _lru_put(key, *entry)
+
+    if entry is not None:
         # Check if cache is still valid (not expired)
-        if time.time() - entry.get("timestamp", 0) < CACHE_DURATION:
+        if now - entry[0] < CACHE_DURATION:
             print(f"✅ Cache HIT for {key}")
-            return entry.get("result")
-        else:
-            print(f"⏰ Cache EXPIRED for {key}")
-    
+            count_cache("result", "hit")
+            return entry[1]
+        _lru_drop(key)
+        print(f"⏰ Cache EXPIRED for {key}")
+        count_cache("result", "expired")
+        return None
+
     print(f"❌ Cache MISS for {key}")
+    count_cache("result", "miss")
     return None
 
-def set_cached_result(lat, lon, infra, radius, result):
+
+def _stored_timestamp(key):
+    """Write time of the result row in SQLite (None if absent), as every worker sees it"""
+    row = _connect().execute("SELECT timestamp FROM entries WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else None
+
+
+def cached_at(lat, lon, infra, radius, variant=""):
+    """When the still-valid cached result for this search was written (None if there isn't one)
+
+    Read from SQLite rather than this worker's LRU, so every worker derives the same validators.
+    """
+    key = get_cache_key(lat, lon, infra, radius, variant)
+    try:
+        timestamp = _stored_timestamp(key)
+    except Exception as e:
+        print(f"Cache read error: {e}")
+        return None
+    if timestamp is None or time.time() - timestamp >= CACHE_DURATION:
+        return None
+    return timestamp
+
+
+@timed("cache.write")
+def set_cached_result(lat, lon, infra, radius, result, variant=""):
     """Save result to cache"""
-    cache = load_cache()
-    key = get_cache_key(lat, lon, infra, radius)
-    
-    cache[key] = {
-        "timestamp": time.time(),
-        "lat": lat,
-        "lon": lon,
-        "infra": infra,
-        "radius": radius,
-        "result": result,
-        "readable_location": f"{lat:.5f}, {lon:.5f}"
-    }
-    
-    save_cache(cache)
+    global _writes
+    key = get_cache_key(lat, lon, infra, radius, variant)
+    now = time.time()
+
+    try:
+        conn = _connect()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, now, lat, lon, infra, radius,
+                 json.dumps(result, separators=(",", ":")), f"{lat:.5f}, {lon:.5f}")
+            )
+            _expire_some(conn, now)
+            _writes += 1
+            if _writes % 32 == 0:
+                _evict_over_limit(conn)
+    except Exception as e:
+        print(f"Cache save error: {e}")
+        return
+
+    _lru_put(key, now, result)
     print(f"💾 Cached result for {key}")
 
+
 def clear_cache():
     """Clear all cached data"""
-    if os.path.exists(CACHE_FILE):
-        os.remove(CACHE_FILE)
+    _lru_drop()
+    with _usage_lock:
+        _usage_pending.clear()
+    try:
+        with _connect() as conn:
+            conn.execute("DELETE FROM entries")
+            conn.execute("DELETE FROM cell_metrics")
+            conn.execute("DELETE FROM aqi_cells")
+            conn.execute("DELETE FROM usage")
+            conn.execute("DELETE FROM enriched")
+            # Other workers drop their in-process LRU when they see the new generation
+            conn.execute("INSERT INTO generation VALUES (1, 1) ON CONFLICT(id) DO UPDATE SET value = value + 1")
         print("🗑️ Cache cleared")
+    except Exception as e:
+        print(f"Cache clear error: {e}")
+
 
 def clear_expired_cache():
-    """Remove expired entries from cache"""
-    cache = load_cache()
-    current_time = time.time()
-    
-    cleaned_cache = {
-        k: v for k, v in cache.items()
-        if current_time - v.get("timestamp", 0) < CACHE_DURATION
-    }
-    
-    removed = len(cache) - len(cleaned_cache)
+    """Remove all expired entries from cache (indexed delete, no full parse)"""
+    try:
+        with _connect() as conn:
+            removed = conn.execute(
+                "DELETE FROM entries WHERE timestamp < ?", (time.time() - CACHE_DURATION,)
+            ).rowcount
+            removed += conn.execute(
+                "DELETE FROM cell_metrics WHERE timestamp < ?", (time.time() - METRIC_CACHE_DURATION,)
+            ).rowcount
+            removed += conn.execute(
+                "DELETE FROM enriched WHERE timestamp < ?", (time.time() - CACHE_DURATION,)
+            ).rowcount
+            removed += conn.execute("DELETE FROM aqi_cells WHERE expires < ?", (time.time(),)).rowcount
+    except Exception as e:
+        print(f"Cache expiry error: {e}")
+        return 0
+
     if removed > 0:
-        save_cache(cleaned_cache)
         print(f"🧹 Removed {removed} expired entries")
-    
     return removed
+
+
+# ------------------------------------------------
+# GRID-CELL METRIC CACHE (shared across infra types)
+# ------------------------------------------------
+
+def metric_cell_key(lat, lon, cell_m=None):
+    """Snap a point to a ~cell_m x cell_m grid cell"""
+    cell_m = cell_m or METRIC_CELL_M
+    dlat = cell_m / 111195.0
+    row = math.floor(lat / dlat)
+    dlon = dlat / math.cos(math.radians((row + 0.5) * dlat))
+    col = math.floor(lon / dlon)
+    return f"cell:{cell_m}:{row}:{col}"
+
+
+def _count(stat):
+    with _stats_lock:
+        _metric_stats[stat] += 1
+    if stat != "stores":
+        count_cache("cell_metrics", {"hits": "hit", "misses": "miss"}.get(stat, stat))
+
+
+def get_cell_metrics(lat, lon):
+    """Infra-independent metrics memoized for the point's grid cell"""
+    cell = metric_cell_key(lat, lon)
+    now = time.time()
+
+    entry = _lru_get(cell)
+    if entry is None:
+        try:
+            row = _connect().execute(
+                "SELECT timestamp, metrics FROM cell_metrics WHERE cell = ?", (cell,)
+            ).fetchone()
+        except Exception as e:
+            print(f"Metric cache read error: {e}")
+            row = None
+        if row is not None:
+            entry = (row[0], json.loads(row[1]))
+            _lru_put(cell, *entry)
+
+    if entry is None:
+        _count("misses")
+        return None
+    if now - entry[0] >= METRIC_CACHE_DURATION:
+        _lru_drop(cell)
+        _count("expired")
+        return None
+    _count("hits")
+    return entry[1]
+
+
+def set_cell_metrics(lat, lon, metrics):
+    """Store infra-independent metrics for the point's grid cell"""
+    cell = metric_cell_key(lat, lon)
+    now = time.time()
+    try:
+        with _connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO cell_metrics VALUES (?, ?, ?)",
+                (cell, now, json.dumps(metrics, separators=(",", ":")))
+            )
+            conn.execute(
+                "DELETE FROM cell_metrics WHERE cell IN "
+                "(SELECT cell FROM cell_metrics WHERE timestamp < ? ORDER BY timestamp LIMIT ?)",
+                (now - METRIC_CACHE_DURATION, EXPIRE_BATCH)
+            )
+    except Exception as e:
+        print(f"Metric cache save error: {e}")
+        return
+    _lru_put(cell, now, metrics)
+    _count("stores")
+
+
+def metric_cache_stats():
+    """Hit-rate counters for tuning METRIC_CELL_M"""
+    with _stats_lock:
+        stats = dict(_metric_stats)
+    lookups = stats["hits"] + stats["misses"] + stats["expired"]
+    stats["lookups"] = lookups
+    stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+    stats["cell_m"] = METRIC_CELL_M
+    return stats
+
+
+def get_aqi_reading(cell):
+    """Cached air-quality reading for an AQI grid cell, None if absent or past its expiry"""
+    key = f"aqi:{cell}"
+    entry = _lru_get(key)
+    if entry is None:
+        try:
+            row = _connect().execute("SELECT expires, reading FROM aqi_cells WHERE cell = ?", (cell,)).fetchone()
+        except Exception as e:
+            print(f"AQI cache read error: {e}")
+            row = None
+        if row is None:
+            count_cache("aqi", "miss")
+            return None
+        entry = (row[0], json.loads(row[1]))
+        _lru_put(key, *entry)
+    if time.time() >= entry[0]:
+        _lru_drop(key)
+        count_cache("aqi", "expired")
+        return None
+    count_cache("aqi", "hit")
+    return entry[1]
+
+
+def set_aqi_reading(cell, expires, reading):
+    """Store a reading until `expires` (epoch seconds); a small batch of expired cells is pruned"""
+    try:
+        with _connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO aqi_cells VALUES (?, ?, ?)",
+                         (cell, expires, json.dumps(reading, separators=(",", ":"))))
+            conn.execute(
+                "DELETE FROM aqi_cells WHERE cell IN "
+                "(SELECT cell FROM aqi_cells WHERE expires < ? ORDER BY expires LIMIT ?)",
+                (time.time(), EXPIRE_BATCH)
+            )
+    except Exception as e:
+        print(f"AQI cache save error: {e}")
+        return
+    _lru_put(f"aqi:{cell}", expires, reading)
+
+
+# ------------------------------------------------
+# ENRICHED CANDIDATES (weights-independent, for /rerank)
+# ------------------------------------------------
+
+def get_enriched(lat, lon, infra, radius):
+    """Unranked enriched candidates of a search (raw metrics + raw_scores), None if absent/expired
+
+    Shared with other requests: copy before ranking (ranking mutates candidates).
+    """
+    key = "enriched:" + get_cache_key(lat, lon, infra, radius)
+    entry = _lru_get(key)
+    if entry is None:
+        try:
+            row = _connect().execute(
+                "SELECT timestamp, candidates FROM enriched WHERE key = ?", (key,)
+            ).fetchone()
+        except Exception as e:
+            print(f"Enriched cache read error: {e}")
+            row = None
+        if row is None:
+            count_cache("enriched", "miss")
+            return None
+        entry = (row[0], json.loads(row[1]))
+        _lru_put(key, *entry)
+    if time.time() - entry[0] >= CACHE_DURATION:
+        _lru_drop(key)
+        count_cache("enriched", "expired")
+        return None
+    count_cache("enriched", "hit")
+    return entry[1]
+
+
+def set_enriched(lat, lon, infra, radius, candidates):
+    """Store a search's enriched candidates before ranking (same lifetime as results)"""
+    key = "enriched:" + get_cache_key(lat, lon, infra, radius)
+    now = time.time()
+    try:
+        with _connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO enriched VALUES (?, ?, ?)",
+                         (key, now, json.dumps(candidates, separators=(",", ":"))))
+            conn.execute(
+                "DELETE FROM enriched WHERE key IN "
+                "(SELECT key FROM enriched WHERE timestamp < ? ORDER BY timestamp LIMIT ?)",
+                (now - CACHE_DURATION, EXPIRE_BATCH)
+            )
+    except Exception as e:
+        print(f"Enriched cache save error: {e}")
+        return
+    _lru_put(key, now, candidates)
+
+
+# ------------------------------------------------
+# SEARCH USAGE (drives warming.py)
+# ------------------------------------------------
+
+def _decayed(score, last_seen, now):
+    return score * 0.5 ** ((now - last_seen) / USAGE_HALF_LIFE)
+
+
+def record_usage(lat, lon, infra, radius, variant=""):
+    """Count one request for a search; popularity decays with USAGE_HALF_LIFE
+
+    Counts are buffered in memory and written every USAGE_FLUSH_S, so a
+    cache hit doesn't queue behind a SQLite write.
+    """
+    key = get_cache_key(lat, lon, infra, radius, variant)
+    now = time.time()
+    with _usage_lock:
+        pending = _usage_pending.setdefault(key, [round(lat, 5), round(lon, 5), infra, radius, variant, 0, now])
+        pending[5] += 1
+        pending[6] = now
+        due = now - _usage_flushed >= USAGE_FLUSH_S
+    if due:
+        flush_usage()
+
+
+def flush_usage():
+    """Write buffered request counts in one transaction"""
+    global _usage_writes, _usage_flushed
+    with _usage_lock:
+        batch = list(_usage_pending.items())
+        _usage_pending.clear()
+        _usage_flushed = time.time()
+    if not batch:
+        return
+    try:
+        conn = _connect()
+        with conn:
+            for key, (lat, lon, infra, radius, variant, count, seen) in batch:
+                row = conn.execute("SELECT score, last_seen FROM usage WHERE key = ?", (key,)).fetchone()
+                score = (_decayed(*row, seen) if row else 0.0) + count
+                conn.execute("INSERT OR REPLACE INTO usage VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                             (key, lat, lon, infra, radius, variant, score, seen))
+            _usage_writes += 1
+            if _usage_writes % 16 == 0:
+                conn.execute("DELETE FROM usage WHERE key NOT IN "
+                             "(SELECT key FROM usage ORDER BY last_seen DESC LIMIT ?)", (USAGE_MAX_ROWS,))
+    except Exception as e:
+        print(f"Usage record error: {e}")
+
+
+# Counts buffered since the last flush aren't lost on a clean shutdown
+atexit.register(flush_usage)
+
+
+def hot_searches(limit=50):
+    """Most popular searches, hottest first, with when their result was cached (None if not)"""
+    flush_usage()
+    now = time.time()
+    try:
+        rows = _connect().execute("""
+            SELECT u.key, u.lat, u.lon, u.infra, u.radius, u.variant, u.score, u.last_seen, e.timestamp
+            FROM usage u LEFT JOIN entries e ON e.key = u.key
+        """).fetchall()
+    except Exception as e:
+        print(f"Usage read error: {e}")
+        return []
+    searches = [{"key": key, "lat": lat, "lon": lon, "infra": infra, "radius": radius, "variant": variant,
+                 "score": round(_decayed(score, seen, now), 3), "cached_at": cached_at}
+                for key, lat, lon, infra, radius, variant, score, seen, cached_at in rows]
+    searches.sort(key=lambda s: -s["score"])
+    return searches[:limit]
+
+
+def claim_warm_cycle(interval):
+    """True for exactly one caller (across worker processes) per `interval` seconds"""
+    now = time.time()
+    try:
+        conn = _connect()
+        with conn:
+            conn.execute("INSERT OR IGNORE INTO warm_lease VALUES (1, 0)")
+            return conn.execute("UPDATE warm_lease SET started = ? WHERE id = 1 AND started <= ?",
+                                (now, now - interval)).rowcount == 1
+    except Exception as e:
+        print(f"Warm lease error: {e}")
+        return False
@@ -0,0 +1,248 @@
+# backend/data_sources.py
+"""Where OSM data comes from: the live Overpass API or a local extract.
+
+DATA_SOURCE=overpass (default) sends queries to Overpass; DATA_SOURCE=local
+answers the same queries from an ingested extract (see local_osm.py) with
+no network. Both return Overpass JSON, so callers never know the difference.
+
+Overpass can be a pool of endpoints (OVERPASS_URLS: public mirrors and/or
+our own instance). Each query goes to the fastest healthy endpoint by
+latency EWMA; if it hasn't answered after that endpoint's p95, the query is
+hedged to the next one and the first answer wins. An endpoint failing
+BREAKER_FAILURES times in a row is skipped for BREAKER_COOLDOWN_S, then
+gets a single trial query. A lone endpoint has no breaker: with nowhere to
+fail over to, every query still tries it. Latency samples are wire time
+only, not time spent queued for a rate token or slot.
+"""
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, wait
+from urllib.parse import urlsplit
+
+import requests
+
+from http_client import http_post
+from metrics import TracedExecutor, gauge, inc
+
+DATA_SOURCE = os.environ.get("DATA_SOURCE", "overpass")
+
+EWMA_ALPHA = 0.3
+EWMA_PRIOR_S = 1.0          # assumed latency of an endpoint with no samples yet
+LATENCY_SAMPLES = 100       # recent successes kept per endpoint for the p95
+HEDGE_MIN_SAMPLES = 10      # below this, hedge after HEDGE_DEFAULT_S
+HEDGE_DEFAULT_S = 3.0
+HEDGE_MIN_S = 0.5
+HEDGE_MAX_S = 10.0
+MAX_PARALLEL_ATTEMPTS = 2   # a query is never in flight on more endpoints than this
+BREAKER_FAILURES = 3
+BREAKER_COOLDOWN_S = 30.0
+
+_attempt_pool = TracedExecutor(max_workers=16, thread_name_prefix="overpass")
+
+
+class EndpointsUnavailable(RuntimeError):
+    """Every Overpass endpoint's circuit breaker is open"""
+
+
+def _query_error(e):
+    """A 4xx other than 429 means the query itself is bad - no point trying elsewhere"""
+    status = getattr(getattr(e, "response", None), "status_code", None)
+    return isinstance(e, requests.HTTPError) and status is not None and 400 <= status < 500 and status != 429
+
+
+class Endpoint:
+    """One Overpass endpoint's latency estimate and circuit breaker"""
+
+    def __init__(self, url, upstream, breaker=True):
+        self.url = url
+        self.upstream = upstream     # http_client/scheduler name: own slots and rate bucket
+        self.breaker = breaker       # False for a lone endpoint: never taken out
+        self.ewma = None
+        self.samples = deque(maxlen=LATENCY_SAMPLES)
+        self.failures = 0
+        self.opened_at = None        # breaker open since (monotonic), None when closed
+        self.trial = False           # half-open trial query in flight
+        self.wins = 0
+        self._lock = threading.Lock()
+
+    def expected_s(self):
+        return EWMA_PRIOR_S if self.ewma is None else self.ewma
+
+    def hedge_delay(self):
+        with self._lock:
+            if len(self.samples) < HEDGE_MIN_SAMPLES:
+                return HEDGE_DEFAULT_S
+            ordered = sorted(self.samples)
+        p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+        return min(HEDGE_MAX_S, max(HEDGE_MIN_S, p95))
+
+    def usable(self, now):
+        """Breaker closed, or cooled down with no trial running"""
+        return self.opened_at is None or (not self.trial and now - self.opened_at >= BREAKER_COOLDOWN_S)
+
+    def claim(self):
+        """Take the endpoint for one attempt; a cooled-down open breaker lets exactly one through"""
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if not self.usable(time.monotonic()):
+                return False
+            self.trial = True
+            return True
+
+    def succeeded(self, seconds):
+        with self._lock:
+            self.ewma = seconds if self.ewma is None else EWMA_ALPHA * seconds + (1 - EWMA_ALPHA) * self.ewma
+            self.samples.append(seconds)
+            if self.opened_at is not None:
+                print(f"✅ Overpass endpoint {self.url} recovered")
+            self.failures, self.opened_at, self.trial = 0, None, False
+
+    def failed(self):
+        with self._lock:
+            self.failures += 1
+            if self.breaker and (self.trial or (self.opened_at is None and self.failures >= BREAKER_FAILURES)):
+                print(f"🔌 Overpass endpoint {self.url} taken out for {BREAKER_COOLDOWN_S:g}s")
+                self.opened_at = time.monotonic()
+            self.trial = False
+
+    def released(self):
+        """Attempt ended without telling us anything (caller's deadline, bad query)"""
+        with self._lock:
+            self.trial = False
+
+    def stats(self):
+        with self._lock:
+            return {
+                "url": self.url,
+                "state": "closed" if self.opened_at is None else ("half-open" if self.trial else "open"),
+                "ewma_ms": None if self.ewma is None else round(self.ewma * 1000, 1),
+                "samples": len(self.samples),
+                "consecutive_failures": self.failures,
+                "wins": self.wins
+            }
+
+
+class OverpassSource:
+    name = "overpass"
+
+    def __init__(self, urls, headers):
+        urls = [urls] if isinstance(urls, str) else list(urls)
+        # The first endpoint keeps the plain "overpass" limits; others get their own per host
+        self.endpoints = [Endpoint(u, "overpass" if i == 0 else f"overpass@{urlsplit(u).netloc}",
+                                   breaker=len(urls) > 1)
+                          for i, u in enumerate(urls)]
+        self.headers = headers
+
+    def ranked(self):
+        """Usable endpoints, fastest expected first"""
+        now = time.monotonic()
+        return [ep for ep in sorted(self.endpoints, key=Endpoint.expected_s) if ep.usable(now)]
+
+    def _next(self, order):
+        while order:
+            ep = order.pop(0)
+            if ep.claim():
+                return ep
+        return None
+
+    def _attempt(self, ep, q, deadline, timeout):
+        try:
+            r = http_post(ep.upstream, ep.url, data={"data": q}, headers=self.headers, timeout=timeout,
+                          deadline=deadline)
+            r.raise_for_status()
+            data = r.json()
+        except Exception as e:
+            if isinstance(e, (requests.RequestException, ValueError)) and not _query_error(e):
+                ep.failed()
+            else:
+                ep.released()
+            raise
+        ep.succeeded(r.upstream_seconds)
+        return data
+
+    def query(self, q, deadline=None, timeout=60):
+        """✅ Answer from the first endpoint to succeed; hedge slow ones, fail over broken ones"""
+        order = self.ranked()
+        first = self._next(order)
+        if first is None:
+            raise EndpointsUnavailable("all Overpass endpoints are failing")
+        if len(self.endpoints) == 1:
+            return self._attempt(first, q, deadline, timeout)
+
+        pending = {}
+        last_error = None
+
+        def launch(ep=None):
+            ep = ep or self._next(order)
+            if ep is None:
+                return float("inf")
+            pending[_attempt_pool.submit(self._attempt, ep, q, deadline, timeout)] = ep
+            return time.monotonic() + ep.hedge_delay()
+
+        hedge_at = launch(first)
+        while pending:
+            can_hedge = order and len(pending) < MAX_PARALLEL_ATTEMPTS
+            done, _ = wait(pending, timeout=max(0.0, hedge_at - time.monotonic()) if can_hedge else None,
+                           return_when=FIRST_COMPLETED)
+            if not done:
+                inc("overpass_hedges_total", help_text="Overpass queries hedged to a second endpoint")
+                hedge_at = launch()
+                continue
+            for fut in done:
+                ep = pending.pop(fut)
+                try:
+                    result = fut.result()
+                except Exception as e:
+                    if _query_error(e):
+                        raise
+                    last_error = e
+                    if order and len(pending) < MAX_PARALLEL_ATTEMPTS:
+                        hedge_at = launch()     # fail over right away
+                    continue
+                with ep._lock:
+                    ep.wins += 1
+                return result
+        raise last_error
+
+    def stats(self):
+        return [ep.stats() for ep in self.endpoints]
+
+
+class LocalSource:
+    name = "local"
+
+    def __init__(self, db=None):
+        from local_osm import LocalOsm, OSM_EXTRACT_DB
+        self.store = LocalOsm(db or OSM_EXTRACT_DB)
+
+    def query(self, q, deadline=None, timeout=60):
+        return self.store.query(q)
+
+
+def make_source(urls, headers, name=None):
+    """The configured source; DATA_SOURCE=local fails loudly if no store was ingested
+
+    `urls` is one Overpass endpoint or a list of them (see OverpassSource).
+    """
+    name = name or DATA_SOURCE
+    if name == "local":
+        return LocalSource()
+    if name != "overpass":
+        raise ValueError(f"Unknown DATA_SOURCE '{name}' (expected overpass or local)")
+    source = OverpassSource(urls, headers)
+    _register_gauges(source)
+    return source
+
+
+def source_stats(source):
+    return source.stats() if hasattr(source, "stats") else []
+
+
+def _register_gauges(source):
+    gauge("overpass_endpoint_up", "1 while the endpoint's circuit breaker is closed",
+          lambda: [({"endpoint": ep["url"]}, int(ep["state"] == "closed")) for ep in source.stats()])
+    gauge("overpass_endpoint_ewma_seconds", "Latency EWMA per Overpass endpoint (0: no samples yet)",
+          lambda: [({"endpoint": ep["url"]}, (ep["ewma_ms"] or 0) / 1000) for ep in source.stats()])
@@ -0,0 +1,45 @@
+# backend/deadline.py
+"""Per-request latency budgets propagated through the /recommend pipeline."""
+import time
+
+MIN_CALL_TIMEOUT = 0.05  # never hand requests a zero/negative timeout
+
+
+class DeadlineExceeded(TimeoutError):
+    """The request's latency budget ran out before this step could run"""
+
+
+class Deadline:
+    """Absolute monotonic expiry; helpers shrink their own timeouts to fit"""
+
+    def __init__(self, budget_s):
+        self.budget_s = budget_s
+        self.expires = time.monotonic() + budget_s
+
+    @classmethod
+    def from_ms(cls, ms):
+        """Deadline from a ?deadline_ms= value; None when absent or invalid"""
+        try:
+            ms = float(ms)
+        except (TypeError, ValueError):
+            return None
+        return cls(ms / 1000.0) if ms > 0 else None
+
+    def remaining(self):
+        return max(0.0, self.expires - time.monotonic())
+
+    def expired(self):
+        return time.monotonic() >= self.expires
+
+    def timeout(self, cap=None):
+        """Seconds a call may take: the smaller of cap and the remaining budget"""
+        left = self.expires - time.monotonic()
+        if left <= 0:
+            raise DeadlineExceeded(f"{self.budget_s * 1000:.0f} ms budget exhausted")
+        left = max(MIN_CALL_TIMEOUT, left)
+        return left if cap is None else min(cap, left)
+
+
+def wait_timeout(deadline):
+    """Timeout for Future.result(): None (wait forever) without a deadline"""
+    return None if deadline is None else deadline.remaining()
@@ -0,0 +1,51 @@
+# backend/distance_fields.py
+"""Nearest-feature index for road, water and amenity proximity.
+
+NearestIndex answers "distance to the nearest feature center" in O(log n)
+with a shapely STRtree instead of a linear haversine scan. These layers are
+fetched as centers (see utils_geo.GEOM_LAYERS), so the nearest center within
+the radius is the exact answer, not an approximation of `around`.
+"""
+import math
+
+import numpy as np
+from shapely import STRtree, points as shp_points
+
+EARTH_M_PER_DEG = 6371000 * math.pi / 180
+
+
+class NearestIndex:
+    """STRtree over feature centers projected to metres around a reference point"""
+
+    def __init__(self, centers):
+        self.centers = np.asarray(centers, dtype=np.float64).reshape(-1, 2)
+        self.lat0 = float(self.centers[:, 0].mean()) if len(self.centers) else 0.0
+        self.lon0 = float(self.centers[:, 1].mean()) if len(self.centers) else 0.0
+        self.kx = EARTH_M_PER_DEG * math.cos(math.radians(self.lat0))
+        self.tree = STRtree(shp_points(self._project(self.centers))) if len(self.centers) else None
+
+    @classmethod
+    def from_features(cls, features):
+        return cls([f["center"] for f in features])
+
+    def _project(self, latlon):
+        latlon = np.asarray(latlon, dtype=np.float64).reshape(-1, 2)
+        return np.column_stack([(latlon[:, 1] - self.lon0) * self.kx, (latlon[:, 0] - self.lat0) * EARTH_M_PER_DEG])
+
+    def _candidates(self, lat, lon):
+        """Indexes of the nearest center, plus any within rounding of it"""
+        pt = shp_points(self._project([(lat, lon)]))[0]
+        idx, dist = self.tree.query_nearest(pt, return_distance=True)
+        near = self.tree.query(pt, predicate="dwithin", distance=float(dist.min()) * 1.001 + 1.0)
+        return np.union1d(idx, near)
+
+    def nearest(self, lat, lon, radius_m):
+        """Nearest center distance (haversine), capped at radius_m"""
+        from utils_geo import haversine_m
+
+        if self.tree is None:
+            return float(radius_m)
+        best = float(radius_m)
+        for i in self._candidates(lat, lon):
+            best = min(best, haversine_m(lat, lon, self.centers[i, 0], self.centers[i, 1]))
+        return float(best)
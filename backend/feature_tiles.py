@@ -0,0 +1,372 @@
+# backend/feature_tiles.py
+"""Persistent slippy-tile store of OSM metric layers.
+
+Each (layer, z14 tile) holds every feature whose bounds intersect the tile,
+fetched once from Overpass, stored zlib-compressed in FEATURE_TILE_DB and
+indexed with an rtree when loaded. Radius queries are assembled from the
+covering tiles, so overlapping searches never re-download the same area.
+Tiles older than FEATURE_TILE_MAX_AGE are served as-is and refreshed in the
+background.
+
+Opt-in (FEATURE_TILES=1), best after a prefetch: a cold search would need
+several tile queries where the direct path needs one. When most of a
+search's tiles are missing, layer_features returns None so the caller makes
+its single batched query, and the tiles are fetched in the background.
+
+    python feature_tiles.py prefetch                 # warm Bengaluru
+    python feature_tiles.py prefetch --bbox S,W,N,E --layers roads,water
+"""
+import argparse
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from rtree import index as rtree_index
+
+from metrics import count_cache
+from scheduler import priority
+from singleflight import SingleFlight
+
+FEATURE_TILES = os.environ.get("FEATURE_TILES", "0") != "0"
+FEATURE_TILE_DB = os.environ.get("FEATURE_TILE_DB", "feature_tiles.db")
+FEATURE_TILE_ZOOM = 14                  # ~2.4 km tiles
+FEATURE_TILE_MAX_AGE = 7 * 86400        # refresh in the background after a week
+FEATURE_TILE_CACHE = 256                # (layer, tile) entries kept in memory
+FETCH_BATCH = 12                        # (layer, tile) pairs per Overpass query
+COLD_SHARE = 0.5                        # missing share of a search's tiles that sends it to the direct query
+BENGALURU_BBOX = (12.83, 77.45, 13.15, 77.80)  # south, west, north, east
+
+_local = threading.local()
+_loaded = OrderedDict()
+_loaded_lock = threading.Lock()
+_flights = SingleFlight("feature_tiles")
+_refreshing = set()
+_refresh_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="tile-refresh")
+_stats = {"memory_hits": 0, "disk_hits": 0, "fetched": 0, "refreshes": 0}
+_stats_lock = threading.Lock()
+
+
+def _count(stat, n=1):
+    with _stats_lock:
+        _stats[stat] += n
+
+
+# ------------------------------------------------
+# TILE MATH
+# ------------------------------------------------
+
+def tile_xy(lat, lon, z=FEATURE_TILE_ZOOM):
+    """Slippy-map tile (x, y) containing the point"""
+    n = 2 ** z
+    lat = max(-85.0511, min(85.0511, lat))
+    x = int((lon + 180.0) / 360.0 * n)
+    y = int((1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * n)
+    return min(n - 1, max(0, x)), min(n - 1, max(0, y))
+
+
+def tile_bounds(x, y, z=FEATURE_TILE_ZOOM):
+    """(south, west, north, east) of a tile"""
+    n = 2 ** z
+    west = x / n * 360.0 - 180.0
+    east = (x + 1) / n * 360.0 - 180.0
+    north = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / n))))
+    south = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * (y + 1) / n))))
+    return (south, west, north, east)
+
+
+def tiles_covering(bbox, z=FEATURE_TILE_ZOOM):
+    s, w, n, e = bbox
+    x0, y0 = tile_xy(n, w, z)
+    x1, y1 = tile_xy(s, e, z)
+    return [(x, y) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1)]
+
+
+def _intersects(b, bbox):
+    """Feature bounds (minlat, minlon, maxlat, maxlon) vs (south, west, north, east)"""
+    return b[0] <= bbox[2] and b[2] >= bbox[0] and b[1] <= bbox[3] and b[3] >= bbox[1]
+
+
+# ------------------------------------------------
+# STORAGE
+# ------------------------------------------------
+
+class TileLayer:
+    """One layer's features for one tile with an rtree over their bounds"""
+
+    def __init__(self, features, fetched):
+        self.features = features
+        self.fetched = fetched
+        self.tree = None
+        if features:
+            self.tree = rtree_index.Index(
+                (i, (f["bounds"][1], f["bounds"][0], f["bounds"][3], f["bounds"][2]), None)
+                for i, f in enumerate(features)
+            )
+
+    def query(self, bbox):
+        if self.tree is None:
+            return []
+        s, w, n, e = bbox
+        return [self.features[i] for i in sorted(self.tree.intersection((w, s, e, n)))]
+
+    def stale(self):
+        return time.time() - self.fetched >= FEATURE_TILE_MAX_AGE
+
+
+def _encode(features):
+    """Compact form: [id, bounds, flat polylines] per feature, zlib JSON"""
+    rows = [[f["id"], f["bounds"], [[c for p in ln for c in p] for ln in f["lines"]]] for f in features]
+    return zlib.compress(json.dumps(rows, separators=(",", ":")).encode(), 6)
+
+
+def _decode(blob):
+    features = []
+    for fid, b, lines in json.loads(zlib.decompress(blob)):
+        features.append({
+            "id": fid,
+            "center": ((b[0] + b[2]) / 2, (b[1] + b[3]) / 2),
+            "bounds": tuple(b),
+            "lines": [[(ln[i], ln[i + 1]) for i in range(0, len(ln), 2)] for ln in lines]
+        })
+    return features
+
+
+def _connect():
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(FEATURE_TILE_DB, timeout=10)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS tiles (
+                layer TEXT NOT NULL,
+                z INTEGER NOT NULL,
+                x INTEGER NOT NULL,
+                y INTEGER NOT NULL,
+                fetched REAL NOT NULL,
+                data BLOB NOT NULL,
+                PRIMARY KEY (layer, z, x, y)
+            )
+        """)
+        _local.conn = conn
+    return conn
+
+
+def _remember(key, tile):
+    with _loaded_lock:
+        _loaded[key] = tile
+        _loaded.move_to_end(key)
+        while len(_loaded) > FEATURE_TILE_CACHE:
+            _loaded.popitem(last=False)
+
+
+def load_tile(layer, x, y):
+    """Stored tile from memory or disk, None if it was never fetched"""
+    key = (layer, x, y)
+    with _loaded_lock:
+        tile = _loaded.get(key)
+        if tile is not None:
+            _loaded.move_to_end(key)
+    if tile is not None:
+        _count("memory_hits")
+        return tile
+    row = _connect().execute(
+        "SELECT fetched, data FROM tiles WHERE layer = ? AND z = ? AND x = ? AND y = ?",
+        (layer, FEATURE_TILE_ZOOM, x, y)
+    ).fetchone()
+    if row is None:
+        return None
+    tile = TileLayer(_decode(row[1]), row[0])
+    _remember(key, tile)
+    _count("disk_hits")
+    return tile
+
+
+def _store(key, features, fetched):
+    layer, x, y = key
+    with _connect() as conn:
+        conn.execute("INSERT OR REPLACE INTO tiles VALUES (?, ?, ?, ?, ?, ?)",
+                     (layer, FEATURE_TILE_ZOOM, x, y, fetched, _encode(features)))
+    tile = TileLayer(features, fetched)
+    _remember(key, tile)
+    return tile
+
+
+# ------------------------------------------------
+# FETCHING
+# ------------------------------------------------
+
+def tiles_query(keys):
+    """One Overpass query for several (layer, x, y) tiles"""
+    from utils_geo import layers_query
+
+    return layers_query([(layer, tile_bounds(x, y)) for layer, x, y in keys], timeout=90, digits=7)
+
+
+def fetch_tiles(keys, deadline=None):
+    """Download and store (layer, x, y) tiles in one Overpass round-trip"""
+    from utils_geo import overpass_query, split_metric_layers
+
+    amenities = sorted({layer.split(":", 1)[1] for layer, _, _ in keys if layer.startswith("amenity:")})
+    with_base = any(not layer.startswith("amenity:") for layer, _, _ in keys)
+    res = overpass_query(tiles_query(keys), deadline=deadline, timeout=90)
+    layers = split_metric_layers(res.get("elements", []), amenities, with_base=with_base)
+
+    now = time.time()
+    tiles = {}
+    for key in keys:
+        bbox = tile_bounds(key[1], key[2])
+        tiles[key] = _store(key, [f for f in layers[key[0]] if _intersects(f["bounds"], bbox)], now)
+    _count("fetched", len(keys))
+    return tiles
+
+
+def _fetch_claimed(keys, deadline):
+    """Fetch keys this thread leads, in FETCH_BATCH groups, publishing each tile"""
+    for k in range(0, len(keys), FETCH_BATCH):
+        batch = keys[k:k + FETCH_BATCH]
+        calls = {key: call for key, call in batch}
+        try:
+            tiles = fetch_tiles(list(calls), deadline)
+        except Exception as e:
+            for rest_key, rest_call in keys[k:]:
+                _flights.finish(rest_key, rest_call, error=e)
+            raise
+        for key, call in calls.items():
+            _flights.finish(key, call, result=tiles[key])
+
+
+def _refresh(keys):
+    try:
+        with priority("background"):
+            fetch_tiles(keys)
+        _count("refreshes", len(keys))
+    except Exception as e:
+        print(f"Feature tile refresh error: {e}")
+    finally:
+        with _loaded_lock:
+            _refreshing.difference_update(keys)
+
+
+def _schedule_refresh(keys):
+    with _loaded_lock:
+        keys = [k for k in keys if k not in _refreshing]
+        _refreshing.update(keys)
+    for k in range(0, len(keys), FETCH_BATCH):
+        _refresh_pool.submit(_refresh, keys[k:k + FETCH_BATCH])
+
+
+def get_tiles(keys, deadline=None):
+    """{(layer, x, y): TileLayer}, fetching missing tiles (shared with concurrent callers)"""
+    tiles, stale = {}, []
+    for key in keys:
+        tile = load_tile(*key)
+        if tile is None:
+            count_cache("feature_tile", "miss")
+            continue
+        tiles[key] = tile
+        if tile.stale():
+            stale.append(key)
+        count_cache("feature_tile", "expired" if tile.stale() else "hit")
+    if stale:
+        _schedule_refresh(stale)
+
+    led, waiting = [], []
+    for key in keys:
+        if key in tiles:
+            continue
+        call, leader = _flights.begin(key)
+        (led if leader else waiting).append((key, call))
+    if led:
+        _fetch_claimed(led, deadline)
+        tiles.update((key, call.result) for key, call in led)
+    for key, call in waiting:
+        tiles[key] = call.wait(None if deadline is None else deadline.remaining())
+    return tiles
+
+
+def layer_features(wanted, deadline=None):
+    """✅ {layer: features intersecting bbox} for [(layer, bbox)], assembled from tiles
+
+    Features spanning several tiles are returned once (deduplicated by OSM id).
+    None when the area is mostly unfetched and would take more than one tile
+    query: the missing tiles are fetched in the background instead.
+    """
+    per_layer = {layer: tiles_covering(bbox) for layer, bbox in wanted}
+    keys = sorted({(layer, x, y) for layer, xys in per_layer.items() for x, y in xys})
+    missing = [key for key in keys if load_tile(*key) is None]
+    if len(missing) > FETCH_BATCH and len(missing) > COLD_SHARE * len(keys):
+        print(f"🧊 {len(missing)}/{len(keys)} feature tiles missing; fetching them in the background")
+        _schedule_refresh(missing)
+        return None
+    tiles = get_tiles(keys, deadline)
+
+    out = {}
+    for layer, bbox in wanted:
+        seen, feats = set(), []
+        for x, y in per_layer[layer]:
+            for f in tiles[(layer, x, y)].query(bbox):
+                if f["id"] not in seen:
+                    seen.add(f["id"])
+                    feats.append(f)
+        out[layer] = feats
+    return out
+
+
+def tile_stats():
+    with _stats_lock:
+        stats = dict(_stats)
+    with _loaded_lock:
+        stats["in_memory"] = len(_loaded)
+    stats["zoom"] = FEATURE_TILE_ZOOM
+    return stats
+
+
+# ------------------------------------------------
+# PREFETCH CLI
+# ------------------------------------------------
+
+def prefetch(bbox=BENGALURU_BBOX, layers=None, force=False):
+    """Fetch every missing (or, with force, every) tile of the layers over bbox"""
+    from utils_geo import AMENITY_MAPPING, BASE_LAYERS
+
+    if layers is None:
+        layers = BASE_LAYERS + sorted({f"amenity:{a}" for a in AMENITY_MAPPING.values()})
+    keys = [(layer, x, y) for layer in layers for x, y in tiles_covering(bbox)]
+    if not force:
+        keys = [k for k in keys if (t := load_tile(*k)) is None or t.stale()]
+    print(f"🧱 Prefetching {len(keys)} tiles ({len(layers)} layers, z{FEATURE_TILE_ZOOM})")
+    for k in range(0, len(keys), FETCH_BATCH):
+        batch = keys[k:k + FETCH_BATCH]
+        try:
+            with priority("background"):
+                fetch_tiles(batch)
+        except Exception as e:
+            print(f"⚠️ Batch {k // FETCH_BATCH + 1} failed: {e}")
+            continue
+        print(f"   {min(k + FETCH_BATCH, len(keys))}/{len(keys)}")
+    print("✅ Prefetch done")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manage the tiled OSM feature store")
+    sub = parser.add_subparsers(dest="command", required=True)
+    pre = sub.add_parser("prefetch", help="warm tiles for an area (default: Bengaluru)")
+    pre.add_argument("--bbox", help="south,west,north,east")
+    pre.add_argument("--layers", help="comma-separated, e.g. buildings,roads,amenity:school")
+    pre.add_argument("--force", action="store_true", help="re-fetch fresh tiles too")
+    args = parser.parse_args(argv)
+
+    bbox = tuple(float(v) for v in args.bbox.split(",")) if args.bbox else BENGALURU_BBOX
+    layers = args.layers.split(",") if args.layers else None
+    prefetch(bbox, layers, args.force)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+# backend/gazetteer.py
+"""In-memory prefix index of Bengaluru place names for /autocomplete.
+
+Seeded from GAZETTEER_FILE (a JSON list of {"display_name", "lat", "lon"})
+when it exists, and grown from every Nominatim/Photon response we receive.
+"""
+import bisect
+import json
+import os
+import threading
+
+GAZETTEER_FILE = os.environ.get("GAZETTEER_FILE", "bengaluru_gazetteer.json")
+MAX_ANSWERED_PREFIXES = 20000
+
+_lock = threading.Lock()
+_entries = []        # places in insertion order
+_seen = {}           # display_name -> index in _entries
+_keys = []           # sorted (key, entry index) pairs
+_answered = {}       # normalized query -> entry indexes upstream returned, for complete answers only
+
+
+def _normalize(text):
+    """Lower-cased first comma part, whitespace collapsed (matches _index_keys)"""
+    return " ".join(text.lower().split(",")[0].split())
+
+
+def _index_keys(display_name):
+    """Every word-boundary suffix of the place-name part (the first comma part)
+
+    The rest of display_name (district, city, state, postcode, country) is
+    shared by nearly every place, so indexing it makes "ban" or "560" match
+    everything.
+    """
+    words = _normalize(display_name).split()
+    return {" ".join(words[i:]) for i in range(len(words))}
+
+
+def add_places(places):
+    """Learn places from an upstream response; returns how many were new"""
+    added = 0
+    with _lock:
+        for p in places:
+            name = p.get("display_name")
+            if not name or name in _seen:
+                continue
+            idx = len(_entries)
+            _entries.append({"display_name": name, "lat": float(p["lat"]), "lon": float(p["lon"])})
+            _seen[name] = idx
+            for key in _index_keys(name):
+                bisect.insort(_keys, (key, idx))
+            added += 1
+    return added
+
+
+def mark_answered(q, results, returned, requested):
+    """Remember upstream's answer to q when it was complete
+
+    returned/requested: raw row count upstream sent and the limit we asked
+    for, before any local filtering - a cut-off answer (returned ==
+    requested) says nothing about what longer queries would find.
+    Call after add_places(results).
+    """
+    if returned >= requested:
+        return
+    with _lock:
+        if len(_answered) < MAX_ANSWERED_PREFIXES:
+            _answered[_normalize(q)] = [_seen[p["display_name"]] for p in results if p.get("display_name") in _seen]
+
+
+def _matches(q):
+    lo = bisect.bisect_left(_keys, (q,))
+    found = set()
+    for key, idx in _keys[lo:]:
+        if not key.startswith(q):
+            break
+        found.add(idx)
+    return [_entries[i] for i in sorted(found)]
+
+
+def _narrowed(q):
+    """Entries of the longest complete answered prefix of q that still match q (None if none)"""
+    for k in range(len(q), 0, -1):
+        answer = _answered.get(q[:k])
+        if answer is not None:
+            return [_entries[i] for i in answer
+                    if any(key.startswith(q) for key in _index_keys(_entries[i]["display_name"]))]
+    return None
+
+
+def lookup_places(q, rank, limit=8):
+    """✅ Answer a keystroke locally, or None when upstream must be asked
+
+    Answers when the index already holds `limit` place names matching q, or
+    when q extends a query upstream answered completely before (its results
+    are narrowed locally).
+    """
+    nq = _normalize(q)
+    if not nq:
+        return None
+    with _lock:
+        matches = _matches(nq)
+        narrowed = _narrowed(nq)
+    if len(matches) >= limit:
+        return rank(matches, q)[:limit]
+    if narrowed:
+        return rank(narrowed, q)[:limit]
+    return None
+
+
+def index_size():
+    with _lock:
+        return {"places": len(_entries), "keys": len(_keys), "answered_queries": len(_answered)}
+
+
+def load_gazetteer(path=GAZETTEER_FILE):
+    """Seed the index from a local gazetteer file"""
+    if not os.path.exists(path):
+        return 0
+    try:
+        with open(path, 'r', encoding="utf-8") as f:
+            places = json.load(f)
+    except Exception as e:
+        print(f"Gazetteer load error: {e}")
+        return 0
+    added = add_places(places)
+    print(f"📚 Loaded {added} places from {path}")
+    return added
+
+
+load_gazetteer()
@@ -0,0 +1,304 @@
+# backend/heatmap.py
+"""Whole-area suitability surfaces: score a regular grid in one pass.
+
+Layers are fetched for a covering circle (the radius rounded up to
+LAYER_RADIUS_STEP) and kept per center, so moving the radius slider within
+what was fetched only re-rasterizes; rasters are cached per exact grid.
+"""
+import base64
+import math
+import struct
+import threading
+import zlib
+from collections import OrderedDict
+
+import numpy as np
+from shapely import STRtree, points as shp_points
+from shapely.geometry import LineString, MultiLineString, Point
+
+from scoring import raw_score_columns, weighted_scores, SCORE_KEYS, DEFAULT_WEIGHTS
+from utils_geo import (
+    AMENITY_MAPPING,
+    EARTH_M_PER_DEG,
+    METRIC_RADII,
+    fetch_metric_layers,
+    get_air_quality_openweather,
+)
+
+HEATMAP_DEFAULT_SIZE = 100
+HEATMAP_MAX_SIZE = 256
+HEATMAP_MIN_RADIUS = 250    # finer cells make the building-count window (and its padding) huge
+HEATMAP_MAX_RADIUS = 10000  # buildings come back as full geometry; wider areas are megabytes per query
+LAYER_RADIUS_STEP = 1000    # layers are fetched for the radius rounded up to this
+NODATA = 255
+LAYER_CACHE_SIZE = 8
+
+_base_layers = OrderedDict()    # (lat, lon) -> (covered radius, base layers)
+_amenity_layers = OrderedDict() # (lat, lon, amenity) -> (covered radius, amenity features)
+_base_cache = OrderedDict()     # (lat, lon, radius, size) -> base metric rasters
+_amenity_cache = OrderedDict()  # (lat, lon, radius, size, amenity) -> distance raster
+_cache_lock = threading.Lock()
+
+
+def _cache_get(cache, key):
+    with _cache_lock:
+        if key in cache:
+            cache.move_to_end(key)
+            return cache[key]
+    return None
+
+
+def _cache_put(cache, key, value):
+    with _cache_lock:
+        cache[key] = value
+        cache.move_to_end(key)
+        while len(cache) > LAYER_CACHE_SIZE:
+            cache.popitem(last=False)
+
+
+class Grid:
+    """size x size cell centers covering the search circle, row 0 = north"""
+
+    def __init__(self, lat, lon, radius_m, size):
+        if radius_m <= 0 or size < 1:
+            raise ValueError(f"Grid needs a positive radius and size (got {radius_m}, {size})")
+        self.lat, self.lon, self.radius_m, self.size = lat, lon, radius_m, size
+        self.cell_m = 2.0 * radius_m / size
+        self.kx = EARTH_M_PER_DEG * math.cos(math.radians(lat))
+        offsets = (np.arange(size) + 0.5) * self.cell_m - radius_m
+        self.x = np.tile(offsets, size)             # east, metres
+        self.y = np.repeat(offsets[::-1], size)     # north, metres
+        self.inside = np.hypot(self.x, self.y) <= radius_m
+
+    def project(self, lat, lon):
+        return (np.asarray(lon) - self.lon) * self.kx, (np.asarray(lat) - self.lat) * EARTH_M_PER_DEG
+
+    def bounds(self):
+        dlat = self.radius_m / EARTH_M_PER_DEG
+        dlon = self.radius_m / self.kx
+        return [self.lat - dlat, self.lon - dlon, self.lat + dlat, self.lon + dlon]
+
+    def corner_points(self):
+        s, w, n, e = self.bounds()
+        return [{"lat": s, "lon": w}, {"lat": n, "lon": e}]
+
+
+def _feature_geometry(grid, feat):
+    parts = []
+    for line in feat["lines"]:
+        xs, ys = grid.project([p[0] for p in line], [p[1] for p in line])
+        parts.append(list(zip(xs, ys)))
+    if len(parts) == 1 and len(parts[0]) == 1:
+        return Point(parts[0][0])
+    lines = [p if len(p) > 1 else [p[0], p[0]] for p in parts]
+    return LineString(lines[0]) if len(lines) == 1 else MultiLineString(lines)
+
+
+def nearest_center_raster(grid, features, radius_m):
+    """Distance from every cell to the nearest feature center, capped at radius_m
+
+    Matches layer_nearest_center: nearest-distance layers are fetched as
+    centers, so membership is the center distance itself.
+    """
+    out = np.full(grid.size * grid.size, float(radius_m))
+    if not features:
+        return out
+    cx, cy = grid.project([f["center"][0] for f in features], [f["center"][1] for f in features])
+    tree = STRtree(shp_points(np.column_stack([cx, cy])))
+    (cell_idx, _), dist = tree.query_nearest(
+        shp_points(np.column_stack([grid.x, grid.y])), return_distance=True
+    )
+    np.minimum.at(out, cell_idx, dist)
+    return np.minimum(out, radius_m)
+
+
+def count_within_raster(grid, features, radius_m):
+    """Features whose geometry lies within radius_m of each cell (Overpass `around`)"""
+    counts = np.zeros(grid.size * grid.size)
+    if not features:
+        return counts
+    tree = STRtree([_feature_geometry(grid, f) for f in features])
+    cell_idx, _ = tree.query(
+        shp_points(np.column_stack([grid.x, grid.y])), predicate="dwithin", distance=radius_m
+    )
+    counts += np.bincount(cell_idx, minlength=counts.size)
+    return counts
+
+
+def center_count_raster(grid, features, radius_m):
+    """Feature centers within radius_m of each cell, binned at grid resolution
+
+    Used for buildings, where exact pair counting would be millions of pairs
+    per surface; buildings are small so their center stands in for the shape.
+    """
+    size = grid.size
+    pad = int(math.ceil(radius_m / grid.cell_m))
+    counts = np.zeros(size * size)
+    if not features:
+        return counts
+    cx, cy = grid.project([f["center"][0] for f in features], [f["center"][1] for f in features])
+    cols = np.floor((cx + grid.radius_m) / grid.cell_m).astype(int) + pad
+    rows = np.floor((grid.radius_m - cy) / grid.cell_m).astype(int) + pad
+    full = size + 2 * pad
+    keep = (cols >= 0) & (cols < full) & (rows >= 0) & (rows < full)
+    hist = np.zeros((full, full))
+    np.add.at(hist, (rows[keep], cols[keep]), 1)
+
+    # Disc sum = one horizontal run per row offset, read off row-wise prefix sums
+    csum = np.zeros((full, full + 1))
+    np.cumsum(hist, axis=1, out=csum[:, 1:])
+    acc = np.zeros((size, size))
+    for di in range(-pad, pad + 1):
+        w = _half_width(di, radius_m / grid.cell_m)
+        if w < 0:
+            continue
+        band = csum[pad + di:pad + di + size]
+        acc += band[:, pad + w + 1:pad + w + 1 + size] - band[:, pad - w:pad - w + size]
+    return acc.ravel()
+
+
+def _half_width(di, r_cells):
+    """Largest dj with di² + dj² <= r_cells² (-1 when row offset di is outside the disc)"""
+    rest = r_cells * r_cells - di * di
+    if rest < 0:
+        return -1
+    w = int(math.sqrt(rest))
+    while (w + 1) ** 2 <= rest:
+        w += 1
+    while w > 0 and w * w > rest:
+        w -= 1
+    return w
+
+
+def _cache_keys(grid, infra_type):
+    area = (round(grid.lat, 5), round(grid.lon, 5), grid.radius_m, grid.size)
+    return area, area + (AMENITY_MAPPING.get(infra_type, infra_type),)
+
+
+def _covered(cache, key, radius_m):
+    """Cached layers for key if they were fetched for at least radius_m"""
+    hit = _cache_get(cache, key)
+    return hit[1] if hit is not None and hit[0] >= radius_m else None
+
+
+def _covering_points(grid):
+    step_up = math.ceil(grid.radius_m / LAYER_RADIUS_STEP) * LAYER_RADIUS_STEP
+    cover = max(grid.radius_m, min(HEATMAP_MAX_RADIUS, step_up))
+    return cover, Grid(grid.lat, grid.lon, cover, 1).corner_points()
+
+
+def _layers_for(grid, infra_type):
+    """Base + amenity layers covering the grid; an uncovered area is fetched in one query"""
+    center = (round(grid.lat, 5), round(grid.lon, 5))
+    amen = AMENITY_MAPPING.get(infra_type, infra_type)
+    base = _covered(_base_layers, center, grid.radius_m)
+    amenity = _covered(_amenity_layers, center + (amen,), grid.radius_m)
+    if base is not None and amenity is not None:
+        return dict(base, **{f"amenity:{amen}": amenity})
+
+    cover, corners = _covering_points(grid)
+    layers = fetch_metric_layers(corners, infra_type, base_points=[] if base is not None else None)
+    if layers is None:
+        return None
+    _cache_put(_amenity_layers, center + (amen,), (cover, layers[f"amenity:{amen}"]))
+    if base is None:
+        base = {k: v for k, v in layers.items() if k != "indexes" and not k.startswith("amenity:")}
+        _cache_put(_base_layers, center, (cover, base))
+    return dict(base, **{f"amenity:{amen}": layers[f"amenity:{amen}"]})
+
+
+def _amenity_from_layers(grid, layers, infra_type):
+    amen = AMENITY_MAPPING.get(infra_type, infra_type)
+    return nearest_center_raster(grid, layers[f"amenity:{amen}"], METRIC_RADII["amenity"])
+
+
+def _base_rasters(grid, infra_type):
+    """Infra-independent rasters; a cold area also warms this infra's amenity raster"""
+    base_key, amen_key = _cache_keys(grid, infra_type)
+    base = _cache_get(_base_cache, base_key)
+    if base is not None:
+        return base
+
+    layers = _layers_for(grid, infra_type)
+    if layers is None:
+        return None
+    try:
+        aqi, pm25 = get_air_quality_openweather(grid.lat, grid.lon)
+    except Exception as e:
+        print(f"Air quality error: {e}")
+        aqi = None
+    lake = nearest_center_raster(grid, layers["water"], METRIC_RADII["water"])
+    green_cnt = count_within_raster(grid, layers["green"], METRIC_RADII["green"])
+    base = {
+        "pop": center_count_raster(grid, layers["buildings"], METRIC_RADII["buildings"]),
+        "dist_road": nearest_center_raster(grid, layers["roads"], METRIC_RADII["roads"]),
+        "near_lake": lake <= 300,
+        "green_pct": np.minimum(80.0, (green_cnt / 10.0) * 80.0),
+        "aqi": 3 if aqi is None else aqi,
+    }
+    if aqi is not None:     # don't keep a surface built on a made-up AQI
+        _cache_put(_base_cache, base_key, base)
+    _cache_put(_amenity_cache, amen_key, _amenity_from_layers(grid, layers, infra_type))
+    return base
+
+
+def _amenity_raster(grid, infra_type):
+    _, amen_key = _cache_keys(grid, infra_type)
+    dist = _cache_get(_amenity_cache, amen_key)
+    if dist is not None:
+        return dist
+
+    layers = _layers_for(grid, infra_type)
+    if layers is None:
+        return None
+    dist = _amenity_from_layers(grid, layers, infra_type)
+    _cache_put(_amenity_cache, amen_key, dist)
+    return dist
+
+
+def suitability_surface(lat, lon, radius_m, infra_type, size=HEATMAP_DEFAULT_SIZE, weights=None):
+    """✅ 0-100 suitability for every grid cell (NaN outside the search circle)
+
+    Layers are fetched once per area and cached, so switching infra type costs
+    one amenity query, and re-weighting or a radius within the fetched area
+    costs no network at all.
+    """
+    grid = Grid(lat, lon, radius_m, size)
+    base = _base_rasters(grid, infra_type)
+    dist_same = _amenity_raster(grid, infra_type)
+    if base is None or dist_same is None:
+        return grid, None
+
+    cols = raw_score_columns(infra_type, base["pop"], base["dist_road"], base["near_lake"],
+                             base["green_pct"], base["aqi"], dist_same)
+    n = grid.size * grid.size
+    matrix = np.column_stack([np.broadcast_to(cols[k], (n,)) for k in SCORE_KEYS])
+
+    surface = np.full(n, np.nan)
+    surface[grid.inside] = weighted_scores(matrix[grid.inside], weights or DEFAULT_WEIGHTS)
+    return grid, surface
+
+
+def encode_uint8(surface):
+    """Scores rounded to 0-100, NODATA outside the circle, base64"""
+    raw = np.where(np.isnan(surface), NODATA, np.clip(np.rint(surface), 0, 100)).astype(np.uint8)
+    return base64.b64encode(raw.tobytes()).decode("ascii")
+
+
+def encode_png(surface, size):
+    """RGBA PNG overlay: red (0) to green (100), transparent outside the circle"""
+    s = np.nan_to_num(surface, nan=0.0).reshape(size, size) / 100.0
+    rgba = np.zeros((size, size, 4), dtype=np.uint8)
+    rgba[..., 0] = np.rint(255 * (1 - s))
+    rgba[..., 1] = np.rint(255 * s)
+    rgba[..., 3] = np.where(np.isnan(surface.reshape(size, size)), 0, 180)
+
+    raw = b"".join(b"\x00" + rgba[r].tobytes() for r in range(size))
+
+    def chunk(tag, data):
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data) & 0xffffffff)
+
+    return (b"\x89PNG\r\n\x1a\n"
+            + chunk(b"IHDR", struct.pack(">IIBBBBB", size, size, 8, 6, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(raw, 6))
+            + chunk(b"IEND", b""))
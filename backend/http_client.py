@@ -0,0 +1,186 @@
+# backend/http_client.py
+"""Shared keep-alive HTTP client for every upstream (Overpass, Nominatim, Photon, OpenWeather)."""
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from deadline import DeadlineExceeded
+from metrics import record_upstream
+from scheduler import acquire, throttled
+
+# Max simultaneous in-flight calls per upstream, shared by every thread in the worker.
+# Extra endpoints of an upstream ("overpass@mirror.host") get the same cap each.
+# UPSTREAM_LIMIT_<NAME> env overrides (raise it with UPSTREAM_RATE_<NAME>, see scheduler.py).
+UPSTREAM_LIMITS = {
+    "overpass": 2,
+    "nominatim": 1,
+    "photon": 2,
+    "openweather": 4
+}
+
+# Keep-alive connections kept per host (HTTP_POOL_<HOST> env overrides, dots as underscores)
+DEFAULT_POOL_SIZE = int(os.environ.get("HTTP_POOL_SIZE", "8"))
+POOL_SIZES = {
+    "overpass-api.de": 4,
+    "nominatim.openstreetmap.org": 2,
+    "photon.komoot.io": 4,
+    "api.openweathermap.org": 8
+}
+
+CONNECT_TIMEOUT = 4.0   # seconds to open a connection; read timeout comes from the caller
+RETRY_TOTAL = 2         # connection failures retried in urllib3; statuses retried in http_request
+RETRY_STATUSES = (429, 502, 503, 504)
+RETRY_BACKOFF = 0.5     # 0.5s, 1s, ... plus up to RETRY_JITTER random seconds
+RETRY_JITTER = 0.5
+
+
+def _limit(name):
+    base = name.split("@")[0]
+    env = os.environ.get(f"UPSTREAM_LIMIT_{base.upper()}")
+    return int(env) if env else UPSTREAM_LIMITS.get(base, 2)
+
+
+_upstream_slots = {name: threading.BoundedSemaphore(_limit(name)) for name in UPSTREAM_LIMITS}
+_session = None
+_session_lock = threading.Lock()
+
+
+def _slots(name):
+    sem = _upstream_slots.get(name)
+    if sem is None:
+        with _session_lock:
+            sem = _upstream_slots.setdefault(name, threading.BoundedSemaphore(_limit(name)))
+    return sem
+
+
+@contextmanager
+def upstream_slot(name, deadline=None):
+    """Block until the named upstream has a free concurrency slot (or the deadline passes)"""
+    sem = _slots(name)
+    if not sem.acquire(timeout=None if deadline is None else deadline.remaining()):
+        raise DeadlineExceeded(f"no {name} slot before deadline")
+    try:
+        yield
+    finally:
+        sem.release()
+
+
+def _pool_size(host):
+    env = os.environ.get("HTTP_POOL_" + host.replace(".", "_").replace("-", "_").upper())
+    return int(env) if env else POOL_SIZES.get(host, DEFAULT_POOL_SIZE)
+
+
+def _retry():
+    # Status retries (429/5xx) happen in http_request instead, so each attempt
+    # takes its own rate token and a 429 pauses the upstream's bucket
+    return Retry(
+        total=RETRY_TOTAL,
+        connect=RETRY_TOTAL,
+        read=0,                      # never replay a request the server may still be running
+        status=0,
+        allowed_methods=None,        # Overpass POSTs are read-only queries
+        backoff_factor=RETRY_BACKOFF,
+        backoff_jitter=RETRY_JITTER,
+        raise_on_status=False
+    )
+
+
+def _adapter(host=None):
+    """One adapter per known host; the default one keeps a pool per other host"""
+    size = _pool_size(host) if host else DEFAULT_POOL_SIZE
+    return HTTPAdapter(pool_connections=1 if host else 10, pool_maxsize=size, max_retries=_retry())
+
+
+def get_session():
+    """The process-wide session; connection pools are thread-safe per host"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                s = requests.Session()
+                s.headers["Accept-Encoding"] = "gzip, deflate"
+                s.mount("https://", _adapter())
+                s.mount("http://", _adapter())
+                for host in POOL_SIZES:
+                    s.mount(f"https://{host}/", _adapter(host))
+                _session = s
+    return _session
+
+
+def _timeout(timeout):
+    if timeout is None or isinstance(timeout, tuple):
+        return timeout
+    return (min(CONNECT_TIMEOUT, timeout), timeout)
+
+
+def _backoff(attempt, resp):
+    """Seconds before retrying a 5xx: exponential with jitter, or Retry-After if longer"""
+    delay = RETRY_BACKOFF * (2 ** attempt) + random.uniform(0, RETRY_JITTER)
+    try:
+        return max(delay, float(resp.headers.get("Retry-After") or 0))
+    except ValueError:
+        return delay
+
+
+def http_request(upstream, method, url, timeout=None, deadline=None, **kwargs):
+    """✅ Pooled, retried request to a named upstream within its concurrency cap
+
+    `timeout` is the read timeout in seconds (or a (connect, read) tuple).
+    With a deadline the timeout shrinks to the remaining budget, and
+    DeadlineExceeded is raised once it is spent.
+    Every attempt first waits for the upstream's rate token at the caller's
+    priority (see scheduler.py); 429/5xx answers are retried up to RETRY_TOTAL
+    times, after the bucket pause (429) or a backoff that fits the deadline.
+    Responses are gunzipped transparently. Every call is recorded in metrics.
+    """
+    for attempt in range(RETRY_TOTAL + 1):
+        resp = _send(upstream, method, url, timeout, deadline, **kwargs)
+        if resp.status_code not in RETRY_STATUSES or attempt == RETRY_TOTAL:
+            return resp
+        # 429: throttled() paused the bucket, so the next acquire() waits it out
+        delay = 0.0 if resp.status_code == 429 else _backoff(attempt, resp)
+        if deadline is not None and delay >= deadline.remaining():
+            return resp
+        print(f"🔁 {upstream} answered {resp.status_code}; retrying")
+        time.sleep(delay)
+
+
+def _send(upstream, method, url, timeout, deadline, **kwargs):
+    """One attempt: rate token, concurrency slot, request, metrics"""
+    session = get_session()
+    host = urlsplit(url).netloc
+    acquire(upstream, deadline)
+    with upstream_slot(upstream, deadline):
+        if deadline is not None:
+            timeout = deadline.timeout(timeout)
+        t0 = time.perf_counter()
+        try:
+            resp = session.request(method, url, timeout=_timeout(timeout), **kwargs)
+        except requests.Timeout:
+            record_upstream(upstream, host, method, "timeout", 0, time.perf_counter() - t0)
+            if deadline is not None and deadline.expired():
+                raise DeadlineExceeded(f"{upstream} call cut short by deadline")
+            raise
+        except requests.RequestException:
+            record_upstream(upstream, host, method, "error", 0, time.perf_counter() - t0)
+            raise
+        resp.upstream_seconds = time.perf_counter() - t0   # wire time, without the queue/slot wait
+        record_upstream(upstream, host, method, resp.status_code, len(resp.content), resp.upstream_seconds)
+        if resp.status_code == 429:
+            throttled(upstream, resp.headers.get("Retry-After"))
+        return resp
+
+
+def http_get(upstream, url, **kwargs):
+    return http_request(upstream, "GET", url, **kwargs)
+
+
+def http_post(upstream, url, **kwargs):
+    return http_request(upstream, "POST", url, **kwargs)
@@ -0,0 +1,356 @@
+# backend/local_osm.py
+"""Offline OSM store: ingest a local extract and answer our Overpass queries from it.
+
+The extract (.osm.pbf, .osm XML or a GeoJSON export) is loaded into SQLite
+with an R*Tree over element bounds. LocalOsm.query() evaluates the subset of
+Overpass QL this app sends - unions of node/way/relation statements with
+tag filters and a bbox or around:R filter, each followed by out ids/body/
+center/geom - and returns the same JSON shape as the Overpass API.
+
+    python local_osm.py ingest bengaluru.osm.pbf --db osm_extract.db
+"""
+import argparse
+import json
+import math
+import os
+import re
+import sqlite3
+import threading
+import xml.etree.ElementTree as ET
+
+from shapely.geometry import LineString, Point, box
+
+try:
+    import osmium
+except ImportError:  # only needed to ingest .osm.pbf
+    osmium = None
+
+OSM_EXTRACT_DB = os.environ.get("OSM_EXTRACT_DB", "osm_extract.db")
+INGEST_BATCH = 5000
+
+EARTH_M_PER_DEG = 6371000 * math.pi / 180
+TYPE_ORDER = {"node": 0, "way": 1, "relation": 2}
+
+_STATEMENT = re.compile(r"\b(node|way|relation)((?:\([^)]*\)|\[[^\]]*\])*)\s*;")
+_AROUND = re.compile(r"\(around:([\d.]+),([-\d.]+),([-\d.]+)\)")
+_BBOX = re.compile(r"\(([-\d.]+),([-\d.]+),([-\d.]+),([-\d.]+)\)")
+_FILTER = re.compile(r"\[([^\]]*)\]")
+_OUT = re.compile(r"\bout\s*(ids|body|center|geom)?\s*;")
+
+
+# ------------------------------------------------
+# STORE
+# ------------------------------------------------
+
+def _create(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS elements (
+            id INTEGER PRIMARY KEY,
+            type TEXT NOT NULL,
+            osm_id INTEGER NOT NULL,
+            tags TEXT NOT NULL,
+            geom TEXT NOT NULL
+        )
+    """)
+    conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS element_index USING rtree(id, minlat, maxlat, minlon, maxlon)")
+
+
+def _bounds(etype, geom):
+    if etype == "node":
+        return geom[0], geom[0], geom[1], geom[1]
+    pts = [p for line in (geom if etype == "relation" else [geom]) for p in line]
+    return min(p[0] for p in pts), max(p[0] for p in pts), min(p[1] for p in pts), max(p[1] for p in pts)
+
+
+class _Writer:
+    """Batched inserts into elements + element_index"""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.rows = []
+        self.count = 0
+
+    def add(self, etype, osm_id, tags, geom):
+        if not tags or not geom or (etype == "relation" and not any(geom)):
+            return
+        self.rows.append((etype, osm_id, tags, geom))
+        if len(self.rows) >= INGEST_BATCH:
+            self.flush()
+
+    def flush(self):
+        with self.conn:
+            for etype, osm_id, tags, geom in self.rows:
+                cur = self.conn.execute("INSERT INTO elements (type, osm_id, tags, geom) VALUES (?, ?, ?, ?)",
+                                        (etype, osm_id, json.dumps(tags), json.dumps(geom)))
+                self.conn.execute("INSERT INTO element_index VALUES (?, ?, ?, ?, ?)",
+                                  (cur.lastrowid, *_bounds(etype, geom)))
+        self.count += len(self.rows)
+        self.rows = []
+
+
+def _ingest_osm_xml(path, writer):
+    nodes, ways, relations = {}, {}, []
+    for _, el in ET.iterparse(path, events=("end",)):
+        tags = {t.get("k"): t.get("v") for t in el.findall("tag")}
+        if el.tag == "node":
+            nodes[int(el.get("id"))] = (float(el.get("lat")), float(el.get("lon")))
+            if tags:
+                writer.add("node", int(el.get("id")), tags, list(nodes[int(el.get("id"))]))
+        elif el.tag == "way":
+            line = [list(nodes[int(nd.get("ref"))]) for nd in el.findall("nd") if int(nd.get("ref")) in nodes]
+            ways[int(el.get("id"))] = line
+            writer.add("way", int(el.get("id")), tags, line)
+        elif el.tag == "relation":
+            refs = [int(m.get("ref")) for m in el.findall("member") if m.get("type") == "way"]
+            relations.append((int(el.get("id")), tags, refs))
+        if el.tag in ("node", "way", "relation"):
+            el.clear()
+    for rid, tags, refs in relations:
+        writer.add("relation", rid, tags, [ways[r] for r in refs if ways.get(r)])
+
+
+def _ingest_pbf(path, writer):
+    if osmium is None:
+        raise RuntimeError("Ingesting .osm.pbf needs pyosmium (pip install osmium)")
+
+    class Relations(osmium.SimpleHandler):
+        def __init__(self):
+            super().__init__()
+            self.members = set()
+            self.items = []
+
+        def relation(self, r):
+            tags = {t.k: t.v for t in r.tags}
+            if tags:
+                refs = [m.ref for m in r.members if m.type == "w"]
+                self.members.update(refs)
+                self.items.append((r.id, tags, refs))
+
+    class Elements(osmium.SimpleHandler):
+        def __init__(self, wanted):
+            super().__init__()
+            self.wanted = wanted
+            self.ways = {}
+
+        def node(self, n):
+            if len(n.tags):
+                writer.add("node", n.id, {t.k: t.v for t in n.tags}, [n.location.lat, n.location.lon])
+
+        def way(self, w):
+            line = [[nd.lat, nd.lon] for nd in w.nodes if nd.location.valid()]
+            writer.add("way", w.id, {t.k: t.v for t in w.tags}, line)
+            if w.id in self.wanted:
+                self.ways[w.id] = line
+
+    rels = Relations()
+    rels.apply_file(path)
+    elems = Elements(rels.members)
+    elems.apply_file(path, locations=True)
+    for rid, tags, refs in rels.items:
+        writer.add("relation", rid, tags, [elems.ways[r] for r in refs if elems.ways.get(r)])
+
+
+def _geojson_lines(geom):
+    t, c = geom["type"], geom["coordinates"]
+    if t == "Point":
+        return "node", [c[1], c[0]]
+    if t == "LineString":
+        return "way", [[p[1], p[0]] for p in c]
+    if t == "Polygon":
+        return "way", [[p[1], p[0]] for p in c[0]]
+    if t == "MultiLineString":
+        return "relation", [[[p[1], p[0]] for p in line] for line in c]
+    if t == "MultiPolygon":
+        return "relation", [[[p[1], p[0]] for p in poly[0]] for poly in c]
+    return None, None
+
+
+def _ingest_geojson(path, writer):
+    """Overpass-turbo / osmtogeojson exports: ids like "way/123", tags in properties"""
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    for i, feat in enumerate(data.get("features", [])):
+        if not feat.get("geometry"):
+            continue
+        kind, geom = _geojson_lines(feat["geometry"])
+        if kind is None:
+            continue
+        raw = dict(feat.get("properties") or {})
+        props = dict(raw.pop("tags", None) or {}, **{k: v for k, v in raw.items() if not k.startswith("@")})
+        ref = str(feat.get("id") or raw.get("@id") or props.get("id") or f"{kind}/{i}")
+        etype = kind
+        if "/" in ref:
+            etype, ref = ref.split("/", 1)
+        if (etype == "node") != (kind == "node") or (etype == "way" and kind == "relation"):
+            etype = kind
+        elif etype == "relation" and kind == "way":
+            geom = [geom]
+        props.pop("id", None)
+        writer.add(etype, int(re.sub(r"\D", "", ref) or i), {k: str(v) for k, v in props.items()}, geom)
+
+
+def ingest(path, db=OSM_EXTRACT_DB):
+    """✅ Load an extract into a fresh SQLite store; returns the element count"""
+    tmp = db + ".building"
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    conn = sqlite3.connect(tmp)
+    _create(conn)
+    writer = _Writer(conn)
+    lower = path.lower()
+    if lower.endswith(".pbf"):
+        _ingest_pbf(path, writer)
+    elif lower.endswith((".geojson", ".json")):
+        _ingest_geojson(path, writer)
+    else:
+        _ingest_osm_xml(path, writer)
+    writer.flush()
+    conn.close()
+    os.replace(tmp, db)
+    return writer.count
+
+
+# ------------------------------------------------
+# QUERY
+# ------------------------------------------------
+
+def _tag_filter(spec):
+    """Predicate for one [..] filter: key, key=value, key~regex (quotes optional)"""
+    m = re.match(r'\s*"?([^"=~!]+)"?\s*(?:(=|~)\s*"?(.*?)"?\s*)?$', spec)
+    key, op, value = m.group(1), m.group(2), m.group(3)
+    if op == "=":
+        return lambda tags: tags.get(key) == value
+    if op == "~":
+        rx = re.compile(value)
+        return lambda tags: key in tags and rx.search(tags[key]) is not None
+    return lambda tags: key in tags
+
+
+def _touches(etype, geom, xy, area):
+    """Does any part of the element's geometry intersect area (projected by xy)?"""
+    if etype == "node":
+        return area.intersects(Point(xy(geom)))
+    for line in (geom if etype == "relation" else [geom]):
+        pts = [xy(p) for p in line]
+        if pts and area.intersects(LineString(pts) if len(pts) > 1 else Point(pts[0])):
+            return True
+    return False
+
+
+class LocalOsm:
+    """Read-only view of an ingested store; one SQLite connection per thread"""
+
+    def __init__(self, db=OSM_EXTRACT_DB):
+        if not os.path.exists(db):
+            raise FileNotFoundError(f"OSM extract store {db} not found; run: python local_osm.py ingest <extract>")
+        self.db = db
+        self._local = threading.local()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(f"file:{self.db}?mode=ro", uri=True)
+        return conn
+
+    def _statement(self, etype, parts):
+        filters = [_tag_filter(f) for f in _FILTER.findall(parts)]
+        around = _AROUND.search(parts)
+        if around:
+            r, lat, lon = (float(v) for v in around.groups())
+            dlat = r / EARTH_M_PER_DEG
+            dlon = dlat / max(0.01, math.cos(math.radians(lat)))
+            s, w, n, e = lat - dlat, lon - dlon, lat + dlat, lon + dlon
+        else:
+            bbox = _BBOX.search(_AROUND.sub("", parts))
+            if bbox is None:
+                raise ValueError(f"Unsupported statement (needs bbox or around): {etype}{parts}")
+            s, w, n, e = (float(v) for v in bbox.groups())
+
+        rows = self._conn().execute(
+            "SELECT e.type, e.osm_id, e.tags, e.geom FROM element_index i JOIN elements e ON e.id = i.id "
+            "WHERE i.minlat <= ? AND i.maxlat >= ? AND i.minlon <= ? AND i.maxlon >= ? AND e.type = ?",
+            (n, s, e, w, etype)
+        ).fetchall()
+
+        if around:
+            kx = EARTH_M_PER_DEG * math.cos(math.radians(lat))
+            xy = lambda p: ((p[1] - lon) * kx, (p[0] - lat) * EARTH_M_PER_DEG)
+            area = Point(0, 0).buffer(r, 32)
+        else:
+            xy = lambda p: (p[1], p[0])
+            area = box(w, s, e, n)
+
+        for etype_, osm_id, tags, geom in rows:
+            tags = json.loads(tags)
+            if not all(f(tags) for f in filters):
+                continue
+            geom = json.loads(geom)
+            if _touches(etype_, geom, xy, area):
+                yield etype_, osm_id, tags, geom
+
+    def query(self, q):
+        """Overpass-style JSON for one of our queries: unions, each printed by the `out` after it"""
+        elements, start = [], 0
+        outs = list(_OUT.finditer(q))
+        for out in outs or [None]:
+            block = q[start:out.start()] if out else q
+            mode = (out.group(1) if out else None) or "body"
+            if out:
+                start = out.end()
+            elements += self._output(self._union(block), mode)
+        return {"version": 0.6, "generator": "local_osm", "elements": elements}
+
+    def _union(self, block):
+        found = {}
+        for etype, parts in _STATEMENT.findall(block):
+            for etype_, osm_id, tags, geom in self._statement(etype, parts):
+                found[(etype_, osm_id)] = (tags, geom)
+        return found
+
+    def _output(self, found, mode):
+        elements = []
+        for (etype, osm_id), (tags, geom) in sorted(found.items(), key=lambda kv: (TYPE_ORDER[kv[0][0]], kv[0][1])):
+            el = {"type": etype, "id": osm_id}
+            if mode == "ids":
+                elements.append(el)
+                continue
+            if etype == "node":
+                el["lat"], el["lon"] = geom
+            else:
+                minlat, maxlat, minlon, maxlon = _bounds(etype, geom)
+                if mode == "center":
+                    el["center"] = {"lat": (minlat + maxlat) / 2, "lon": (minlon + maxlon) / 2}
+                elif mode == "geom":
+                    el["bounds"] = {"minlat": minlat, "minlon": minlon, "maxlat": maxlat, "maxlon": maxlon}
+                    if etype == "way":
+                        el["geometry"] = [{"lat": p[0], "lon": p[1]} for p in geom]
+                    else:
+                        el["members"] = [{"type": "way", "role": "", "geometry": [{"lat": p[0], "lon": p[1]} for p in line]}
+                                         for line in geom]
+            el["tags"] = tags
+            elements.append(el)
+        return elements
+
+    def stats(self):
+        rows = self._conn().execute("SELECT type, COUNT(*) FROM elements GROUP BY type").fetchall()
+        return dict(rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline OSM store for DATA_SOURCE=local")
+    sub = parser.add_subparsers(dest="command", required=True)
+    ing = sub.add_parser("ingest", help="load a .osm.pbf, .osm or GeoJSON extract")
+    ing.add_argument("extract")
+    ing.add_argument("--db", default=OSM_EXTRACT_DB)
+    sub.add_parser("stats", help="element counts in the store").add_argument("--db", default=OSM_EXTRACT_DB)
+    args = parser.parse_args(argv)
+
+    if args.command == "ingest":
+        print(f"📥 Ingesting {args.extract} into {args.db}...")
+        print(f"✅ Stored {ingest(args.extract, args.db)} tagged elements")
+    else:
+        print(LocalOsm(args.db).stats())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+# backend/metrics.py
+"""Hot-path instrumentation: stage/upstream spans, cache counters and per-request traces.
+
+Everything is recorded twice: into process-wide counters and histograms
+(rendered for Prometheus by /metrics) and into the current request's trace,
+a summary of where that request spent its time (/traces, ?timings=1).
+The trace follows work onto TracedExecutor pools via contextvars.
+"""
+import contextvars
+import functools
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+PREFIX = "urbaninfra"
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+RECENT_TRACES = 50
+
+_lock = threading.Lock()
+_counters = defaultdict(float)     # (name, labels) -> value
+_histograms = {}                   # (name, labels) -> [bucket counts..., sum, count]
+_gauges = {}                       # name -> fn() returning [(labels, value)] at scrape time
+_help = {}
+_recent = deque(maxlen=RECENT_TRACES)
+_current = contextvars.ContextVar("trace", default=None)
+
+
+# ------------------------------------------------
+# REGISTRY
+# ------------------------------------------------
+
+def _labels(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def inc(name, value=1, help_text="", **labels):
+    _help.setdefault(name, (help_text, "counter"))
+    with _lock:
+        _counters[(name, _labels(labels))] += value
+
+
+def observe(name, value, help_text="", **labels):
+    _help.setdefault(name, (help_text, "histogram"))
+    with _lock:
+        h = _histograms.get((name, _labels(labels)))
+        if h is None:
+            h = _histograms[(name, _labels(labels))] = [0] * (len(BUCKETS) + 2)
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                h[i] += 1
+        h[-2] += value
+        h[-1] += 1
+
+
+def gauge(name, help_text, fn):
+    """Register a gauge read at scrape time; fn() returns [(labels dict, value)]"""
+    _help[name] = (help_text, "gauge")
+    _gauges[name] = fn
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _fmt_labels(labels, extra=()):
+    items = list(labels) + list(extra)
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in items) + "}"
+
+
+def render():
+    """Prometheus text exposition of every counter and histogram"""
+    with _lock:
+        counters = dict(_counters)
+        histograms = {k: list(v) for k, v in _histograms.items()}
+    lines = []
+    for name in sorted(_help):
+        help_text, kind = _help[name]
+        full = f"{PREFIX}_{name}"
+        lines.append(f"# HELP {full} {help_text}")
+        lines.append(f"# TYPE {full} {kind}")
+        if kind == "gauge":
+            for labels, value in _gauges[name]():
+                lines.append(f"{full}{_fmt_labels(_labels(labels))} {value:g}")
+            continue
+        if kind == "counter":
+            for (n, labels), value in sorted(counters.items()):
+                if n == name:
+                    lines.append(f"{full}{_fmt_labels(labels)} {value:g}")
+            continue
+        for (n, labels), h in sorted(histograms.items()):
+            if n != name:
+                continue
+            for bound, count in zip(BUCKETS, h):
+                lines.append(f"{full}_bucket{_fmt_labels(labels, [('le', f'{bound:g}')])} {count}")
+            lines.append(f"{full}_bucket{_fmt_labels(labels, [('le', '+Inf')])} {h[-1]}")
+            lines.append(f"{full}_sum{_fmt_labels(labels)} {h[-2]:.6f}")
+            lines.append(f"{full}_count{_fmt_labels(labels)} {h[-1]}")
+    return "\n".join(lines) + "\n"
+
+
+# ------------------------------------------------
+# TRACES
+# ------------------------------------------------
+
+class Trace:
+    """Where one request spent its time; stage times add up across parallel workers"""
+
+    def __init__(self, route):
+        self.route = route
+        self.started = time.perf_counter()
+        self.stages = defaultdict(lambda: [0, 0.0])
+        self.upstream = defaultdict(lambda: {"calls": 0, "errors": 0, "bytes": 0, "ms": 0.0})
+        self.cache = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def add_stage(self, stage, seconds):
+        with self._lock:
+            s = self.stages[stage]
+            s[0] += 1
+            s[1] += seconds
+
+    def add_upstream(self, upstream, ok, nbytes, seconds):
+        with self._lock:
+            u = self.upstream[upstream]
+            u["calls"] += 1
+            u["errors"] += 0 if ok else 1
+            u["bytes"] += nbytes
+            u["ms"] += seconds * 1000
+
+    def add_cache(self, cache, result):
+        with self._lock:
+            self.cache[f"{cache}.{result}"] += 1
+
+    def summary(self):
+        with self._lock:
+            return {
+                "route": self.route,
+                "total_ms": round((time.perf_counter() - self.started) * 1000, 1),
+                "stages": {k: {"count": c, "ms": round(s * 1000, 1)} for k, (c, s) in self.stages.items()},
+                "upstream": {k: dict(v, ms=round(v["ms"], 1)) for k, v in self.upstream.items()},
+                "cache": dict(self.cache)
+            }
+
+
+def current_trace():
+    return _current.get()
+
+
+@contextmanager
+def trace(route):
+    """Trace one request; its summary goes to the request histogram and /traces"""
+    t = Trace(route)
+    token = _current.set(t)
+    try:
+        yield t
+    finally:
+        try:
+            _current.reset(token)
+        except ValueError:
+            pass  # streaming generator closed from another context
+        summary = t.summary()
+        observe("request_seconds", summary["total_ms"] / 1000, "End-to-end request time", route=route)
+        with _lock:
+            _recent.append(summary)
+        upstream = ", ".join(f"{k}×{v['calls']}" for k, v in summary["upstream"].items()) or "no upstream"
+        print(f"⏱️ {route} {summary['total_ms']:.0f} ms ({upstream})")
+
+
+def recent_traces():
+    with _lock:
+        return list(_recent)
+
+
+class TracedExecutor(ThreadPoolExecutor):
+    """Thread pool whose tasks run in the submitter's context, so spans land in its trace"""
+
+    def submit(self, fn, *args, **kwargs):
+        return super().submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+# ------------------------------------------------
+# SPANS AND COUNTERS
+# ------------------------------------------------
+
+@contextmanager
+def span(stage):
+    """Time a pipeline stage (histogram + current trace)"""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        dt = time.perf_counter() - t0
+        observe("stage_seconds", dt, "Time spent per pipeline stage", stage=stage)
+        t = _current.get()
+        if t is not None:
+            t.add_stage(stage, dt)
+
+
+def timed(stage):
+    """Decorator form of span()"""
+    def wrap(fn):
+        @functools.wraps(fn)
+        def inner(*args, **kwargs):
+            with span(stage):
+                return fn(*args, **kwargs)
+        return inner
+    return wrap
+
+
+def record_upstream(upstream, host, method, status, nbytes, seconds):
+    """One upstream HTTP call; status is the HTTP code or "timeout"/"error" """
+    inc("upstream_requests_total", help_text="Upstream HTTP calls", upstream=upstream, host=host,
+        method=method, status=status)
+    inc("upstream_bytes_total", nbytes, help_text="Upstream response bytes", upstream=upstream)
+    observe("upstream_seconds", seconds, "Upstream call duration", upstream=upstream)
+    t = _current.get()
+    if t is not None:
+        t.add_upstream(upstream, isinstance(status, int) and status < 400, nbytes, seconds)
+
+
+def count_cache(cache, result):
+    """Cache lookup outcome: hit, miss or expired"""
+    inc("cache_lookups_total", help_text="Cache lookups by outcome", cache=cache, result=result)
+    t = _current.get()
+    if t is not None:
+        t.add_cache(cache, result)
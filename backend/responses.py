@@ -0,0 +1,180 @@
+# backend/responses.py
+"""Compact, cacheable JSON responses: field projection, validators, MessagePack and compression.
+
+    /recommend?place=...&fields=map              only what the map draws per candidate
+    /recommend?place=...&fields=lat,lon,score    any candidate keys
+    /recommend?place=...&format=msgpack          (or Accept: application/msgpack)
+
+Responses carry a weak ETag - derived from the cache entry when the result
+came from one, else from the body - and Last-Modified when the entry's write
+time is known, so repeat requests get 304 Not Modified. Bodies are gzip- or
+brotli-compressed per Accept-Encoding; NDJSON streams are gzipped with a
+flush after every event so progress still arrives as it happens.
+brotli and msgpack are optional: without them those encodings are not offered.
+"""
+import gzip
+import hashlib
+import zlib
+from datetime import datetime, timezone
+
+from flask import Response, current_app, jsonify, request
+from werkzeug.http import is_resource_modified
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# ?fields= shorthands; anything else is a comma list of candidate keys
+FIELD_PRESETS = {
+    "map": ("lat", "lon", "score", "rank", "reason", "completeness", "imputed"),
+    "pins": ("lat", "lon", "score", "rank")
+}
+CANDIDATE_LISTS = ("good", "danger", "candidates")
+MSGPACK_TYPES = ("application/msgpack", "application/x-msgpack")
+COMPRESSIBLE = {"application/json", "application/x-ndjson", "application/msgpack", "text/plain"}
+COMPRESS_MIN_BYTES = 512    # below this the headers cost more than they save
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5          # 11 is several times slower for a few % on JSON
+
+
+# ------------------------------------------------
+# PROJECTION
+# ------------------------------------------------
+
+def parse_fields(spec):
+    """?fields= value → tuple of candidate keys (None keeps everything)"""
+    if not spec:
+        return None
+    if spec in FIELD_PRESETS:
+        return FIELD_PRESETS[spec]
+    return tuple(dict.fromkeys(f.strip() for f in spec.split(",") if f.strip())) or None
+
+
+def _pick(candidate, fields):
+    return {k: candidate[k] for k in fields if k in candidate}
+
+
+def project(payload, fields):
+    """Keep only `fields` on every candidate in a result, batch or stream event"""
+    if not fields or not isinstance(payload, dict):
+        return payload
+    out = dict(payload)   # cached results are shared between requests
+    for key in CANDIDATE_LISTS:
+        if isinstance(out.get(key), list):
+            out[key] = [_pick(c, fields) for c in out[key]]
+    if isinstance(out.get("candidate"), dict):
+        out["candidate"] = _pick(out["candidate"], fields)
+    if isinstance(out.get("results"), dict):
+        out["results"] = {k: project(v, fields) for k, v in out["results"].items()}
+    return out
+
+
+# ------------------------------------------------
+# ENCODING AND VALIDATORS
+# ------------------------------------------------
+
+def response_format():
+    """"msgpack" when asked for (?format=msgpack or Accept), else "json" """
+    fmt = request.args.get("format")
+    if fmt is None and request.accept_mimetypes.best_match(("application/json",) + MSGPACK_TYPES) in MSGPACK_TYPES:
+        fmt = "msgpack"
+    return "msgpack" if fmt == "msgpack" else "json"
+
+
+def make_etag(*parts):
+    return hashlib.sha1("|".join(str(p) for p in parts).encode()).hexdigest()[:32]
+
+
+def respond(payload, etag=None, last_modified=None):
+    """✅ Projected, encoded, validated response for a JSON-able payload
+
+    etag: a version tag for the payload (e.g. cache key + write time), so a
+    matching If-None-Match is answered before anything is serialized; without
+    one the ETag is a hash of the body. last_modified: epoch seconds.
+    """
+    fmt = response_format()
+    if fmt == "msgpack" and msgpack is None:
+        return jsonify({"error": "MessagePack is not available on this server"}), 406
+    fields = parse_fields(request.args.get("fields"))
+    if last_modified is not None:
+        last_modified = datetime.fromtimestamp(int(last_modified), timezone.utc)
+
+    if etag is not None:
+        etag = make_etag(etag, fmt, ",".join(fields or ()))
+        if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+            resp = Response(status=304)
+            return _validators(resp, etag, last_modified)
+
+    payload = project(payload, fields)
+    if fmt == "msgpack":
+        resp = Response(msgpack.packb(payload, use_bin_type=True), mimetype="application/msgpack")
+    else:
+        resp = Response(current_app.json.dumps(payload) + "\n", mimetype="application/json")
+    if etag is None:
+        etag = make_etag(resp.get_data())
+    return _validators(resp, etag, last_modified).make_conditional(request)
+
+
+def _validators(resp, etag, last_modified):
+    # Weak: the compressed and identity bodies differ byte-wise but not in meaning
+    resp.set_etag(etag, weak=True)
+    if last_modified is not None:
+        resp.last_modified = last_modified
+    resp.headers["Cache-Control"] = "no-cache"   # cacheable, but revalidate every time
+    resp.vary.add("Accept")
+    return resp
+
+
+# ------------------------------------------------
+# COMPRESSION
+# ------------------------------------------------
+
+def _gzip_stream(chunks):
+    """gzip a streamed body, flushing after each chunk so events aren't held back"""
+    z = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+    try:
+        for chunk in chunks:
+            data = z.compress(chunk if isinstance(chunk, bytes) else chunk.encode())
+            yield data + z.flush(zlib.Z_SYNC_FLUSH)
+        yield z.flush()
+    finally:
+        # Client gone: close the pipeline generator now, not whenever it's collected
+        close = getattr(chunks, "close", None)
+        if close is not None:
+            close()
+
+
+def compress_response(resp):
+    """after_request hook: gzip/brotli per Accept-Encoding"""
+    if (resp.mimetype not in COMPRESSIBLE or resp.status_code < 200 or resp.status_code in (204, 304)
+            or resp.direct_passthrough or "Content-Encoding" in resp.headers):
+        return resp
+    resp.vary.add("Accept-Encoding")
+
+    if resp.is_streamed:
+        if request.accept_encodings.best_match(("gzip",)) != "gzip":
+            return resp
+        resp.response = _gzip_stream(resp.response)
+        resp.headers["Content-Encoding"] = "gzip"
+        resp.headers.pop("Content-Length", None)
+        return resp
+
+    offered = ("br", "gzip") if brotli is not None else ("gzip",)
+    encoding = request.accept_encodings.best_match(offered)
+    if encoding is None:
+        return resp
+    data = resp.get_data()
+    if len(data) < COMPRESS_MIN_BYTES:
+        return resp
+    if encoding == "br":
+        resp.set_data(brotli.compress(data, quality=BROTLI_QUALITY))
+    else:
+        resp.set_data(gzip.compress(data, GZIP_LEVEL, mtime=0))
+    resp.headers["Content-Encoding"] = encoding
+    return resp
@@ -0,0 +1,204 @@
+# backend/scheduler.py
+"""Priority-aware rate scheduler: one token bucket and wait queue per upstream.
+
+Each upstream's bucket refills at its sustained rate (Nominatim's usage
+policy is 1 req/s; Overpass throttles per IP). Callers queue in priority
+order - interactive before batch before background, FIFO within a class -
+and a queued call whose deadline would pass before its turn is shed at once
+with DeadlineExceeded instead of stalling the request.
+
+Batch and background calls are also paced to a share of the rate
+(RATE_SHARES), so tile refresh and cache warming never drain a bucket:
+an autocomplete arriving mid-cycle still finds tokens refilling for it.
+
+    UPSTREAM_RATE_OVERPASS=2:4        # requests per second[:burst], per upstream (default 2:4)
+    BATCH_RATE_SHARE=0.75             # share of each upstream's rate bulk jobs may use (default)
+    BACKGROUND_RATE_SHARE=0.5         # share warming and tile refresh may use (default)
+"""
+import contextvars
+import heapq
+import itertools
+import os
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from deadline import DeadlineExceeded
+from metrics import current_trace, gauge, inc, observe
+
+PRIORITIES = {"interactive": 0, "batch": 1, "background": 2}
+
+# (requests per second, burst) per upstream; UPSTREAM_RATE_<NAME>="rate[:burst]" overrides.
+# Extra endpoints ("overpass@mirror.host") get their own bucket at the same rate.
+UPSTREAM_RATES = {
+    "nominatim": (1.0, 1),
+    "overpass": (2.0, 4),
+    "photon": (5.0, 5),
+    "openweather": (1.0, 10)    # free tier: 60 calls/minute
+}
+# Most of an upstream's rate a non-interactive class may use; interactive is never paced
+RATE_SHARES = {
+    "interactive": 1.0,
+    "batch": float(os.environ.get("BATCH_RATE_SHARE", "0.75")),
+    "background": float(os.environ.get("BACKGROUND_RATE_SHARE", "0.5"))
+}
+THROTTLED_PAUSE_S = 2.0     # bucket pause after a 429 without Retry-After
+RECHECK_S = 0.5             # queued callers re-estimate their turn at least this often
+
+_priority = contextvars.ContextVar("priority", default="interactive")
+
+
+@contextmanager
+def priority(name):
+    """Run upstream calls made inside the block (and on TracedExecutor pools) at this priority"""
+    token = _priority.set(name)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority():
+    return _priority.get()
+
+
+def _configured_rate(name):
+    base = name.split("@")[0]
+    env = os.environ.get(f"UPSTREAM_RATE_{base.upper()}")
+    if not env:
+        return UPSTREAM_RATES.get(base, (10.0, 10))
+    rate, _, burst = env.partition(":")
+    return float(rate), float(burst) if burst else max(1.0, float(rate))
+
+
+class UpstreamQueue:
+    """Token bucket plus a priority queue of callers waiting for tokens"""
+
+    def __init__(self, name, rate, burst):
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.stamp = time.monotonic()
+        self.paused_until = 0.0
+        self.class_ready = {}       # priority → monotonic time its next token may be granted
+        self.granted = Counter()
+        self.shed = Counter()
+        self.waited_s = Counter()
+        self._waiting = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+
+    def _ready_in(self, now, prio="interactive"):
+        """Seconds until the next token is available to a caller of this priority"""
+        self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+        refill = 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+        return max(refill, self.paused_until - now, self.class_ready.get(prio, 0.0) - now)
+
+    def _grant(self, prio, now):
+        self.tokens -= 1
+        share = RATE_SHARES.get(prio, 1.0)
+        if share < 1:
+            self.class_ready[prio] = now + 1 / (self.rate * share)
+
+    def acquire(self, prio, deadline=None):
+        """Block until it's this call's turn and a token is free; returns seconds waited"""
+        entry = (PRIORITIES.get(prio, 0), next(self._seq))
+        t0 = time.monotonic()
+        with self._cond:
+            heapq.heappush(self._waiting, entry)
+            try:
+                while True:
+                    now = time.monotonic()
+                    ready_in = self._ready_in(now, prio)
+                    head = self._waiting[0] == entry
+                    if head and ready_in <= 0:
+                        self._grant(prio, now)
+                        self.granted[prio] += 1
+                        self.waited_s[prio] += now - t0
+                        return now - t0
+                    timeout = ready_in if head else RECHECK_S
+                    if deadline is not None:
+                        ahead = sum(1 for e in self._waiting if e < entry)
+                        if ready_in + ahead / self.rate > deadline.remaining():
+                            self.shed[prio] += 1
+                            raise DeadlineExceeded(f"{self.name} call shed: {ahead} queued ahead of it")
+                        timeout = min(timeout, deadline.remaining())
+                    self._cond.wait(max(timeout, 0.001))
+            finally:
+                self._waiting.remove(entry)
+                heapq.heapify(self._waiting)
+                self._cond.notify_all()
+
+    def pause(self, seconds):
+        """Upstream said slow down: no tokens for `seconds`"""
+        with self._cond:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.tokens = 0
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            queued = Counter(p for p, _ in self._waiting)
+            return {
+                "rate": self.rate,
+                "burst": self.burst,
+                "queued": {name: queued.get(rank, 0) for name, rank in PRIORITIES.items()},
+                "granted": dict(self.granted),
+                "shed": dict(self.shed),
+                "avg_wait_ms": {p: round(self.waited_s[p] / n * 1000, 1) for p, n in self.granted.items() if n},
+                "paused_s": round(max(0.0, self.paused_until - time.monotonic()), 2)
+            }
+
+
+_queues = {name: UpstreamQueue(name, *_configured_rate(name)) for name in UPSTREAM_RATES}
+_queues_lock = threading.Lock()
+
+
+def _queue(upstream):
+    q = _queues.get(upstream)
+    if q is None:
+        with _queues_lock:
+            q = _queues.setdefault(upstream, UpstreamQueue(upstream, *_configured_rate(upstream)))
+    return q
+
+
+def acquire(upstream, deadline=None):
+    """✅ Wait for a rate token for one call to `upstream` at the current priority"""
+    prio = current_priority()
+    try:
+        waited = _queue(upstream).acquire(prio, deadline)
+    except DeadlineExceeded:
+        inc("upstream_shed_total", help_text="Queued upstream calls shed before their deadline",
+            upstream=upstream, priority=prio)
+        raise
+    observe("upstream_queue_seconds", waited, "Time queued for an upstream rate token",
+            upstream=upstream, priority=prio)
+    t = current_trace()
+    if t is not None and waited > 0:
+        t.add_stage(f"queue.{upstream}", waited)
+    return waited
+
+
+def throttled(upstream, retry_after=None):
+    """Pause the upstream's bucket after a 429 (Retry-After seconds when given)"""
+    try:
+        seconds = float(retry_after) if retry_after else THROTTLED_PAUSE_S
+    except ValueError:
+        seconds = THROTTLED_PAUSE_S
+    print(f"🚦 {upstream} throttled us; pausing {seconds:g}s")
+    _queue(upstream).pause(seconds)
+
+
+def scheduler_stats():
+    return {name: q.stats() for name, q in sorted(_queues.items())}
+
+
+def _queue_depths():
+    return [({"upstream": name, "priority": p}, n)
+            for name, stats in scheduler_stats().items() for p, n in stats["queued"].items()]
+
+
+gauge("upstream_queue_depth", "Calls waiting for an upstream rate token", _queue_depths)
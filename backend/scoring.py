@@ -0,0 +1,195 @@
+# backend/scoring.py
+"""Columnar (candidates x criteria) scoring and ranking on NumPy."""
+import numpy as np
+
+SCORE_KEYS = ["accessibility", "population_need", "lake_protection", "green_balance", "pollution_risk", "redundancy"]
+
+DEFAULT_WEIGHTS = {
+    "accessibility": 0.16,
+    "population_need": 0.22,
+    "lake_protection": 0.20,
+    "green_balance": 0.16,
+    "pollution_risk": 0.14,
+    "redundancy": 0.12
+}
+
+WEIGHT_PROFILES = {
+    "default": DEFAULT_WEIGHTS,
+    "accessibility_first": {
+        "accessibility": 0.32,
+        "population_need": 0.24,
+        "lake_protection": 0.14,
+        "green_balance": 0.10,
+        "pollution_risk": 0.10,
+        "redundancy": 0.10
+    },
+    "environment_first": {
+        "accessibility": 0.10,
+        "population_need": 0.14,
+        "lake_protection": 0.26,
+        "green_balance": 0.24,
+        "pollution_risk": 0.18,
+        "redundancy": 0.08
+    },
+    "coverage_first": {
+        "accessibility": 0.14,
+        "population_need": 0.30,
+        "lake_protection": 0.16,
+        "green_balance": 0.10,
+        "pollution_risk": 0.10,
+        "redundancy": 0.20
+    }
+}
+
+
+def raw_score_columns(infra_type, pop, dist_road, near_lake, green_pct, aqi, dist_same):
+    """Per-criterion raw scores; inputs may be scalars or equal-length arrays
+
+    This is the single definition of the compute_candidate_metrics criteria,
+    shared by per-candidate scoring and the vectorized heatmap.
+    """
+    pop = np.asarray(pop, dtype=np.float64)
+    dist_road = np.asarray(dist_road, dtype=np.float64)
+    near_lake = np.asarray(near_lake, dtype=bool)
+    green = np.nan_to_num(np.asarray(green_pct, dtype=np.float64))  # None -> nan -> 0
+    aqi = np.asarray(aqi)
+    dist_same = np.asarray(dist_same, dtype=np.float64)
+
+    scores = {
+        "accessibility": np.maximum(0.0, 1 - (dist_road / 2000.0)),
+        "population_need": np.minimum(1.0, pop / 200.0),
+        "lake_protection": np.where(near_lake, 0.0, 1.0),
+        "green_balance": np.minimum(1.0, green / 40.0),
+        "pollution_risk": np.where(aqi <= 2, 1.0, np.where(aqi == 3, 0.5, 0.0)),
+        "redundancy": np.maximum(0.0, 1 - (dist_same / 3000.0))
+    }
+
+    infra = infra_type.lower()
+    if infra in ["hospital", "clinic", "pharmacy"]:
+        scores["accessibility"] = np.maximum(scores["accessibility"], 1 - (dist_road / 1500.0))
+        scores["pollution_risk"] = np.where(aqi >= 4, 0.0, scores["pollution_risk"])
+        scores["lake_protection"] = np.where(near_lake, 0.0, scores["lake_protection"])
+
+    if infra == "school":
+        scores["population_need"] = np.minimum(1.0, pop / 120.0)
+        scores["pollution_risk"] = np.where(aqi >= 4, 0.0, scores["pollution_risk"])
+        scores["accessibility"] = np.where(dist_road < 40, scores["accessibility"] * 0.6, scores["accessibility"])
+
+    if infra == "park":
+        scores["green_balance"] = np.minimum(1.0, green / 20.0)
+        scores["pollution_risk"] = np.where(aqi >= 4, 0.0, scores["pollution_risk"])
+
+    return scores
+
+
+def parse_weights(spec):
+    """Weights from a profile name or "key:value,key:value" (None -> defaults)
+
+    Unlisted criteria get weight 0. Raises ValueError on unknown keys/values.
+    """
+    if not spec:
+        return DEFAULT_WEIGHTS
+    if spec in WEIGHT_PROFILES:
+        return WEIGHT_PROFILES[spec]
+
+    weights = {}
+    for part in spec.split(","):
+        key, sep, value = part.partition(":")
+        key = key.strip()
+        if not sep or key not in SCORE_KEYS:
+            raise ValueError(f"Unknown weight '{part}'")
+        weights[key] = float(value)
+        if not np.isfinite(weights[key]) or weights[key] < 0:
+            raise ValueError(f"Invalid weight for {key}")
+    return weights
+
+
+def weights_signature(weights):
+    """Stable text form of a weight set ("" for the defaults)"""
+    if weights == DEFAULT_WEIGHTS:
+        return ""
+    return ",".join(f"{k}:{weights.get(k, 0.0):g}" for k in SCORE_KEYS)
+
+
+def score_matrix(candidates, keys=SCORE_KEYS):
+    """candidates x criteria matrix of raw scores"""
+    m = np.zeros((len(candidates), len(keys)), dtype=np.float64)
+    for i, c in enumerate(candidates):
+        raw = c["raw_scores"]
+        for j, k in enumerate(keys):
+            m[i, j] = raw.get(k, 0.0)
+    return m
+
+
+def weighted_scores(matrix, weights, keys=SCORE_KEYS):
+    """Min-max normalize each column and take the weighted sum (0-100)
+
+    A column with no spread keeps its raw values. Columns are accumulated one
+    at a time so results are bit-identical to the scalar loop.
+    """
+    if matrix.shape[0] == 0:
+        return np.zeros(0)
+    mn = matrix.min(axis=0)
+    span = matrix.max(axis=0) - mn
+    flat = span <= 1e-9
+    norm = np.where(flat, matrix, (matrix - mn) / np.where(flat, 1.0, span))
+
+    score = np.zeros(matrix.shape[0])
+    for j, k in enumerate(keys):
+        score += weights.get(k, 0.0) * norm[:, j]
+    return score * 100
+
+
+def top_k_indices(values, k=None):
+    """Indices of the k largest values, highest first, ties by input order"""
+    n = len(values)
+    if k is None or k >= n:
+        return np.argsort(-values, kind="stable")
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64)
+    kth = -np.partition(-values, k - 1)[k - 1]
+    above = np.flatnonzero(values > kth)
+    ties = np.flatnonzero(values == kth)[:k - len(above)]
+    picked = np.concatenate([above, ties])
+    return picked[np.lexsort((picked, -values[picked]))]
+
+
+def impute_missing_scores(candidates, keys=SCORE_KEYS):
+    """Replace raw scores listed in a candidate's "imputed" with the median of
+    the candidates that did measure that criterion (0.0 if none did)"""
+    for k in keys:
+        holes = [c for c in candidates if k in c.get("imputed", ())]
+        if not holes:
+            continue
+        known = [c["raw_scores"][k] for c in candidates if k not in c.get("imputed", ())]
+        fill = float(np.median(known)) if known else 0.0
+        for c in holes:
+            c["raw_scores"][k] = fill
+
+
+def rank_candidates(candidates, weights=None, topk=3):
+    """Score every candidate and return the top-k, highest first
+
+    Sets "score" on every candidate and "rank" plus the rank prefix on the
+    reason of the returned ones (all of them when topk is None). Criteria a
+    candidate lacks (deadline-bounded runs) are imputed first.
+    """
+    weights = weights or DEFAULT_WEIGHTS
+    impute_missing_scores(candidates)
+    scores = weighted_scores(score_matrix(candidates), weights)
+    for c, s in zip(candidates, scores):
+        c["score"] = float(s)
+
+    order = top_k_indices(scores, topk)
+    ranked = [candidates[i] for i in order]
+    for i, cand in enumerate(ranked):
+        rank = i + 1
+        cand["rank"] = rank
+        cand["reason"] = f"🏆 Rank {rank} - Score: {cand['score']:.0f}/100. {cand['reason']}"
+    return ranked
+
+
+def danger_candidates(candidates, k=2):
+    """Top-k candidates by danger_score, highest first"""
+    danger = np.array([c.get("danger_score", 0.0) for c in candidates], dtype=np.float64)
+    return [candidates[i] for i in top_k_indices(danger, k)]
@@ -0,0 +1,93 @@
+# backend/singleflight.py
+"""Coalesce identical in-flight work: concurrent callers share one execution."""
+import threading
+
+from deadline import DeadlineExceeded
+
+
+class FlightAbandoned(RuntimeError):
+    """The leader stopped (e.g. its client disconnected) without a result"""
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.finished = False
+        self.followers = 0
+
+    def wait(self, timeout=None):
+        """Leader's result; re-raises its error. Shared results are read-only."""
+        if not self.done.wait(timeout):
+            raise DeadlineExceeded("in-flight computation did not finish before deadline")
+        if self.error is not None:
+            raise self.error
+        if not self.finished:
+            raise FlightAbandoned("in-flight computation was abandoned")
+        return self.result
+
+
+class SingleFlight:
+    """Per-key in-flight registry shared by every thread in the worker
+
+    do() is the one-call form; begin()/finish() let a generator lead a flight
+    across several yields.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.shared = 0
+
+    def begin(self, key):
+        """(call, is_leader): the leader must call finish(); followers call call.wait()"""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.followers += 1
+                self.shared += 1
+                return call, False
+            call = self._calls[key] = _Call()
+            self.leaders += 1
+            return call, True
+
+    def finish(self, key, call, result=None, error=None, ok=True):
+        """Publish the leader's outcome (ok=False: abandoned) and wake followers"""
+        with self._lock:
+            if self._calls.get(key) is call:
+                del self._calls[key]
+        call.result, call.error, call.finished = result, error, ok and error is None
+        call.done.set()
+
+    def do(self, key, fn, timeout=None):
+        """fn() once per key among concurrent callers
+
+        A follower takes over when the leader gave up on its own deadline or
+        was abandoned, since that failure says nothing about this caller.
+        """
+        while True:
+            call, leader = self.begin(key)
+            if leader:
+                try:
+                    result = fn()
+                except BaseException as e:
+                    self.finish(key, call, error=e)
+                    raise
+                self.finish(key, call, result=result)
+                return result
+            try:
+                return call.wait(timeout)
+            except FlightAbandoned:
+                continue
+            except DeadlineExceeded:
+                if call.done.is_set() and call.error is not None:
+                    continue
+                raise
+
+    def stats(self):
+        with self._lock:
+            inflight = len(self._calls)
+        return {"leaders": self.leaders, "shared": self.shared, "inflight": inflight}
@@ -0,0 +1,64 @@
+# backend/tests/conftest.py
+"""Tests import the backend's flat modules directly; run from backend/ with `python -m pytest tests`."""
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("CACHE_WARMING", "0")   # importing app must not start the warmer thread
+
+
+@pytest.fixture(autouse=True)
+def in_tmp_dir(tmp_path, monkeypatch):
+    """Caches and job files are created relative to the cwd"""
+    monkeypatch.chdir(tmp_path)
+
+
+@pytest.fixture
+def fresh_cache(monkeypatch):
+    """A new cache database in the test's cwd and an empty in-process LRU"""
+    import cache
+    monkeypatch.setattr(cache, "_local", threading.local())
+    monkeypatch.setattr(cache, "_lru", OrderedDict())
+    monkeypatch.setattr(cache, "_lru_generation", None)
+    monkeypatch.setattr(cache, "_lru_synced", 0.0)
+    monkeypatch.setattr(cache, "_usage_pending", {})
+    monkeypatch.setattr(cache, "LRU_SYNC_S", 0.0)   # sync on every read unless a test says otherwise
+
+
+SITES = [{"lat": 12.9 + i * 0.001, "lon": 77.6, "reason": f"site {i}"} for i in range(4)]
+
+
+@pytest.fixture
+def pipeline(monkeypatch):
+    """/recommend with its upstream steps replaced
+
+    SITES score higher the further north they are on every criterion but
+    "redundancy", which runs the other way.
+
+    state["enriched"] counts metric lookups; set state["hold"] to an Event to
+    hold enrichment back until it is set.
+    """
+    import app
+    import utils_geo
+    from scoring import SCORE_KEYS
+    state = {"enriched": 0, "hold": None}
+
+    def metrics(candidate, infra_type, origin=(0, 0), layers=None, base=None, deadline=None):
+        if state["hold"] is not None:
+            state["hold"].wait(5)
+        state["enriched"] += 1
+        score = candidate["lat"] - 12.9
+        raw_scores = dict(dict.fromkeys(SCORE_KEYS, score), redundancy=-score)
+        return {"raw_scores": raw_scores, "completeness": {"pop": True},
+                "imputed": [], "reason": candidate["reason"]}
+
+    monkeypatch.setattr(app, "prefetch_area", lambda *a: [])
+    monkeypatch.setattr(app, "overpass_candidates_near", lambda *a, **k: [dict(s) for s in SITES])
+    monkeypatch.setattr(app, "lookup_base_metrics", lambda cs, deadline=None: [None] * len(cs))
+    monkeypatch.setattr(app, "fetch_metric_layers", lambda *a, **k: None)
+    monkeypatch.setattr(utils_geo, "compute_candidate_metrics", metrics)
+    return state
@@ -0,0 +1,90 @@
+import pytest
+
+import utils_geo
+
+
+def fail(*args, **kwargs):
+    raise ConnectionError("upstream down")
+
+
+@pytest.fixture
+def cached_cells(monkeypatch):
+    cells = []
+    monkeypatch.setattr(utils_geo, "set_cell_metrics", lambda lat, lon, base: cells.append(base))
+    monkeypatch.setattr(utils_geo, "buildings_count_proxy", lambda *a: 42.0)
+    monkeypatch.setattr(utils_geo, "distance_to_nearest_road", lambda *a: 120.0)
+    monkeypatch.setattr(utils_geo, "lake_proximity", lambda *a: (900.0, False))
+    monkeypatch.setattr(utils_geo, "green_proxy", lambda *a: 30.0)
+    monkeypatch.setattr(utils_geo, "get_air_quality_openweather", lambda *a: (2, 18.0))
+    return cells
+
+
+def test_complete_cell_is_cached(cached_cells):
+    base = utils_geo.compute_base_metrics(12.9, 77.6)
+    assert "missing" not in base
+    assert cached_cells == [base]
+
+
+@pytest.mark.parametrize("helper, metric", [
+    ("buildings_count_proxy", "pop"),
+    ("distance_to_nearest_road", "dist_road_m"),
+    ("lake_proximity", "lake_dist_m"),
+    ("green_proxy", "green_pct"),
+    ("get_air_quality_openweather", "aqi"),
+])
+def test_failed_lookup_without_deadline_is_missing_not_cached(cached_cells, monkeypatch, helper, metric):
+    monkeypatch.setattr(utils_geo, helper, fail)
+    base = utils_geo.compute_base_metrics(12.9, 77.6)
+    assert base["missing"] == [metric]
+    assert cached_cells == []
+
+
+def test_missing_metric_is_flagged_on_the_candidate(cached_cells, monkeypatch):
+    monkeypatch.setattr(utils_geo, "green_proxy", fail)
+    monkeypatch.setattr(utils_geo, "distance_to_nearest_amenity", lambda *a: 800.0)
+    cand = utils_geo.compute_candidate_metrics({"lat": 12.9, "lon": 77.6}, "school", (12.9, 77.6))
+    assert cand["green_pct"] is None
+    assert cand["imputed"] == ["green_balance"]
+    assert cand["completeness"]["green_pct"] is False
+
+
+@pytest.mark.parametrize("failing, cached", [(None, True), ("green_proxy", False)])
+def test_only_complete_results_are_cached(cached_cells, monkeypatch, failing, cached):
+    import app
+
+    if failing:
+        monkeypatch.setattr(utils_geo, failing, fail)
+    monkeypatch.setattr(utils_geo, "distance_to_nearest_amenity", lambda *a: 800.0)
+    writes = []
+    monkeypatch.setattr(app, "set_cached_result", lambda *a: writes.append(a))
+    monkeypatch.setattr(app, "set_enriched", lambda *a: writes.append(a))
+    cands = [{"lat": 12.9 + i * 0.001, "lon": 77.6} for i in range(4)]
+    for c in cands:
+        c.update(utils_geo.compute_candidate_metrics(c, "school", (12.9, 77.6)))
+
+    result = app.rank_and_store(12.9, 77.6, "school", 2000, cands, None, "")
+    assert result["complete"] is cached
+    assert bool(writes) is cached
+
+
+CELL = {"pop": 42.0, "dist_road_m": 120.0, "near_lake": False, "lake_dist_m": 900.0, "green_pct": 30.0,
+        "aqi": 5, "pm25": 90.0}
+
+
+def test_cached_cell_takes_the_current_aqi(monkeypatch):
+    import air_quality
+    monkeypatch.setattr(utils_geo, "get_cell_metrics", lambda lat, lon: dict(CELL))
+    monkeypatch.setattr(air_quality, "aqi_for_point", lambda lat, lon, deadline=None: (2, 18.0))
+    [base] = utils_geo.lookup_base_metrics([{"lat": 12.9, "lon": 77.6}])
+    assert (base["aqi"], base["pm25"]) == (2, 18.0) and "missing" not in base
+
+
+def test_cached_cell_without_a_current_reading_reports_aqi_missing(monkeypatch):
+    import air_quality
+    monkeypatch.setattr(utils_geo, "get_cell_metrics", lambda lat, lon: dict(CELL))
+    monkeypatch.setattr(air_quality, "aqi_for_point", fail)
+    [base] = utils_geo.lookup_base_metrics([{"lat": 12.9, "lon": 77.6}])
+    assert base["missing"] == ["aqi"]
+    metrics = utils_geo.score_candidate({"lat": 12.9, "lon": 77.6}, "school", 100.0, base, 800.0,
+                                        list(base["missing"]))
+    assert metrics["aqi"] is None and metrics["imputed"] == ["pollution_risk"]
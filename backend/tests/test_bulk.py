@@ -0,0 +1,99 @@
+import json
+import threading
+import time
+
+import pytest
+
+import bulk
+from scoring import SCORE_KEYS, parse_weights
+
+WEIGHTS = parse_weights(None)
+
+
+@pytest.fixture(autouse=True)
+def job_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(bulk, "BULK_DIR", str(tmp_path))
+    return tmp_path
+
+
+def sites(n):
+    return [{"id": str(i), "lat": 12.9 + i * 0.01, "lon": 77.6, "tags": {}} for i in range(n)]
+
+
+def metrics(i, imputed=()):
+    return {"pop": float(i), "raw_scores": dict.fromkeys(SCORE_KEYS, 0.5), "imputed": list(imputed), "reason": ""}
+
+
+def test_checkpoint_round_trip():
+    cp = bulk.open_checkpoint(sites(3), "school", WEIGHTS)
+    cp.append([(0, metrics(0)), (2, metrics(2))])
+    again = bulk.open_checkpoint(sites(3), "school", WEIGHTS)
+    assert again.job_id == cp.job_id
+    assert sorted(again.done) == [0, 2]
+
+
+def test_torn_last_line_is_ignored():
+    cp = bulk.open_checkpoint(sites(2), "school", WEIGHTS)
+    cp.append([(0, metrics(0))])
+    with open(cp.path, "a", encoding="utf-8") as f:
+        f.write('{"index": 1, "metr')
+    assert list(bulk.open_checkpoint(sites(2), "school", WEIGHTS).done) == [0]
+
+
+@pytest.mark.parametrize("job_id", ["../../x", "a/b", "", "x" * 65, "job.jsonl"])
+def test_rejects_unsafe_job_ids(job_id):
+    with pytest.raises(ValueError):
+        bulk.Checkpoint(job_id, "inputs")
+
+
+def test_refuses_to_resume_a_job_with_other_inputs():
+    bulk.open_checkpoint(sites(3), "school", WEIGHTS, job_id="mine").append([(0, metrics(0))])
+    with pytest.raises(ValueError, match="different"):
+        bulk.open_checkpoint(sites(4), "school", WEIGHTS, job_id="mine")
+    with pytest.raises(ValueError, match="different"):
+        bulk.open_checkpoint(sites(3), "hospital", WEIGHTS, job_id="mine")
+    assert bulk.open_checkpoint(sites(3), "school", WEIGHTS, job_id="mine").done
+
+
+def test_closing_the_stream_cancels_queued_chunks(monkeypatch):
+    scored = []
+    lock = threading.Lock()
+
+    def fake_score_chunk(all_sites, chunk, infra, origin):
+        time.sleep(0.05)
+        with lock:
+            scored.append(chunk)
+        return [(i, metrics(i)) for i in chunk]
+
+    monkeypatch.setattr(bulk, "score_chunk", fake_score_chunk)
+    monkeypatch.setattr(bulk, "spatial_chunks", lambda indices, all_sites: [[i] for i in indices])
+    many = sites(40)
+    events = bulk.bulk_events(many, "school", WEIGHTS, workers=2)
+    assert next(events)[0] == "job"
+    assert next(events)[0] == "site"
+    events.close()
+    time.sleep(0.2)   # chunks already running finish and checkpoint themselves
+    settled = len(scored)
+    time.sleep(0.3)
+
+    assert len(scored) == settled
+    assert 1 <= settled < 10
+    resumed = bulk.open_checkpoint(many, "school", WEIGHTS)
+    assert sorted(resumed.done) == sorted(i for chunk in scored for i in chunk)
+
+
+def test_imputed_sites_are_retried_on_resume(monkeypatch):
+    # Site 1's AQI call failed: its stand-in value must not be checkpointed as final
+    monkeypatch.setattr(bulk, "score_chunk", lambda all_sites, chunk, infra, origin:
+                        [(i, metrics(i, ["pollution_risk"] if i == 1 else ())) for i in chunk])
+    many = sites(3)
+    list(bulk.bulk_events(many, "school", WEIGHTS))
+    assert sorted(bulk.open_checkpoint(many, "school", WEIGHTS).done) == [0, 2]
+
+
+@pytest.mark.parametrize("geom", [{"type": "Blob", "coordinates": [1, 2]}, {"type": "Point"},
+                                  {"type": "Polygon", "coordinates": [[1, 2]]}])
+def test_malformed_geometry_is_a_value_error(geom):
+    text = json.dumps({"type": "FeatureCollection", "features": [{"type": "Feature", "geometry": geom}]})
+    with pytest.raises(ValueError, match="Feature 0"):
+        bulk.parse_sites(text)
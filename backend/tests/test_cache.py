@@ -0,0 +1,99 @@
+import json
+import sqlite3
+import time
+
+import pytest
+
+import cache
+
+
+pytestmark = pytest.mark.usefixtures("fresh_cache")
+
+
+def other_worker():
+    """A second process's view of the same database"""
+    return sqlite3.connect(cache.CACHE_DB)
+
+
+def test_result_round_trip_through_lru_and_sqlite():
+    cache.set_cached_result(12.9, 77.6, "school", 2000, {"good": [1]})
+    assert cache.get_cached_result(12.9, 77.6, "school", 2000) == {"good": [1]}
+    cache._lru_drop()
+    assert cache.get_cached_result(12.9, 77.6, "school", 2000) == {"good": [1]}
+    assert cache.get_cached_result(12.9, 77.6, "park", 2000) is None
+
+
+def test_clear_in_another_worker_drops_this_workers_lru():
+    cache.set_cached_result(12.9, 77.6, "school", 2000, {"good": [1]})
+    cache.set_cell_metrics(12.9, 77.6, {"pop": 1.0})
+    cache.set_enriched(12.9, 77.6, "school", 2000, [{"lat": 12.9}])
+
+    # What /clear-cache does, as run by a different worker process
+    with other_worker() as conn:
+        for table in ("entries", "cell_metrics", "enriched"):
+            conn.execute(f"DELETE FROM {table}")
+        conn.execute("INSERT INTO generation VALUES (1, 1) ON CONFLICT(id) DO UPDATE SET value = value + 1")
+
+    assert cache.get_cached_result(12.9, 77.6, "school", 2000) is None
+    assert cache.get_cell_metrics(12.9, 77.6) is None
+    assert cache.get_enriched(12.9, 77.6, "school", 2000) is None
+
+
+def test_result_rewritten_by_another_worker_is_reloaded():
+    cache.set_cached_result(12.9, 77.6, "school", 2000, {"good": [1]})
+    key = cache.get_cache_key(12.9, 77.6, "school", 2000)
+    written = cache.cached_at(12.9, 77.6, "school", 2000)
+    with other_worker() as conn:
+        conn.execute("UPDATE entries SET timestamp = ?, result = ? WHERE key = ?",
+                     (written + 5, json.dumps({"good": [2]}), key))
+
+    assert cache.get_cached_result(12.9, 77.6, "school", 2000) == {"good": [2]}
+    assert cache.cached_at(12.9, 77.6, "school", 2000) == written + 5
+
+
+def test_expired_result_has_no_write_time(monkeypatch):
+    cache.set_cached_result(12.9, 77.6, "school", 2000, {"good": [1]})
+    monkeypatch.setattr(cache, "CACHE_DURATION", 0)
+    assert cache.cached_at(12.9, 77.6, "school", 2000) is None
+    assert cache.get_cached_result(12.9, 77.6, "school", 2000) is None
+
+
+def test_lru_hit_between_syncs_runs_no_query(monkeypatch):
+    cache.set_cached_result(12.9, 77.6, "school", 2000, {"good": [1]})
+    cache.set_cell_metrics(12.9, 77.6, {"pop": 1.0})
+    cache.get_cached_result(12.9, 77.6, "school", 2000)     # first sync adopts the generation
+    cache.get_cell_metrics(12.9, 77.6)
+    monkeypatch.setattr(cache, "LRU_SYNC_S", 60.0)
+    statements = []
+    cache._connect().set_trace_callback(statements.append)
+    assert cache.get_cached_result(12.9, 77.6, "school", 2000) == {"good": [1]}
+    assert cache.get_cell_metrics(12.9, 77.6) == {"pop": 1.0}
+    assert statements == []
+
+
+def test_cell_rewritten_by_another_worker_is_reloaded():
+    cache.set_cell_metrics(12.9, 77.6, {"pop": 1.0})
+    assert cache.get_cell_metrics(12.9, 77.6) == {"pop": 1.0}
+    with other_worker() as conn:
+        conn.execute("UPDATE cell_metrics SET timestamp = ?, metrics = ?", (time.time() + 1, json.dumps({"pop": 2.0})))
+    assert cache.get_cell_metrics(12.9, 77.6) == {"pop": 2.0}
+
+
+def test_failed_aqi_write_leaves_the_lru_alone(monkeypatch):
+    def broken():
+        raise sqlite3.OperationalError("database is locked")
+    monkeypatch.setattr(cache, "_connect", broken)
+    cache.set_aqi_reading("12.9:77.6", time.time() + 60, [2, 10.0])
+    assert cache._lru == {}
+
+
+def test_usage_is_buffered_and_flushed_in_one_batch(monkeypatch):
+    monkeypatch.setattr(cache, "_usage_flushed", time.time())
+    statements = []
+    cache._connect().set_trace_callback(statements.append)
+    for _ in range(3):
+        cache.record_usage(12.9, 77.6, "school", 2000)
+    cache.record_usage(12.95, 77.6, "park", 2000)
+    assert not any("usage" in s for s in statements)
+    hot = cache.hot_searches()
+    assert [(h["infra"], round(h["score"])) for h in hot] == [("school", 3), ("park", 1)]
@@ -0,0 +1,82 @@
+import time
+
+import pytest
+import requests
+
+import data_sources
+from data_sources import EndpointsUnavailable, OverpassSource
+
+
+class FakeResponse:
+    def __init__(self, payload, wire_s, status=200):
+        self.payload, self.upstream_seconds, self.status_code = payload, wire_s, status
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(response=self)
+
+    def json(self):
+        return self.payload
+
+
+@pytest.fixture
+def posts(monkeypatch):
+    """http_post stand-in: behaviour per URL, every call recorded"""
+    state = {"calls": [], "behaviour": {}}
+
+    def fake_post(upstream, url, **kwargs):
+        state["calls"].append(url)
+        queued_s, wire_s, status = state["behaviour"][url]
+        time.sleep(queued_s + wire_s)
+        if status is None:
+            raise requests.ConnectionError("down")
+        return FakeResponse({"elements": [url]}, wire_s, status)
+
+    monkeypatch.setattr(data_sources, "http_post", fake_post)
+    return state
+
+
+def test_latency_sample_is_wire_time_only(posts):
+    source = OverpassSource(["http://a/api"], {})
+    posts["behaviour"]["http://a/api"] = (0.2, 0.01, 200)   # 200 ms queued, 10 ms on the wire
+    source.query("q")
+    assert source.endpoints[0].ewma == pytest.approx(0.01)
+
+
+def test_lone_endpoint_is_never_taken_out(posts):
+    source = OverpassSource(["http://a/api"], {})
+    posts["behaviour"]["http://a/api"] = (0, 0, None)
+    for _ in range(data_sources.BREAKER_FAILURES + 2):
+        with pytest.raises(requests.ConnectionError):
+            source.query("q")
+    assert len(posts["calls"]) == data_sources.BREAKER_FAILURES + 2
+    posts["behaviour"]["http://a/api"] = (0, 0.01, 200)
+    assert source.query("q") == {"elements": ["http://a/api"]}
+
+
+def test_failing_endpoint_in_a_pool_is_skipped(posts):
+    source = OverpassSource(["http://a/api", "http://b/api"], {})
+    posts["behaviour"].update({"http://a/api": (0, 0, None), "http://b/api": (0, 0.01, 200)})
+    source.endpoints[0].ewma = 0.001      # a looks fastest, so it is tried first
+    for _ in range(data_sources.BREAKER_FAILURES):
+        assert source.query("q") == {"elements": ["http://b/api"]}
+    posts["calls"].clear()
+    source.query("q")
+    assert posts["calls"] == ["http://b/api"]
+    assert source.endpoints[0].stats()["state"] == "open"
+
+
+def test_bad_query_does_not_fail_over(posts):
+    source = OverpassSource(["http://a/api", "http://b/api"], {})
+    posts["behaviour"].update({"http://a/api": (0, 0, 400), "http://b/api": (0, 0, 400)})
+    with pytest.raises(requests.HTTPError):
+        source.query("q")
+    assert len(posts["calls"]) == 1
+
+
+def test_all_endpoints_open_raises(posts):
+    source = OverpassSource(["http://a/api", "http://b/api"], {})
+    for ep in source.endpoints:
+        ep.opened_at = time.monotonic()
+    with pytest.raises(EndpointsUnavailable):
+        source.query("q")
@@ -0,0 +1,26 @@
+import numpy as np
+
+from distance_fields import NearestIndex
+from utils_geo import layer_nearest_center
+
+LAT, LON = 12.97, 77.59
+
+
+def features(n, seed=3):
+    rng = np.random.default_rng(seed)
+    return [{"center": (LAT + dy, LON + dx)} for dy, dx in rng.uniform(-0.03, 0.03, (n, 2))]
+
+
+def test_index_matches_the_linear_scan():
+    feats = features(500)
+    index = NearestIndex.from_features(feats)
+    rng = np.random.default_rng(4)
+    for dy, dx in rng.uniform(-0.03, 0.03, (200, 2)):
+        lat, lon = LAT + dy, LON + dx
+        for radius in (150, 2000):
+            assert index.nearest(lat, lon, radius) == layer_nearest_center(feats, lat, lon, radius)
+
+
+def test_empty_index_and_far_features_cap_at_the_radius():
+    assert NearestIndex.from_features([]).nearest(LAT, LON, 300) == 300.0
+    assert NearestIndex.from_features([{"center": (LAT + 0.1, LON)}]).nearest(LAT, LON, 300) == 300.0
@@ -0,0 +1,49 @@
+import pytest
+
+import feature_tiles
+from feature_tiles import TileLayer, tile_bounds, tile_xy, tiles_covering
+
+LAT, LON = 12.97, 77.59
+
+
+def test_point_lies_in_its_tile():
+    x, y = tile_xy(LAT, LON)
+    s, w, n, e = tile_bounds(x, y)
+    assert s <= LAT <= n and w <= LON <= e
+
+
+def test_covering_tiles_span_the_bbox():
+    tiles = tiles_covering((12.90, 77.50, 13.00, 77.62))
+    xs, ys = {x for x, _ in tiles}, {y for _, y in tiles}
+    assert len(tiles) == len(xs) * len(ys) > 1
+
+
+def feature(i, lat, lon):
+    return {"id": i, "center": [lat, lon], "bounds": [lat, lon, lat, lon], "lines": [[[lat, lon]]]}
+
+
+@pytest.fixture
+def tiles(monkeypatch):
+    """In-memory tile store; background fetches are recorded, not run"""
+    stored, scheduled = {}, []
+    monkeypatch.setattr(feature_tiles, "load_tile", lambda *key: stored.get(key))
+    monkeypatch.setattr(feature_tiles, "_schedule_refresh", scheduled.extend)
+    return stored, scheduled
+
+
+def test_mostly_cold_area_goes_to_the_direct_query(tiles):
+    stored, scheduled = tiles
+    bbox = (12.90, 77.50, 13.00, 77.62)
+    wanted = [(layer, bbox) for layer in ("roads", "water", "green")]
+    assert feature_tiles.layer_features(wanted) is None
+    assert len(scheduled) == 3 * len(tiles_covering(bbox))
+
+
+def test_warm_area_is_assembled_from_tiles(tiles):
+    stored, scheduled = tiles
+    x, y = tile_xy(LAT, LON)
+    s, w, n, e = tile_bounds(x, y)
+    stored[("roads", x, y)] = TileLayer([feature(1, LAT, LON), feature(2, s + 1e-4, w + 1e-4)], fetched=1e12)
+    bbox = (LAT - 1e-3, LON - 1e-3, LAT + 1e-3, LON + 1e-3)
+    assert [f["id"] for f in feature_tiles.layer_features([("roads", bbox)])["roads"]] == [1]
+    assert scheduled == []
@@ -0,0 +1,98 @@
+import pytest
+
+import gazetteer
+from utils_geo import rank_search_results
+
+AREA = ", Bengaluru South, Bengaluru Urban, Karnataka, 560034, India"
+
+
+@pytest.fixture(autouse=True)
+def empty_index(monkeypatch):
+    monkeypatch.setattr(gazetteer, "_entries", [])
+    monkeypatch.setattr(gazetteer, "_seen", {})
+    monkeypatch.setattr(gazetteer, "_keys", [])
+    monkeypatch.setattr(gazetteer, "_answered", {})
+
+
+def place(name, i=0):
+    return {"display_name": name + AREA, "lat": 12.9 + i * 0.001, "lon": 77.6}
+
+
+def lookup(q, limit=8):
+    return gazetteer.lookup_places(q, rank_search_results, limit=limit)
+
+
+def names(results):
+    return [r["display_name"].split(",")[0] for r in results]
+
+
+def test_only_the_place_name_is_indexed():
+    gazetteer.add_places([place(n, i) for i, n in enumerate(
+        ["Koramangala", "HSR Layout", "Indiranagar", "Jayanagar", "BTM Layout",
+         "Whitefield", "Hebbal", "Yelahanka", "Malleshwaram"])])
+    for q in ("k", "ban", "bang", "in", "560"):
+        assert lookup(q) is None, q
+
+
+def test_word_suffixes_of_the_name_match():
+    gazetteer.add_places([place(f"{n} Layout", i) for i, n in enumerate("ABCDEFGH")])
+    assert len(lookup("layout")) == 8
+    assert lookup("layo", limit=9) is None
+
+
+def test_narrows_a_complete_answer_within_its_own_results():
+    answer = [place("Koramangala"), place("Kormangala 8th Block", 1)]
+    gazetteer.add_places(answer + [place("Koramangala Club", 2)])
+    gazetteer.mark_answered("kor", answer, 2, 24)
+    assert names(lookup("kora")) == ["Koramangala"]
+
+
+def test_does_not_narrow_a_cut_off_answer():
+    answer = [place(f"Kanaka {i}", i) for i in range(8)]
+    gazetteer.add_places(answer)
+    gazetteer.mark_answered("ka", answer, 24, 24)
+    assert lookup("kanakapura", limit=9) is None
+
+
+def test_narrowing_to_nothing_asks_upstream():
+    answer = [place("Koramangala")]
+    gazetteer.add_places(answer)
+    gazetteer.mark_answered("k", answer, 1, 24)
+    assert lookup("kanakapura") is None
+
+
+class FakeResponse:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def json(self):
+        return self.rows
+
+
+def nominatim_row(name, state="Karnataka"):
+    return {"display_name": name + AREA, "lat": "12.9", "lon": "77.6",
+            "address": {"city": "Bengaluru", "state": state}}
+
+
+def autocomplete(monkeypatch, *responses):
+    import utils_geo
+    pending = list(responses)
+    monkeypatch.setattr(utils_geo, "http_get", lambda *a, **k: FakeResponse(pending.pop(0)))
+    return utils_geo.nominatim_autocomplete("kor", limit=8)
+
+
+def test_filtered_down_but_cut_off_answer_is_not_recorded(monkeypatch):
+    rows = [nominatim_row("Koramangala")] + [nominatim_row(f"Kora {i}", state="Kerala") for i in range(23)]
+    assert names(autocomplete(monkeypatch, rows)) == ["Koramangala"]
+    assert gazetteer._answered == {}
+
+
+def test_short_upstream_answer_is_recorded(monkeypatch):
+    autocomplete(monkeypatch, [nominatim_row("Koramangala"), nominatim_row("Kormangala Club")])
+    assert len(gazetteer._answered["kor"]) == 2
+
+
+def test_backup_answer_is_not_recorded(monkeypatch):
+    backup = [{"display_name": "Koramangala" + AREA, "lat": "12.9", "lon": "77.6"}]
+    assert names(autocomplete(monkeypatch, [], backup)) == ["Koramangala"]
+    assert gazetteer._answered == {}
@@ -0,0 +1,103 @@
+import math
+from collections import OrderedDict
+
+import numpy as np
+import pytest
+
+import heatmap
+from heatmap import Grid, center_count_raster, suitability_surface
+from utils_geo import EARTH_M_PER_DEG
+
+LAT, LON = 12.97, 77.59
+real_half_width = heatmap._half_width
+
+
+def features_around(radius_m, n, seed=1):
+    rng = np.random.default_rng(seed)
+    dx, dy = rng.uniform(-1.5 * radius_m, 1.5 * radius_m, (2, n))
+    kx = EARTH_M_PER_DEG * math.cos(math.radians(LAT))
+    return [{"center": [LAT + y / EARTH_M_PER_DEG, LON + x / kx]} for x, y in zip(dx, dy)]
+
+
+def reference_counts(grid, features, radius_m):
+    """The original offset-by-offset loop"""
+    size = grid.size
+    pad = int(math.ceil(radius_m / grid.cell_m))
+    cx, cy = grid.project([f["center"][0] for f in features], [f["center"][1] for f in features])
+    cols = np.floor((cx + grid.radius_m) / grid.cell_m).astype(int) + pad
+    rows = np.floor((grid.radius_m - cy) / grid.cell_m).astype(int) + pad
+    full = size + 2 * pad
+    keep = (cols >= 0) & (cols < full) & (rows >= 0) & (rows < full)
+    hist = np.zeros((full, full))
+    np.add.at(hist, (rows[keep], cols[keep]), 1)
+    acc = np.zeros((size, size))
+    for di in range(-pad, pad + 1):
+        for dj in range(-pad, pad + 1):
+            if (di * di + dj * dj) * grid.cell_m ** 2 <= radius_m ** 2:
+                acc += hist[pad + di:pad + di + size, pad + dj:pad + dj + size]
+    return acc.ravel()
+
+
+@pytest.mark.parametrize("search_radius, size", [(2500, 40), (1000, 33), (300, 20)])
+def test_matches_the_offset_loop(search_radius, size):
+    grid = Grid(LAT, LON, search_radius, size)
+    feats = features_around(search_radius, 400)
+    np.testing.assert_array_equal(center_count_raster(grid, feats, 500), reference_counts(grid, feats, 500))
+
+
+def test_disc_sum_is_one_pass_per_row_offset(monkeypatch):
+    # A 500 m window on 2.3 m cells is a 429x429 disc: 429 row runs, not ~145k offsets
+    calls = []
+    monkeypatch.setattr(heatmap, "_half_width", lambda di, r: calls.append(di) or real_half_width(di, r))
+    grid = Grid(LAT, LON, 300, 256)
+    counts = center_count_raster(grid, features_around(300, 2000), 500)
+    pad = math.ceil(500 / grid.cell_m)
+    assert sorted(calls) == list(range(-pad, pad + 1))
+    assert counts.max() > 0
+
+
+def fake_layers(calls):
+    def fetch(points, infra_type, base_points=None, deadline=None):
+        calls.append((points, base_points))
+        layers = {f"amenity:{infra_type}": []}
+        if base_points is None:
+            layers.update(buildings=[], roads=[], water=[], green=[])
+        return layers
+    return fetch
+
+
+@pytest.fixture
+def layer_calls(monkeypatch):
+    calls = []
+    for cache in ("_base_layers", "_amenity_layers", "_base_cache", "_amenity_cache"):
+        monkeypatch.setattr(heatmap, cache, OrderedDict())
+    monkeypatch.setattr(heatmap, "fetch_metric_layers", fake_layers(calls))
+    monkeypatch.setattr(heatmap, "get_air_quality_openweather", lambda lat, lon: (2, None))
+    return calls
+
+
+def test_radius_changes_within_the_fetched_area_only_rerasterize(layer_calls):
+    for radius in (2500, 2000, 3000, 1200):
+        _, surface = suitability_surface(LAT, LON, radius, "school", size=20)
+        assert surface is not None
+    assert len(layer_calls) == 1    # first call covered 3000 m
+    suitability_surface(LAT, LON, 3500, "school", size=20)
+    assert len(layer_calls) == 2
+
+
+def test_switching_infra_fetches_only_its_amenities(layer_calls):
+    suitability_surface(LAT, LON, 2500, "school", size=20)
+    suitability_surface(LAT, LON, 2000, "park", size=20)
+    assert [base for _, base in layer_calls] == [None, []]
+
+
+def test_zero_radius_is_rejected():
+    with pytest.raises(ValueError):
+        Grid(LAT, LON, 0, 100)
+
+
+@pytest.mark.parametrize("radius", ["100", "50000", "wide"])
+def test_heatmap_rejects_radius_out_of_bounds(radius):
+    from app import app
+    r = app.test_client().get(f"/heatmap?lat={LAT}&lon={LON}&radius={radius}")
+    assert r.status_code == 400
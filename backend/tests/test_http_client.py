@@ -0,0 +1,63 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import http_client
+
+
+@pytest.fixture
+def upstream():
+    """Local server answering with the queued statuses, then 200"""
+    state = {"statuses": [], "hits": 0}
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            state["hits"] += 1
+            status = state["statuses"].pop(0) if state["statuses"] else 200
+            self.send_response(status)
+            if status == 429:
+                self.send_header("Retry-After", "0")
+            self.send_header("Content-Length", "2")
+            self.end_headers()
+            self.wfile.write(b"ok")
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    state["url"] = f"http://127.0.0.1:{server.server_address[1]}/"
+    yield state
+    server.shutdown()
+
+
+@pytest.fixture
+def tokens(monkeypatch):
+    taken, paused = [], []
+    monkeypatch.setattr(http_client, "acquire", lambda upstream, deadline=None: taken.append(upstream))
+    monkeypatch.setattr(http_client, "throttled", lambda upstream, retry_after=None: paused.append(retry_after))
+    monkeypatch.setattr(http_client, "RETRY_BACKOFF", 0.01)
+    monkeypatch.setattr(http_client, "RETRY_JITTER", 0.0)
+    return taken, paused
+
+
+def test_every_retry_takes_a_rate_token(upstream, tokens):
+    upstream["statuses"] = [503, 502]
+    resp = http_client.http_get("testapi", upstream["url"], timeout=5)
+    assert resp.status_code == 200
+    assert upstream["hits"] == 3
+    assert tokens[0] == ["testapi"] * 3
+
+
+def test_429_pauses_the_bucket_before_retrying(upstream, tokens):
+    upstream["statuses"] = [429]
+    assert http_client.http_get("testapi", upstream["url"], timeout=5).status_code == 200
+    assert tokens[1] == ["0"]
+    assert upstream["hits"] == len(tokens[0]) == 2
+
+
+def test_gives_up_after_retry_total(upstream, tokens):
+    upstream["statuses"] = [503] * 5
+    assert http_client.http_get("testapi", upstream["url"], timeout=5).status_code == 503
+    assert upstream["hits"] == http_client.RETRY_TOTAL + 1 == len(tokens[0])
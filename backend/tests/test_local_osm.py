@@ -0,0 +1,59 @@
+import pytest
+
+from local_osm import LocalOsm, ingest
+
+EXTRACT = """<?xml version="1.0"?>
+<osm version="0.6">
+  <node id="1" lat="12.9700" lon="77.5900"><tag k="amenity" v="hospital"/></node>
+  <node id="2" lat="12.9800" lon="77.6000"><tag k="amenity" v="school"/></node>
+  <node id="3" lat="12.9710" lon="77.5910"/>
+  <node id="4" lat="12.9720" lon="77.5920"/>
+  <way id="10"><nd ref="3"/><nd ref="4"/><tag k="highway" v="primary"/></way>
+  <way id="11"><nd ref="3"/><nd ref="4"/><tag k="natural" v="water"/></way>
+</osm>
+"""
+
+
+@pytest.fixture
+def osm(tmp_path):
+    src = tmp_path / "extract.osm"
+    src.write_text(EXTRACT)
+    assert ingest(str(src), str(tmp_path / "osm.db")) == 4
+    return LocalOsm(str(tmp_path / "osm.db"))
+
+
+def ids(result):
+    return [(el["type"], el["id"]) for el in result["elements"]]
+
+
+def test_bbox_and_tag_filters(osm):
+    q = '[out:json];(node["amenity"="hospital"](12.96,77.58,12.99,77.61);way["highway"](12.96,77.58,12.99,77.61););out ids;'
+    assert ids(osm.query(q)) == [("node", 1), ("way", 10)]
+
+
+def test_around_filter_measures_meters(osm):
+    near = osm.query('(node["amenity"](around:200,12.9700,77.5900););out body;')
+    assert ids(near) == [("node", 1)]
+    assert near["elements"][0]["tags"] == {"amenity": "hospital"}
+    assert ids(osm.query('(node["amenity"](around:2000,12.9700,77.5900););out body;')) == [("node", 1), ("node", 2)]
+
+
+def test_regex_filter_and_out_modes(osm):
+    q = '(way["highway"~"primary|secondary"](12.96,77.58,12.99,77.61););out center;'
+    el = osm.query(q)["elements"][0]
+    assert el["center"] == {"lat": pytest.approx(12.9715), "lon": pytest.approx(77.5915)}
+    el = osm.query(q.replace("center", "geom"))["elements"][0]
+    assert [(p["lat"], p["lon"]) for p in el["geometry"]] == [(12.971, 77.591), (12.972, 77.592)]
+
+
+def test_statement_without_an_area_is_rejected(osm):
+    with pytest.raises(ValueError):
+        osm.query('(node["amenity"];);out;')
+
+
+def test_each_union_is_printed_by_its_own_out(osm):
+    q = ('(node["amenity"="hospital"](12.96,77.58,12.99,77.61););out center;'
+         '(way["natural"="water"](12.96,77.58,12.99,77.61););out geom;')
+    amenity, water = osm.query(q)["elements"]
+    assert (amenity["type"], amenity["id"], "geometry" in amenity) == ("node", 1, False)
+    assert (water["id"], len(water["geometry"])) == (11, 2)
@@ -0,0 +1,40 @@
+from utils_geo import layer_count_within, layer_nearest_center, metric_layers_query, split_metric_layers
+
+POINTS = [{"lat": 12.97, "lon": 77.59}]
+
+
+def test_only_green_areas_are_fetched_with_geometry():
+    q = metric_layers_query(POINTS, ["school"])
+    center, geom = q.split("out center;")
+    assert 'way["highway"]' in center and "node[amenity=school]" in center and "way[building]" in center
+    assert 'way["leisure"~"park|garden"]' in geom and "out geom;" in geom
+    assert "highway" not in geom
+
+
+def test_amenity_only_query_has_no_geometry_block():
+    assert "out geom" not in metric_layers_query(POINTS, ["school"], base_points=[])
+
+
+def way_center(i, lat, lon, **tags):
+    return {"type": "way", "id": i, "center": {"lat": lat, "lon": lon}, "tags": tags}
+
+
+def test_elements_are_sorted_by_the_output_they_came_from():
+    park_road = {"highway": "pedestrian", "leisure": "park"}
+    outline = {"type": "way", "id": 7, "tags": park_road,
+               "bounds": {"minlat": 12.97, "minlon": 77.59, "maxlat": 12.98, "maxlon": 77.60},
+               "geometry": [{"lat": 12.97, "lon": 77.59}, {"lat": 12.98, "lon": 77.60}]}
+    layers = split_metric_layers([way_center(7, 12.975, 77.595, **park_road), outline,
+                                  way_center(8, 12.9705, 77.5905, building="yes")], ["school"])
+    assert [f["id"] for f in layers["roads"]] == ["w7"]
+    assert [f["id"] for f in layers["green"]] == ["w7"]
+    assert layers["green"][0]["lines"][0][-1] == (12.98, 77.60)
+    assert [f["id"] for f in layers["buildings"]] == ["w8"]
+
+
+def test_center_features_are_members_by_center_distance():
+    layers = split_metric_layers([way_center(1, 12.9745, 77.59, highway="primary"),
+                                  way_center(2, 12.9705, 77.59, building="yes")], [])
+    assert layer_nearest_center(layers["roads"], 12.97, 77.59, 400) == 400.0     # center ~500 m away
+    assert 495 < layer_nearest_center(layers["roads"], 12.97, 77.59, 2000) < 505
+    assert layer_count_within(layers["buildings"], 12.97, 77.59, 500) == 1
@@ -0,0 +1,72 @@
+import threading
+import time
+
+import pytest
+
+import app
+from deadline import Deadline
+
+RESULT = {"origin": {"lat": 12.9, "lon": 77.6}, "good": [], "danger": []}
+
+
+@pytest.fixture
+def compute(monkeypatch):
+    """compute_recommendation stand-in that blocks until released"""
+    state = {"calls": [], "release": threading.Event(), "result": RESULT}
+
+    def fake(lat, lon, infra, radius_m, weights, variant, deadline=None):
+        state["calls"].append(deadline)
+        if deadline is None or not deadline.expired():
+            state["release"].wait(5)
+        yield "candidates", {"candidates": []}
+        return state["result"]
+
+    monkeypatch.setattr(app, "compute_recommendation", fake)
+    monkeypatch.setattr(app, "get_cached_result", lambda *a: None)
+    return state
+
+
+def result_of(deadline=None):
+    events = app.recommend_events(12.9, 77.6, "school", 2000, None, "", deadline)
+    return [p for e, p in events if e == "result"][0]
+
+
+def start(fn, out, i):
+    t = threading.Thread(target=lambda: out.__setitem__(i, fn()))
+    t.start()
+    return t
+
+
+def test_deadline_runs_coalesce(compute):
+    out = [None] * 3
+    threads = [start(lambda: result_of(Deadline(5)), out, i) for i in range(3)]
+    time.sleep(0.1)
+    compute["release"].set()
+    for t in threads:
+        t.join()
+    assert out == [RESULT] * 3
+    assert len(compute["calls"]) == 1
+
+
+def test_follower_answers_itself_when_the_leader_misses_its_deadline(compute):
+    out = [None]
+    leader = start(result_of, out, 0)
+    time.sleep(0.05)
+    assert result_of(Deadline(0.1)) is RESULT   # its own run, with an expired deadline
+    assert len(compute["calls"]) == 2
+    compute["release"].set()
+    leader.join()
+
+
+def test_unbounded_follower_does_not_take_a_partial_result(compute):
+    compute["result"] = dict(RESULT, complete=False)
+    out = [None] * 2
+    leader = start(lambda: result_of(Deadline(5)), out, 0)
+    time.sleep(0.05)
+    follower = start(result_of, out, 1)
+    time.sleep(0.05)
+    compute["release"].set()
+    leader.join()
+    follower.join()
+    assert len(compute["calls"]) == 2
+    assert compute["calls"][1] is None
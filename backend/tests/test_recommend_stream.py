@@ -0,0 +1,52 @@
+import json
+import threading
+
+import pytest
+
+import app
+
+pytestmark = pytest.mark.usefixtures("fresh_cache")
+
+URL = "/recommend?lat=12.9&lon=77.6&infra=school&radius=2000"
+
+
+def events(body):
+    return [json.loads(line) for line in body.decode().splitlines()]
+
+
+def test_stream_sends_candidates_then_each_enriched_one_then_the_result(pipeline):
+    r = app.app.test_client().get(URL + "&stream=1")
+    assert r.mimetype == "application/x-ndjson"
+    evs = events(r.data)
+    assert [e["event"] for e in evs] == ["candidates"] + ["candidate"] * 4 + ["result"]
+    assert len(evs[0]["candidates"]) == 4
+    assert sorted(e["index"] for e in evs[1:5]) == [0, 1, 2, 3]
+    result = evs[-1]
+    assert [c["reason"].split(". ", 1)[1] for c in result["good"]] == ["site 3", "site 2", "site 1"]
+    assert result["complete"] is True
+
+
+def test_streamed_result_is_cached_for_the_next_request(pipeline):
+    client = app.app.test_client()
+    client.get(URL + "&stream=1").get_data()
+    assert pipeline["enriched"] == 4
+    evs = events(client.get(URL + "&stream=1").data)
+    assert [e["event"] for e in evs] == ["result"]
+    assert pipeline["enriched"] == 4
+
+
+def test_client_leaving_mid_stream_releases_the_search(pipeline):
+    pipeline["hold"] = threading.Event()
+    resp = app.app.test_client().get(URL + "&stream=1", buffered=False)
+    chunks = iter(resp.response)
+    assert json.loads(next(chunks))["event"] == "candidates"
+    resp.close()     # client disconnects while candidates are still being enriched
+    pipeline["hold"].set()
+
+    key = app.get_cache_key(12.9, 77.6, "school", 2000, "")
+    assert app.recommend_flights.stats()["inflight"] == 0
+    assert app.get_cached_result(12.9, 77.6, "school", 2000) is None
+    # The next request leads a fresh computation instead of waiting on the abandoned one
+    flight, leader = app.recommend_flights.begin(key)
+    assert leader
+    app.recommend_flights.finish(key, flight, ok=False)
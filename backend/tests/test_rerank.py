@@ -0,0 +1,63 @@
+import pytest
+
+import app
+from scoring import DEFAULT_WEIGHTS
+
+pytestmark = pytest.mark.usefixtures("fresh_cache")
+
+SEARCH = "lat=12.9&lon=77.6&infra=school&radius=2000"
+LAT, LON, INFRA, RADIUS = 12.9, 77.6, "school", 2000
+
+
+def reasons(result):
+    return [c["reason"].split(". ", 1)[1] for c in result["good"]]
+
+
+def test_rerank_needs_a_stored_search(pipeline):
+    r = app.app.test_client().get(f"/rerank?{SEARCH}&weights=redundancy:1")
+    assert r.status_code == 404
+    assert pipeline["enriched"] == 0
+
+
+def test_rerank_endpoint_reuses_stored_metrics(pipeline):
+    client = app.app.test_client()
+    client.get(f"/recommend?{SEARCH}")
+    assert pipeline["enriched"] == 4
+
+    r = client.get(f"/rerank?{SEARCH}&weights=redundancy:1")
+    assert r.status_code == 200
+    body = r.get_json()
+    assert body["reranked"] is True
+    assert reasons(body) == ["site 0", "site 1", "site 2"]
+    assert pipeline["enriched"] == 4
+
+
+def result_of(weights):
+    weights = app.parse_weights(weights)
+    events = list(app.recommend_events(LAT, LON, INFRA, RADIUS, weights, app.weights_signature(weights)))
+    assert events[-1][0] == "result"
+    return events, events[-1][1]
+
+
+def test_weighted_search_reranks_stored_candidates_on_a_cache_miss(pipeline):
+    list(app.recommend_events(LAT, LON, INFRA, RADIUS, DEFAULT_WEIGHTS, ""))
+    assert pipeline["enriched"] == 4
+
+    events, result = result_of("redundancy:1")
+    assert [e for e, _ in events] == ["result"]      # no candidates re-enriched
+    assert result["reranked"] is True
+    assert reasons(result) == ["site 0", "site 1", "site 2"]
+    assert pipeline["enriched"] == 4
+
+
+def test_weighted_search_without_stored_candidates_computes_them(pipeline):
+    events, result = result_of("redundancy:1")
+    assert [e for e, _ in events] == ["candidates"] + ["candidate"] * 4 + ["result"]
+    assert "reranked" not in result
+    assert reasons(result) == ["site 0", "site 1", "site 2"]
+    assert pipeline["enriched"] == 4
+
+    # The computed variant is cached under its own key: served as-is, not re-ranked
+    events, again = result_of("redundancy:1")
+    assert [e for e, _ in events] == ["result"]
+    assert "reranked" not in again
@@ -0,0 +1,72 @@
+import gzip
+
+import pytest
+from flask import Flask
+
+from responses import compress_response, parse_fields, project, respond
+
+RESULT = {"good": [{"lat": 1.0, "lon": 2.0, "score": 90.0, "rank": 1, "reason": "r", "metrics": {"aqi": 2}}],
+          "danger": [], "complete": True}
+
+
+@pytest.fixture
+def client():
+    app = Flask(__name__)
+    app.after_request(compress_response)
+
+    @app.route("/result")
+    def result():
+        return respond(RESULT, etag="key|1700000000", last_modified=1700000000)
+
+    @app.route("/big")
+    def big():
+        return respond({"results": [{"display_name": f"Place {i}"} for i in range(100)]})
+
+    return app.test_client()
+
+
+def test_parse_fields():
+    assert parse_fields(None) is None
+    assert parse_fields("pins") == ("lat", "lon", "score", "rank")
+    assert parse_fields("lat, score,lat,") == ("lat", "score")
+
+
+def test_project_keeps_fields_without_touching_the_cached_result():
+    out = project(RESULT, ("lat", "score"))
+    assert out["good"] == [{"lat": 1.0, "score": 90.0}]
+    assert out["complete"] is True
+    assert "metrics" in RESULT["good"][0]
+    batch = project({"results": {"school": RESULT}}, ("rank",))
+    assert batch["results"]["school"]["good"] == [{"rank": 1}]
+
+
+def test_matching_etag_gets_304(client):
+    r = client.get("/result")
+    assert r.status_code == 200 and r.headers["Cache-Control"] == "no-cache"
+    etag = r.headers["ETag"]
+    assert etag.startswith("W/")
+    assert client.get("/result", headers={"If-None-Match": etag}).status_code == 304
+    assert client.get("/result", headers={"If-Modified-Since": r.headers["Last-Modified"]}).status_code == 304
+
+
+def test_etag_depends_on_the_projection(client):
+    full = client.get("/result").headers["ETag"]
+    pins = client.get("/result?fields=pins")
+    assert pins.headers["ETag"] != full
+    assert pins.get_json()["good"] == [{"lat": 1.0, "lon": 2.0, "score": 90.0, "rank": 1}]
+    assert client.get("/result?fields=pins", headers={"If-None-Match": full}).status_code == 200
+
+
+def test_large_bodies_are_gzipped_on_request(client):
+    plain = client.get("/big")
+    assert "Content-Encoding" not in plain.headers
+    r = client.get("/big", headers={"Accept-Encoding": "gzip"})
+    assert r.headers["Content-Encoding"] == "gzip"
+    assert gzip.decompress(r.data) == plain.data
+    assert "Accept-Encoding" in r.headers["Vary"]
+
+
+def test_msgpack_without_the_package_is_406(client, monkeypatch):
+    import responses
+    monkeypatch.setattr(responses, "msgpack", None)
+    assert client.get("/result?format=msgpack").status_code == 406
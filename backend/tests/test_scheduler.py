@@ -0,0 +1,69 @@
+import threading
+import time
+
+import pytest
+
+import scheduler
+from deadline import Deadline, DeadlineExceeded
+from scheduler import UpstreamQueue
+
+
+def test_burst_then_refill_rate():
+    q = UpstreamQueue("test", rate=20.0, burst=2)
+    t0 = time.monotonic()
+    waits = [q.acquire("interactive") for _ in range(4)]
+    assert max(waits[:2]) < 0.01
+    assert time.monotonic() - t0 == pytest.approx(2 / 20.0, abs=0.03)
+    assert q.stats()["granted"] == {"interactive": 4}
+
+
+def test_pause_withholds_tokens():
+    q = UpstreamQueue("test", rate=100.0, burst=5)
+    q.pause(0.2)
+    assert q.acquire("interactive") >= 0.19
+
+
+def test_call_that_cannot_make_its_deadline_is_shed():
+    q = UpstreamQueue("test", rate=1.0, burst=1)
+    q.acquire("interactive")
+    with pytest.raises(DeadlineExceeded):
+        q.acquire("interactive", Deadline(0.2))
+    assert q.stats()["shed"] == {"interactive": 1}
+
+
+def test_interactive_goes_ahead_of_queued_background():
+    q = UpstreamQueue("test", rate=10.0, burst=1)
+    q.acquire("interactive")
+    order = []
+
+    def call(prio):
+        q.acquire(prio)
+        order.append(prio)
+
+    threads = [threading.Thread(target=call, args=("background",)) for _ in range(2)]
+    for t in threads:
+        t.start()
+    time.sleep(0.02)
+    threads.append(threading.Thread(target=call, args=("interactive",)))
+    threads[-1].start()
+    for t in threads:
+        t.join()
+    assert order[0] == "interactive"
+
+
+def test_background_is_paced_to_its_share(monkeypatch):
+    monkeypatch.setitem(scheduler.RATE_SHARES, "background", 0.5)
+    q = UpstreamQueue("test", rate=20.0, burst=4)
+    t0 = time.monotonic()
+    for _ in range(3):
+        q.acquire("background")
+    # 10/s for background even with a full bucket, leaving tokens for interactive
+    assert time.monotonic() - t0 == pytest.approx(2 / 10.0, abs=0.04)
+    assert q.acquire("interactive") < 0.01
+
+
+def test_rates_come_from_the_environment(monkeypatch):
+    monkeypatch.setenv("UPSTREAM_RATE_OVERPASS", "4:8")
+    assert scheduler._configured_rate("overpass@mirror.example") == (4.0, 8.0)
+    monkeypatch.setenv("UPSTREAM_RATE_NOMINATIM", "0.5")
+    assert scheduler._configured_rate("nominatim") == (0.5, 1.0)
@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+from scoring import (DEFAULT_WEIGHTS, SCORE_KEYS, impute_missing_scores, parse_weights, rank_candidates,
+                     top_k_indices, weights_signature)
+
+
+def candidate(name, imputed=(), **raw):
+    return {"name": name, "reason": name, "raw_scores": {k: raw.get(k, 0.0) for k in SCORE_KEYS},
+            "imputed": list(imputed)}
+
+
+def test_imputed_criteria_take_the_median_of_measured_ones():
+    cs = [candidate("a", accessibility=0.2), candidate("b", accessibility=0.6), candidate("c", accessibility=0.9),
+          candidate("d", imputed=["accessibility"], accessibility=0.0)]
+    impute_missing_scores(cs)
+    assert cs[3]["raw_scores"]["accessibility"] == pytest.approx(0.6)
+    assert [c["raw_scores"]["accessibility"] for c in cs[:3]] == [0.2, 0.6, 0.9]
+
+
+def test_criterion_nobody_measured_is_imputed_as_zero():
+    cs = [candidate("a", imputed=["redundancy"], redundancy=0.7)]
+    impute_missing_scores(cs)
+    assert cs[0]["raw_scores"]["redundancy"] == 0.0
+
+
+def test_rank_candidates_orders_by_weighted_score():
+    cs = [candidate("low", accessibility=0.1), candidate("high", accessibility=0.9),
+          candidate("mid", accessibility=0.5)]
+    ranked = rank_candidates(cs, {"accessibility": 1.0}, topk=2)
+    assert [c["name"] for c in ranked] == ["high", "mid"]
+    assert [c["rank"] for c in ranked] == [1, 2]
+    assert ranked[0]["score"] == pytest.approx(100.0)
+    assert ranked[0]["reason"].startswith("🏆 Rank 1 - Score: 100/100.")
+    assert cs[0]["score"] == pytest.approx(0.0) and "rank" not in cs[0]
+
+
+def test_top_k_breaks_ties_by_input_order():
+    values = np.array([3.0, 5.0, 5.0, 1.0, 5.0])
+    assert top_k_indices(values, 2).tolist() == [1, 2]
+    assert top_k_indices(values).tolist() == [1, 2, 4, 0, 3]
+    assert top_k_indices(values, 0).tolist() == []
+
+
+def test_parse_weights():
+    assert parse_weights(None) is DEFAULT_WEIGHTS
+    assert parse_weights("redundancy:0.5") == {"redundancy": 0.5}
+    assert weights_signature(DEFAULT_WEIGHTS) == ""
+    for bad in ("speed:1", "redundancy", "redundancy:-1", "redundancy:nan"):
+        with pytest.raises(ValueError):
+            parse_weights(bad)
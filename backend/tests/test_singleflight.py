@@ -0,0 +1,54 @@
+import threading
+import time
+
+import pytest
+
+from deadline import DeadlineExceeded
+from singleflight import SingleFlight
+
+
+def run_in_threads(n, fn):
+    results = [None] * n
+    threads = [threading.Thread(target=lambda i=i: results.__setitem__(i, fn())) for i in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+
+
+def test_concurrent_callers_share_one_call():
+    flights = SingleFlight("test")
+    calls = []
+
+    def slow():
+        calls.append(1)
+        time.sleep(0.1)
+        return "value"
+
+    assert run_in_threads(5, lambda: flights.do("k", slow)) == ["value"] * 5
+    assert len(calls) == 1
+    assert flights.stats() == {"leaders": 1, "shared": 4, "inflight": 0}
+
+
+def test_leader_error_reaches_followers():
+    flights = SingleFlight("test")
+    call, leader = flights.begin("k")
+    follower, _ = flights.begin("k")
+    flights.finish("k", call, error=ValueError("boom"))
+    with pytest.raises(ValueError):
+        follower.wait()
+
+
+def test_follower_takes_over_an_abandoned_flight():
+    flights = SingleFlight("test")
+    call, _ = flights.begin("k")
+    threading.Timer(0.05, lambda: flights.finish("k", call, ok=False)).start()
+    assert flights.do("k", lambda: "mine") == "mine"
+
+
+def test_follower_gives_up_at_its_timeout():
+    flights = SingleFlight("test")
+    flights.begin("k")
+    with pytest.raises(DeadlineExceeded):
+        flights.do("k", lambda: "never", timeout=0.05)
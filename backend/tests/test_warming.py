@@ -0,0 +1,38 @@
+import app
+import warming
+from scheduler import current_priority
+
+
+def test_warm_recomputes_through_the_injected_callable_at_background_priority():
+    calls = []
+
+    def recompute(lat, lon, infras, radius, weights, variant, refresh=False):
+        calls.append((lat, lon, tuple(infras), radius, variant, refresh, current_priority()))
+
+    groups = warming.group_searches([
+        {"lat": 12.9, "lon": 77.6, "radius": 2500, "variant": "", "infra": "school"},
+        {"lat": 12.9, "lon": 77.6, "radius": 2500, "variant": "", "infra": "hospital"},
+    ])
+    assert warming.warm(recompute, groups) == {"warmed": 2, "skipped": 0, "upstream_calls": 0}
+    assert calls == [(12.9, 77.6, ("school", "hospital"), 2500, "", True, "background")]
+
+
+def test_refresh_recomputes_cell_metrics_instead_of_reusing_them(monkeypatch):
+    seen = {}
+    candidates = [{"lat": 12.9, "lon": 77.6}, {"lat": 12.91, "lon": 77.61}]
+    monkeypatch.setattr(app, "prefetch_area", lambda *a: None)
+    monkeypatch.setattr(app, "overpass_candidates_near", lambda *a, **k: candidates)
+    monkeypatch.setattr(app, "lookup_base_metrics", lambda cs, deadline=None: [{"cached": True}] * len(cs))
+    monkeypatch.setattr(app, "fetch_metric_layers", lambda cs, infras, base_points, deadline: None)
+
+    def enrich(cs, infras, origin, layers, bases, deadline):
+        seen["bases"] = bases
+        return {t: [] for t in infras}
+
+    monkeypatch.setattr(app, "enrich_candidates_multi", enrich)
+    monkeypatch.setattr(app, "rank_and_store", lambda *a: {"good": []})
+
+    app.batch_recommendations(12.9, 77.6, ["school"], 2500, None, "", refresh=True)
+    assert seen["bases"] == [None, None]
+    app.batch_recommendations(12.9, 77.6, ["school"], 2500, None, "")
+    assert seen["bases"] == [{"cached": True}] * 2
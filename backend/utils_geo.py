@@ -1,29 +1,116 @@
 # backend/utils_geo.py
-import requests, math, statistics, random
+import math, os, statistics, random, re
+from concurrent.futures import TimeoutError as FutureTimeout, as_completed
 from urllib.parse import quote_plus
-
-NOMINATIM = "https://nominatim.openstreetmap.org"
-OVERPASS = "https://overpass-api.de/api/interpreter"
+import shapely
+from shapely import STRtree
+from shapely.geometry import LineString, Point, Polygon
+from cache import get_cell_metrics, set_cell_metrics
+from http_client import http_get
+from metrics import TracedExecutor, timed
+from deadline import Deadline, wait_timeout
+from singleflight import SingleFlight
+from air_quality import aqi_for_point, current_aqi
+from feature_tiles import FEATURE_TILES, layer_features
+from data_sources import make_source
+from gazetteer import add_places, mark_answered
+from scoring import rank_candidates, raw_score_columns
+from distance_fields import NearestIndex
+
+# Upstream base URLs; overridable so bench.py can point the app at its stand-in server
+NOMINATIM = os.environ.get("NOMINATIM_URL", "https://nominatim.openstreetmap.org")
+OVERPASS = os.environ.get("OVERPASS_URL", "https://overpass-api.de/api/interpreter")
+# Comma-separated pool of Overpass endpoints (mirrors, our own instance); hedged and failed over
+OVERPASS_URLS = [u.strip() for u in os.environ.get("OVERPASS_URLS", OVERPASS).split(",") if u.strip()]
+PHOTON = os.environ.get("PHOTON_URL", "https://photon.komoot.io")
+OPENWEATHER = os.environ.get("OPENWEATHER_URL", "https://api.openweathermap.org")
 OPENWEATHER_API_KEY = "adff2d5a559c17cdcfba073eaf41c04b"
 
 HEADERS = {"User-Agent":"UrbanInfraDashboard/1.0 (sadaf@example.com)"}
 
-def is_point_actually_empty(lat, lon):
-    """Quick check if point is empty - FAST VERSION"""
-    q_standard = f"""
-    [out:json][timeout:3];
-    (
-      way(around:20,{lat},{lon})["building"];
-      way(around:20,{lat},{lon})["highway"];
+ENRICH_WORKERS = 8      # candidates enriched in parallel
+LOOKUP_WORKERS = 12     # per-candidate metric lookups in parallel
+DEADLINE_GRACE_S = 0.25 # extra wait for candidates finishing with partial metrics
+AUTOCOMPLETE_BUDGET_S = 3.0  # per provider; a queued Nominatim call past this is shed and Photon answers
+
+_enrich_pool = TracedExecutor(max_workers=ENRICH_WORKERS, thread_name_prefix="enrich")
+_lookup_pool = TracedExecutor(max_workers=LOOKUP_WORKERS, thread_name_prefix="lookup")
+
+# Identical Overpass queries in flight at once (e.g. the same trending locality) run once
+overpass_flights = SingleFlight("overpass")
+
+# Overpass API, or a local extract with DATA_SOURCE=local (see data_sources.py)
+data_source = make_source(OVERPASS_URLS, HEADERS)
+
+EMPTY_CLEARANCE_M = 20         # a point is empty if no building/highway is this close
+FALLBACK_SAMPLES = 200         # random points validated per fallback run
+FALLBACK_SEARCH_M = 60         # clearance measured up to this distance when ranking
+
+
+@timed("emptiness")
+def points_clearance(points, search_m=EMPTY_CLEARANCE_M, deadline=None):
+    """✅ Distance from each point to the nearest building/highway, one Overpass query
+
+    inf when nothing is within search_m. Returns None if the query fails.
+    """
+    if not points:
+        return []
+    clauses = "".join(
+        f"""
+      way(around:{search_m},{p["lat"]},{p["lon"]})["building"];
+      way(around:{search_m},{p["lat"]},{p["lon"]})["highway"];"""
+        for p in points
+    )
+    q = f"""
+    [out:json][timeout:25];
+    ({clauses}
     );
-    out ids;
+    out geom;
     """
     try:
-        r = requests.post(OVERPASS, data={"data": q_standard}, headers=HEADERS, timeout=4)
-        data = r.json()
-        return len(data.get("elements", [])) == 0
-    except:
-        return True
+        res = overpass_query(q, deadline=deadline)
+    except Exception as e:
+        print(f"⚠️ Batched emptiness query failed: {e}")
+        return None
+
+    lat0 = sum(p["lat"] for p in points) / len(points)
+    lon0 = sum(p["lon"] for p in points) / len(points)
+    xy = _local_xy(lat0, lon0)
+
+    geoms = []
+    for el in res.get("elements", []):
+        coords = [xy((g["lat"], g["lon"])) for g in el.get("geometry", []) if g]
+        if not coords:
+            continue
+        tags = el.get("tags", {})
+        if "building" in tags and len(coords) >= 4 and coords[0] == coords[-1]:
+            geoms.append(Polygon(coords))
+        elif len(coords) >= 2:
+            geoms.append(LineString(coords))
+        else:
+            geoms.append(Point(coords[0]))
+
+    clearance = [float("inf")] * len(points)
+    if not geoms:
+        return clearance
+    shapely.prepare(geoms)
+    tree = STRtree(geoms)
+    pts = [Point(xy((p["lat"], p["lon"]))) for p in points]
+    (pt_idx, _), dist = tree.query_nearest(pts, max_distance=search_m, return_distance=True)
+    for i, d in zip(pt_idx, dist):
+        clearance[i] = min(clearance[i], float(d))
+    return clearance
+
+
+def points_actually_empty(points, deadline=None):
+    """✅ Whether each point has no building/highway within EMPTY_CLEARANCE_M, one query for all
+
+    A failed query counts every point as empty.
+    """
+    clearance = points_clearance(points, EMPTY_CLEARANCE_M, deadline)
+    if clearance is None:
+        return [True] * len(points)
+    return [d > EMPTY_CLEARANCE_M for d in clearance]
 
 
 # ------------------------------------------------
@@ -73,14 +160,16 @@ def nominatim_autocomplete(q, limit=8):
     if "bengaluru" not in q.lower() and "bangalore" not in q.lower():
         query = f"{q}, Bengaluru"
     
+    requested = limit * 3
     url = (
-        "https://nominatim.openstreetmap.org/search?"
-        f"format=json&addressdetails=1&limit={limit * 3}&countrycodes=in&q={quote_plus(query)}"
+        f"{NOMINATIM}/search?"
+        f"format=json&addressdetails=1&limit={requested}&countrycodes=in&q={quote_plus(query)}"
     )
     headers = {"User-Agent": "UrbanInfraAI/1.0"}
+    deadline = Deadline(AUTOCOMPLETE_BUDGET_S)
 
     try:
-        r = requests.get(url, headers=headers, timeout=10)
+        r = http_get("nominatim", url, headers=headers, timeout=10, deadline=deadline)
         data = r.json()
 
         results = []
@@ -111,13 +200,14 @@ def nominatim_autocomplete(q, limit=8):
                 })
         
         # If no results, try backup
-        if not results:
+        backup = not results
+        if backup:
             backup_query = f"{q}, Bangalore, Karnataka"
             url2 = (
-                "https://nominatim.openstreetmap.org/search?"
+                f"{NOMINATIM}/search?"
                 f"format=json&addressdetails=1&limit={limit}&q={quote_plus(backup_query)}"
             )
-            r2 = requests.get(url2, headers=headers, timeout=10)
+            r2 = http_get("nominatim", url2, headers=headers, timeout=10, deadline=deadline)
             data2 = r2.json()
             
             for el in data2:
@@ -129,6 +219,12 @@ def nominatim_autocomplete(q, limit=8):
                         "lon": float(el["lon"])
                     })
 
+        add_places(results)
+        if not backup:
+            # Completeness is judged on upstream's raw rows, before the Bengaluru
+            # filter; backup answers come from another query and are never recorded
+            mark_answered(q, results, len(data), requested)
+
         # ✅ RANK RESULTS - Places starting with query appear first
         ranked_results = rank_search_results(results, q)
         
@@ -143,10 +239,10 @@ def photon_autocomplete(q, limit=8):
     if "bengaluru" not in q.lower() and "bangalore" not in q.lower():
         query = f"{q} Bengaluru Karnataka"
     
-    url = f"https://photon.komoot.io/api/?q={quote_plus(query)}&limit=20"
+    url = f"{PHOTON}/api/?q={quote_plus(query)}&limit=20"
 
     try:
-        r = requests.get(url, timeout=10)
+        r = http_get("photon", url, timeout=10, deadline=Deadline(AUTOCOMPLETE_BUDGET_S))
         data = r.json()
 
         results = []
@@ -183,6 +279,8 @@ def photon_autocomplete(q, limit=8):
                     "lon": coords[0]
                 })
 
+        add_places(results)
+
         # ✅ RANK RESULTS
         ranked_results = rank_search_results(results, q)
         
@@ -191,10 +289,11 @@ def photon_autocomplete(q, limit=8):
         return []
 
 
-def nominatim_lookup(q):
+@timed("geocode")
+def nominatim_lookup(q, deadline=None):
     url = f"{NOMINATIM}/search?format=jsonv2&q={quote_plus(q)}&limit=1"
     try:
-        r = requests.get(url, headers=HEADERS, timeout=10)
+        r = http_get("nominatim", url, headers=HEADERS, timeout=10, deadline=deadline)
         res = r.json()
         if not res: return None
         return res[0]
@@ -219,13 +318,13 @@ def haversine_m(a_lat, a_lon, b_lat, b_lon):
 # FAST EMPTY LAND SEARCH
 # ------------------------------------------------
 
-def overpass_query(q):
-    r = requests.post(OVERPASS, data={"data": q}, headers=HEADERS, timeout=60)
-    r.raise_for_status()
-    return r.json()
+def overpass_query(q, deadline=None, timeout=60):
+    """Overpass JSON for q from the data source; concurrent identical queries share one request (read-only result)"""
+    return overpass_flights.do(q, lambda: data_source.query(q, deadline, timeout), wait_timeout(deadline))
 
 
-def overpass_candidates_near(lat, lon, radius_m, infra_type, max_candidates=10):
+@timed("candidates")
+def overpass_candidates_near(lat, lon, radius_m, infra_type, max_candidates=10, deadline=None):
     """✅ FAST VERSION: Finds empty land quickly"""
     
     q = f"""
@@ -238,7 +337,7 @@ def overpass_candidates_near(lat, lon, radius_m, infra_type, max_candidates=10):
     """
 
     try:
-        res = overpass_query(q)
+        res = overpass_query(q, deadline=deadline)
     except:
         print("⚠️ Overpass query failed")
         return []
@@ -249,40 +348,46 @@ def overpass_candidates_near(lat, lon, radius_m, infra_type, max_candidates=10):
         print("⚠️ No empty land found - using fallback")
         return []
 
-    candidates = []
-    seen = set()
-
     print(f"🔎 Found {len(elements)} potential sites. Quick validation...")
 
+    eligible = []
+    seen = set()
     for el in elements[:15]:
-        if len(candidates) >= max_candidates:
-            break
-
         if "center" not in el:
             continue
-            
+
         cx, cy = el["center"]["lat"], el["center"]["lon"]
-        
+
         key = (round(cx, 5), round(cy, 5))
         if key in seen:
             continue
         seen.add(key)
 
         tags = el.get("tags", {})
-        
+
         if "building" in tags or "highway" in tags or "amenity" in tags:
             continue
-        
-        if len(candidates) < 5:
-            if not is_point_actually_empty(cx, cy):
-                print(f"❌ Rejected {cx:.5f},{cy:.5f}")
-                continue
-        
+
+        eligible.append({"lat": cx, "lon": cy, "tags": tags})
+
+    # One batched Overpass call instead of one per site
+    empty = points_actually_empty(eligible, deadline)
+
+    candidates = []
+    for site, is_empty in zip(eligible, empty):
+        if len(candidates) >= max_candidates:
+            break
+
+        cx, cy = site["lat"], site["lon"]
+        if len(candidates) < 5 and not is_empty:
+            print(f"❌ Rejected {cx:.5f},{cy:.5f}")
+            continue
+
         print(f"✅ Accepted: {cx:.5f},{cy:.5f}")
         candidates.append({
             "lat": cx,
             "lon": cy,
-            "tags": tags,
+            "tags": site["tags"],
             "type": "verified_empty_land",
             "geom": None
         })
@@ -291,36 +396,40 @@ def overpass_candidates_near(lat, lon, radius_m, infra_type, max_candidates=10):
     return candidates
 
 
-def fallback_generate_empty_spaces(lat, lon, radius_m, count=8):
-    """✅ FAST FALLBACK"""
-    results = []
-    attempts = 0
-    max_attempts = count * 2
-
+@timed("candidates.fallback")
+def fallback_generate_empty_spaces(lat, lon, radius_m, count=8, deadline=None):
+    """✅ FAST FALLBACK: sample many points, validate in one batch, keep the clearest"""
     print("⚠️ Using quick fallback...")
 
-    while len(results) < count and attempts < max_attempts:
-        attempts += 1
-        
+    samples = []
+    for _ in range(FALLBACK_SAMPLES):
         angle = random.uniform(0, 2 * math.pi)
         dist = random.uniform(0.3 * radius_m, 0.8 * radius_m)
 
         dx = (dist / 111320) * math.cos(angle)
         dy = (dist / 110540) * math.sin(angle)
 
-        new_lat = lat + dy
-        new_lon = lon + dx
+        samples.append({"lat": lat + dy, "lon": lon + dx})
 
-        if is_point_actually_empty(new_lat, new_lon):
-            results.append({
-                "lat": new_lat,
-                "lon": new_lon,
-                "tags": {"fallback": "generated_vacant_plot"},
-                "type": "verified_empty_space",
-                "geom": None
-            })
+    clearance = points_clearance(samples, FALLBACK_SEARCH_M, deadline)
+    if clearance is None:
+        # Same as the per-point check: treat unverifiable points as empty
+        clearance = [float("inf")] * len(samples)
 
-    print(f"✅ Generated {len(results)} fallback points")
+    # Most clearance first; ties keep sampling order
+    order = sorted(
+        (i for i, d in enumerate(clearance) if d > EMPTY_CLEARANCE_M),
+        key=lambda i: -clearance[i]
+    )
+    results = [{
+        "lat": samples[i]["lat"],
+        "lon": samples[i]["lon"],
+        "tags": {"fallback": "generated_vacant_plot"},
+        "type": "verified_empty_space",
+        "geom": None
+    } for i in order[:count]]
+
+    print(f"✅ Generated {len(results)} fallback points from {len(samples)} samples")
     return results
 
 
@@ -328,31 +437,41 @@ def fallback_generate_empty_spaces(lat, lon, radius_m, count=8):
 # AIR QUALITY
 # ------------------------------------------------
 
-def get_air_quality_openweather(lat, lon):
-    url = f"https://api.openweathermap.org/data/2.5/air_pollution"
+def fetch_air_quality_openweather(lat, lon, deadline=None):
+    """One OpenWeather reading as (aqi, pm25); raises when the call or data fails"""
+    url = f"{OPENWEATHER}/data/2.5/air_pollution"
     params = {"lat": lat, "lon": lon, "appid": OPENWEATHER_API_KEY}
-    
-    try:
-        resp = requests.get(url, params=params, timeout=5)
-        resp.raise_for_status()
-        data = resp.json()
-        
-        if "list" in data and len(data["list"]) > 0:
-            aqi = data["list"][0]["main"]["aqi"]
-            components = data["list"][0]["components"]
-            pm25 = components.get("pm2_5", None)
-            return aqi, pm25
-        return 3, None
-    except Exception as e:
-        print(f"Air quality error: {e}")
-        return 3, None
+
+    resp = http_get("openweather", url, params=params, timeout=5, deadline=deadline)
+    resp.raise_for_status()
+    data = resp.json()
+
+    if "list" in data and len(data["list"]) > 0:
+        aqi = data["list"][0]["main"]["aqi"]
+        components = data["list"][0]["components"]
+        pm25 = components.get("pm2_5", None)
+        return aqi, pm25
+    raise ValueError("no air quality data in response")
+
+
+@timed("metric.aqi")
+def get_air_quality_openweather(lat, lon, deadline=None):
+    """✅ (aqi, pm25) for the point's AQI grid cell, cached until the next provider update
+
+    Raises when no reading is available; callers decide on a fallback.
+    """
+    return aqi_for_point(lat, lon, deadline)
 
 
 # ------------------------------------------------
 # METRICS HELPERS
 # ------------------------------------------------
+# The helpers raise when their lookup fails rather than returning a made-up
+# value, so compute_base_metrics marks the metric as imputed and doesn't
+# cache the cell.
 
-def buildings_count_proxy(lat, lon, radius_m):
+@timed("metric.buildings")
+def buildings_count_proxy(lat, lon, radius_m, deadline=None):
     q = f"""
     [out:json][timeout:15];
     (
@@ -361,14 +480,12 @@ def buildings_count_proxy(lat, lon, radius_m):
     );
     out;
     """
-    try:
-        res = requests.post(OVERPASS, data={"data": q}, headers=HEADERS, timeout=30).json()
-        return float(len(res.get("elements", [])))
-    except:
-        return 20.0
+    res = overpass_query(q, deadline=deadline, timeout=30)
+    return float(len(res.get("elements", [])))
 
 
-def distance_to_nearest_road(lat, lon, radius_m):
+@timed("metric.road")
+def distance_to_nearest_road(lat, lon, radius_m, deadline=None):
     q = f"""
     [out:json][timeout:15];
     (
@@ -376,19 +493,17 @@ def distance_to_nearest_road(lat, lon, radius_m):
     );
     out center;
     """
-    try:
-        res = requests.post(OVERPASS, data={"data": q}, headers=HEADERS, timeout=20).json()
-        dmin = radius_m
-        for el in res.get("elements", []):
-            if "center" in el:
-                d = haversine_m(lat, lon, el["center"]["lat"], el["center"]["lon"])
-                if d < dmin: dmin = d
-        return float(dmin)
-    except:
-        return float(radius_m)
+    res = overpass_query(q, deadline=deadline, timeout=20)
+    dmin = radius_m
+    for el in res.get("elements", []):
+        if "center" in el:
+            d = haversine_m(lat, lon, el["center"]["lat"], el["center"]["lon"])
+            if d < dmin: dmin = d
+    return float(dmin)
 
 
-def lake_proximity(lat, lon, radius_m):
+@timed("metric.lake")
+def lake_proximity(lat, lon, radius_m, deadline=None):
     q = f"""
     [out:json][timeout:20];
     (
@@ -398,20 +513,18 @@ def lake_proximity(lat, lon, radius_m):
     );
     out center;
     """
-    try:
-        res = requests.post(OVERPASS, data={"data": q}, headers=HEADERS, timeout=20).json()
-        dmin = radius_m
-        for el in res.get("elements", []):
-            if "center" in el:
-                d = haversine_m(lat, lon, el["center"]["lat"], el["center"]["lon"])
-                if d < dmin: dmin = d
-        near = dmin <= 300
-        return float(dmin), near
-    except:
-        return float(radius_m), False
-
-
-def green_proxy(lat, lon, radius_m):
+    res = overpass_query(q, deadline=deadline, timeout=20)
+    dmin = radius_m
+    for el in res.get("elements", []):
+        if "center" in el:
+            d = haversine_m(lat, lon, el["center"]["lat"], el["center"]["lon"])
+            if d < dmin: dmin = d
+    near = dmin <= 300
+    return float(dmin), near
+
+
+@timed("metric.green")
+def green_proxy(lat, lon, radius_m, deadline=None):
     q = f"""
     [out:json][timeout:20];
     (
@@ -420,27 +533,26 @@ def green_proxy(lat, lon, radius_m):
     );
     out;
     """
-    try:
-        res = requests.post(OVERPASS, data={"data": q}, headers=HEADERS, timeout=20).json()
-        cnt = len(res.get("elements", []))
-        return float(min(80.0, (cnt / 10.0) * 80.0))
-    except:
-        return 10.0
-
-
-def distance_to_nearest_amenity(lat, lon, infra_type, radius_m):
-    mapping = {
-        "hospital": "hospital",
-        "clinic": "clinic",
-        "pharmacy": "pharmacy",
-        "school": "school",
-        "park": "park",
-        "metro": "train_station",
-        "bus_stop": "bus_stop",
-        "market": "marketplace"
-    }
-    amen = mapping.get(infra_type, infra_type)
-
+    res = overpass_query(q, deadline=deadline, timeout=20)
+    cnt = len(res.get("elements", []))
+    return float(min(80.0, (cnt / 10.0) * 80.0))
+
+
+AMENITY_MAPPING = {
+    "hospital": "hospital",
+    "clinic": "clinic",
+    "pharmacy": "pharmacy",
+    "school": "school",
+    "park": "park",
+    "metro": "train_station",
+    "bus_stop": "bus_stop",
+    "market": "marketplace"
+}
+
+
+@timed("metric.same_infra")
+def distance_to_nearest_amenity(lat, lon, infra_type, radius_m, deadline=None):
+    amen = AMENITY_MAPPING.get(infra_type, infra_type)
     q = f"""
     [out:json][timeout:15];
     (
@@ -450,70 +562,412 @@ def distance_to_nearest_amenity(lat, lon, infra_type, radius_m):
     );
     out center;
     """
-    try:
-        res = requests.post(OVERPASS, data={"data": q}, headers=HEADERS, timeout=25).json()
-        min_d = radius_m
-        for el in res.get("elements", []):
-            if "center" in el:
-                d = haversine_m(lat, lon, el["center"]["lat"], el["center"]["lon"])
-                if d < min_d: min_d = d
-            elif "lat" in el and "lon" in el:
-                d = haversine_m(lat, lon, el["lat"], el["lon"])
-                if d < min_d: min_d = d
-        return float(min_d)
-    except:
-        return float(radius_m)
+    res = overpass_query(q, deadline=deadline, timeout=25)
+    min_d = radius_m
+    for el in res.get("elements", []):
+        if "center" in el:
+            d = haversine_m(lat, lon, el["center"]["lat"], el["center"]["lon"])
+            if d < min_d: min_d = d
+        elif "lat" in el and "lon" in el:
+            d = haversine_m(lat, lon, el["lat"], el["lon"])
+            if d < min_d: min_d = d
+    return float(min_d)
+
+
+# ------------------------------------------------
+# BATCHED METRIC LAYERS
+# ------------------------------------------------
+
+# Radius (m) each metric helper searches around a candidate
+METRIC_RADII = {
+    "buildings": 500,
+    "roads": 2000,
+    "water": 2000,
+    "green": 500,
+    "amenity": 3000
+}
+
+EARTH_M_PER_DEG = 6371000 * math.pi / 180
+
+
+def bbox_around_points(points, pad_m):
+    """(south, west, north, east) covering every point plus pad_m on all sides"""
+    lats = [p["lat"] for p in points]
+    lons = [p["lon"] for p in points]
+    dlat = pad_m / EARTH_M_PER_DEG
+    max_abs_lat = min(89.0, max(abs(l) for l in lats) + dlat)
+    dlon = dlat / math.cos(math.radians(max_abs_lat))
+    return (min(lats) - dlat, min(lons) - dlon, max(lats) + dlat, max(lons) + dlon)
+
+
+# Overpass selectors behind each metric helper's query
+LAYER_SELECTORS = {
+    "buildings": ['way[building]', 'node[building]'],
+    "roads": ['way["highway"]'],
+    "water": ['way["natural"="water"]', 'way["water"]', 'relation["water"]'],
+    "green": ['way["landuse"~"forest|meadow|grass"]', 'way["leisure"~"park|garden"]']
+}
+BASE_LAYERS = ["buildings", "roads", "water", "green"]
+
+# Green areas are counted when any part lies within the radius, so they need
+# their outline (`out geom`). Every other layer is only used through its
+# center - nearest center, or buildings counted by center - so `out center`
+# answers it exactly at a fraction of the bytes.
+GEOM_LAYERS = ("green",)
+
+
+def layer_selectors(layer):
+    """Selectors for a base layer or an "amenity:<value>" layer"""
+    if layer.startswith("amenity:"):
+        amen = layer.split(":", 1)[1]
+        return [f"node[amenity={amen}]", f"way[amenity={amen}]", f"relation[amenity={amen}]"]
+    return LAYER_SELECTORS[layer]
+
+
+def layer_radius(layer):
+    return METRIC_RADII["amenity" if layer.startswith("amenity:") else layer]
+
+
+def metric_layer_areas(points, amenities, base_points=None):
+    """[(layer, bbox)] that compute_candidate_metrics needs around the points"""
+    if base_points is None:
+        base_points = points
+    wanted = [(layer, base_points) for layer in BASE_LAYERS if base_points]
+    wanted += [(f"amenity:{amen}", points) for amen in amenities]
+    return [(layer, bbox_around_points(pts, layer_radius(layer) + 50)) for layer, pts in wanted]
+
+
+def layers_query(areas, timeout=60, digits=6):
+    """One Overpass query for [(layer, (s, w, n, e))]: `out center` except GEOM_LAYERS"""
+    parts = {"center": "", "geom": ""}
+    for layer, (s, w, n, e) in areas:
+        mode = "geom" if layer in GEOM_LAYERS else "center"
+        for sel in layer_selectors(layer):
+            parts[mode] += f"""
+      {sel}({s:.{digits}f},{w:.{digits}f},{n:.{digits}f},{e:.{digits}f});"""
+    body = "".join(f"""
+    ({lines}
+    );
+    out {mode};""" for mode, lines in parts.items() if lines)
+    return f"""
+    [out:json][timeout:{timeout}];{body}
+    """
+
+
+def metric_layers_query(points, amenities, base_points=None):
+    """One Overpass query returning every layer compute_candidate_metrics needs
+
+    Infra-independent layers are only requested around base_points (defaults to
+    points); pass an empty list when every base metric is already cached.
+    """
+    return layers_query(metric_layer_areas(points, amenities, base_points))
+
+
+def _element_feature(el):
+    """Reduce an Overpass `out geom` or `out center` element to center, bounds and polylines
+
+    A center-only element becomes a point feature, so membership tests use its center.
+    """
+    fid = f"{el.get('type', '')[:1]}{el.get('id', '')}"
+    if el.get("type") == "node" or "center" in el:
+        c = el["center"] if "center" in el else el
+        pt = (c["lat"], c["lon"])
+        return {"id": fid, "center": pt, "bounds": (pt[0], pt[1], pt[0], pt[1]), "lines": [[pt]]}
+
+    lines = []
+    if el.get("type") == "way":
+        lines.append([(p["lat"], p["lon"]) for p in el.get("geometry", []) if p])
+    else:
+        for m in el.get("members", []):
+            if "geometry" in m:
+                lines.append([(p["lat"], p["lon"]) for p in m["geometry"] if p])
+            elif "lat" in m and "lon" in m:
+                lines.append([(m["lat"], m["lon"])])
+    lines = [ln for ln in lines if ln]
+    if not lines:
+        return None
+
+    b = el.get("bounds")
+    if b:
+        bounds = (b["minlat"], b["minlon"], b["maxlat"], b["maxlon"])
+    else:
+        pts = [p for ln in lines for p in ln]
+        bounds = (min(p[0] for p in pts), min(p[1] for p in pts),
+                  max(p[0] for p in pts), max(p[1] for p in pts))
+    # Overpass `out center` uses the middle of the bounding box
+    center = ((bounds[0] + bounds[2]) / 2, (bounds[1] + bounds[3]) / 2)
+    return {"id": fid, "center": center, "bounds": bounds, "lines": lines}
+
+
+def split_metric_layers(elements, amenities, with_base=True):
+    """Sort elements into the layers each metric helper would have queried"""
+    layers = {"buildings": [], "roads": [], "water": [], "green": []} if with_base else {}
+    for amen in amenities:
+        layers[f"amenity:{amen}"] = []
+
+    for el in elements:
+        tags = el.get("tags", {})
+        etype = el.get("type")
+        feat = _element_feature(el)
+        if feat is None:
+            continue
+        # An element in both outputs (a park that is also a road) is sorted by the output it came from
+        geom = "bounds" in el
+
+        if with_base:
+            if geom:
+                if etype == "way" and (re.search("forest|meadow|grass", tags.get("landuse", "")) or
+                                       re.search("park|garden", tags.get("leisure", ""))):
+                    layers["green"].append(feat)
+                continue
+            if "building" in tags and etype in ("way", "node"):
+                layers["buildings"].append(feat)
+            if etype == "way" and "highway" in tags:
+                layers["roads"].append(feat)
+            if (etype == "way" and tags.get("natural") == "water") or \
+                    (etype in ("way", "relation") and "water" in tags):
+                layers["water"].append(feat)
+        key = f"amenity:{tags.get('amenity')}"
+        if key in layers and not geom:
+            layers[key].append(feat)
+
+    return layers
+
+
+@timed("layers")
+def fetch_metric_layers(points, infra_types, base_points=None, deadline=None):
+    """✅ All candidates' metric layers from the tile store (if enabled and warm), else one Overpass round-trip"""
+    if not points:
+        return None
+    if isinstance(infra_types, str):
+        infra_types = [infra_types]
+    amenities = sorted({AMENITY_MAPPING.get(t, t) for t in infra_types})
+    if base_points is None:
+        base_points = points
+
+    layers = None
+    if FEATURE_TILES:
+        try:
+            layers = layer_features(metric_layer_areas(points, amenities, base_points), deadline)
+        except Exception as e:
+            print(f"⚠️ Feature tiles unavailable, querying directly: {e}")
+    if layers is None:
+        try:
+            res = overpass_query(metric_layers_query(points, amenities, base_points), deadline=deadline)
+        except Exception as e:
+            print(f"⚠️ Batched layer query failed: {e}")
+            return None
+        layers = split_metric_layers(res.get("elements", []), amenities, with_base=bool(base_points))
+    print("📦 Layers: " + ", ".join(f"{k}={len(v)}" for k, v in layers.items()))
+
+    # Nearest-distance layers get an STRtree so each lookup is O(log n)
+    layers["indexes"] = {
+        name: NearestIndex.from_features(feats)
+        for name, feats in layers.items()
+        if name in ("roads", "water") or name.startswith("amenity:")
+    }
+    return layers
+
+
+def _local_xy(lat0, lon0):
+    kx = EARTH_M_PER_DEG * math.cos(math.radians(lat0))
+    return lambda p: ((p[1] - lon0) * kx, (p[0] - lat0) * EARTH_M_PER_DEG)
+
+
+def _bounds_distance_m(lat, lon, bounds, farthest=False):
+    xy = _local_xy(lat, lon)
+    x0, y0 = xy((bounds[0], bounds[1]))
+    x1, y1 = xy((bounds[2], bounds[3]))
+    if farthest:
+        dx = max(abs(x0), abs(x1))
+        dy = max(abs(y0), abs(y1))
+    else:
+        dx = max(x0, 0.0, -x1)
+        dy = max(y0, 0.0, -y1)
+    return math.hypot(dx, dy)
+
+
+def _lines_distance_m(lat, lon, lines):
+    """Distance from the point to the nearest vertex or segment of the feature"""
+    xy = _local_xy(lat, lon)
+    best = float("inf")
+    for line in lines:
+        pts = [xy(p) for p in line]
+        if len(pts) == 1:
+            best = min(best, math.hypot(*pts[0]))
+            continue
+        for (ax, ay), (bx, by) in zip(pts, pts[1:]):
+            vx, vy = bx - ax, by - ay
+            seg2 = vx * vx + vy * vy
+            t = 0.0 if seg2 == 0 else max(0.0, min(1.0, -(ax * vx + ay * vy) / seg2))
+            best = min(best, math.hypot(ax + t * vx, ay + t * vy))
+    return best
+
+
+def _within(lat, lon, feat, radius_m):
+    """Same membership test as Overpass `around:radius_m`"""
+    if _bounds_distance_m(lat, lon, feat["bounds"]) > radius_m:
+        return False
+    if _bounds_distance_m(lat, lon, feat["bounds"], farthest=True) <= radius_m:
+        return True
+    return _lines_distance_m(lat, lon, feat["lines"]) <= radius_m
+
+
+def layer_count_within(features, lat, lon, radius_m):
+    return sum(1 for f in features if _within(lat, lon, f, radius_m))
+
+
+def layer_nearest_center(features, lat, lon, radius_m, index=None):
+    """Nearest feature center, capped at radius_m (these layers are fetched as centers)"""
+    if index is not None:
+        return index.nearest(lat, lon, radius_m)
+
+    dmin = radius_m
+    for f in features:
+        d = haversine_m(lat, lon, f["center"][0], f["center"][1])
+        if d < dmin:
+            dmin = d
+    return float(dmin)
+
+
+@timed("metric.local")
+def local_base_metrics(lat, lon, layers):
+    """Infra-independent metric helpers evaluated against prefetched layers, no network"""
+    pop_proxy = float(layer_count_within(layers["buildings"], lat, lon, METRIC_RADII["buildings"]))
+    indexes = layers.get("indexes", {})
+    dist_road = layer_nearest_center(layers["roads"], lat, lon, METRIC_RADII["roads"], indexes.get("roads"))
+    lake_dist_m = layer_nearest_center(layers["water"], lat, lon, METRIC_RADII["water"], indexes.get("water"))
+    near_lake = lake_dist_m <= 300
+    cnt = layer_count_within(layers["green"], lat, lon, METRIC_RADII["green"])
+    green_pct = float(min(80.0, (cnt / 10.0) * 80.0))
+    return pop_proxy, dist_road, (lake_dist_m, near_lake), green_pct
 
 
 # ------------------------------------------------
 # COMPUTE METRICS
 # ------------------------------------------------
 
-def compute_candidate_metrics(candidate, infra_type, origin=(0,0)):
+# Metric -> the criterion it feeds; completeness flags and imputation use this
+METRIC_CRITERIA = {
+    "pop": "population_need",
+    "dist_road_m": "accessibility",
+    "lake_dist_m": "lake_protection",
+    "green_pct": "green_balance",
+    "aqi": "pollution_risk",
+    "dist_to_same_infra_m": "redundancy"
+}
+
+
+def _bounded_result(future, deadline, placeholder, missing, metric):
+    """future.result() within the deadline (if any); on timeout/failure record the metric as missing"""
+    try:
+        return future.result(timeout=wait_timeout(deadline))
+    except Exception as e:
+        future.cancel()
+        print(f"⏱️ {metric} unavailable: {e}")
+        missing.append(metric)
+        return placeholder
+
+
+def compute_base_metrics(lat, lon, layers=None, deadline=None):
+    """Metrics shared by every infra type; stored in the grid-cell cache
+
+    Metrics whose lookup failed or missed the deadline are listed in
+    base["missing"] (their values are placeholders only) and the cell is not cached.
+    """
+    missing = []
+    aqi_future = _lookup_pool.submit(get_air_quality_openweather, lat, lon, deadline)
+    if layers is not None and "buildings" in layers:
+        pop_proxy, dist_road, (lake_dist_m, near_lake), green_pct = local_base_metrics(lat, lon, layers)
+    else:
+        # Fan the per-point lookups out; http_client caps in-flight Overpass calls
+        futures = [
+            _lookup_pool.submit(buildings_count_proxy, lat, lon, METRIC_RADII["buildings"], deadline),
+            _lookup_pool.submit(distance_to_nearest_road, lat, lon, METRIC_RADII["roads"], deadline),
+            _lookup_pool.submit(lake_proximity, lat, lon, METRIC_RADII["water"], deadline),
+            _lookup_pool.submit(green_proxy, lat, lon, METRIC_RADII["green"], deadline),
+        ]
+        pop_proxy = _bounded_result(futures[0], deadline, 0.0, missing, "pop")
+        dist_road = _bounded_result(futures[1], deadline, float(METRIC_RADII["roads"]), missing, "dist_road_m")
+        lake_dist_m, near_lake = _bounded_result(futures[2], deadline, (float(METRIC_RADII["water"]), False),
+                                                 missing, "lake_dist_m")
+        green_pct = _bounded_result(futures[3], deadline, None, missing, "green_pct")
+    aqi, pm25 = _bounded_result(aqi_future, deadline, (3, None), missing, "aqi")
+
+    base = {
+        "pop": float(pop_proxy),
+        "dist_road_m": float(dist_road),
+        "near_lake": bool(near_lake),
+        "lake_dist_m": float(lake_dist_m),
+        "green_pct": float(green_pct) if green_pct is not None else None,
+        "aqi": int(aqi),
+        "pm25": float(pm25) if pm25 is not None else None
+    }
+    if missing:
+        base["missing"] = missing
+    else:
+        set_cell_metrics(lat, lon, base)
+    return base
+
+
+def lookup_base_metrics(candidates, deadline=None):
+    """Grid-cell cache lookup per candidate; None where the cell must be computed
+
+    Cached cells keep their OSM metrics for a day but take AQI from the
+    hourly AQI grid, so air quality is never older than one provider update
+    (when no current reading can be had, "aqi" is reported missing).
+    """
+    bases = [get_cell_metrics(c["lat"], c["lon"]) for c in candidates]
+    return [None if b is None else current_aqi(b, c["lat"], c["lon"], deadline) for b, c in zip(bases, candidates)]
+
+
+def compute_candidate_metrics(candidate, infra_type, origin=(0,0), layers=None, base=None, deadline=None):
     lat = candidate.get("lat")
     lon = candidate.get("lon")
     origin_lat, origin_lon = origin
 
     dist_m = haversine_m(origin_lat, origin_lon, lat, lon)
-    pop_proxy = buildings_count_proxy(lat, lon, radius_m=500)
-    dist_road = distance_to_nearest_road(lat, lon, radius_m=2000)
-    lake_dist_m, near_lake = lake_proximity(lat, lon, radius_m=2000)
-    green_pct = green_proxy(lat, lon, radius_m=500)
-    aqi, pm25 = get_air_quality_openweather(lat, lon)
-    dist_same = distance_to_nearest_amenity(lat, lon, infra_type, radius_m=3000)
+    amen_layer = f"amenity:{AMENITY_MAPPING.get(infra_type, infra_type)}"
+    same_future = None
+    if layers is None or amen_layer not in layers:
+        same_future = _lookup_pool.submit(distance_to_nearest_amenity, lat, lon, infra_type,
+                                          METRIC_RADII["amenity"], deadline)
+
+    if base is None:
+        base = compute_base_metrics(lat, lon, layers, deadline)
+
+    missing = list(base.get("missing", []))
+    if same_future is not None:
+        dist_same = _bounded_result(same_future, deadline, float(METRIC_RADII["amenity"]),
+                                    missing, "dist_to_same_infra_m")
+    else:
+        dist_same = layer_nearest_center(layers[amen_layer], lat, lon, METRIC_RADII["amenity"],
+                                         layers.get("indexes", {}).get(amen_layer))
+
+    return score_candidate(candidate, infra_type, dist_m, base, dist_same, missing)
+
+
+def score_candidate(candidate, infra_type, dist_m, base, dist_same, missing=None):
+    """Infra-specific scoring on top of the shared base metrics
+
+    `missing` lists metrics that failed or were not fetched in time:
+    they are reported as None, their criteria are listed in "imputed" for
+    rank_candidates to fill in, and "completeness" flags every metric.
+    """
+    pop_proxy = base["pop"]
+    dist_road = base["dist_road_m"]
+    near_lake = base["near_lake"]
+    lake_dist_m = base["lake_dist_m"]
+    green_pct = base["green_pct"]
+    aqi = base["aqi"]
+    pm25 = base["pm25"]
 
     scores = {
-        "accessibility": max(0.0, 1 - (dist_road / 2000.0)),
-        "population_need": min(1.0, pop_proxy / 200.0),
-        "lake_protection": 0.0 if near_lake else 1.0,
-        "green_balance": min(1.0, (green_pct or 0) / 40.0),
-        "pollution_risk": 1.0 if aqi <= 2 else (0.5 if aqi == 3 else 0.0),
-        "redundancy": max(0.0, 1 - (dist_same / 3000.0))
+        k: float(v) for k, v in
+        raw_score_columns(infra_type, pop_proxy, dist_road, near_lake, green_pct, aqi, dist_same).items()
     }
 
-    infra = infra_type.lower()
-    if infra in ["hospital", "clinic", "pharmacy"]:
-        scores["accessibility"] = max(scores["accessibility"], 1 - (dist_road / 1500.0))
-        if aqi >= 4:
-            scores["pollution_risk"] = 0.0
-        if near_lake:
-            scores["lake_protection"] = 0.0
-
-    if infra == "school":
-        scores["population_need"] = min(1.0, pop_proxy / 120.0)
-        if aqi >= 4:
-            scores["pollution_risk"] = 0.0
-        if dist_road < 40:
-            scores["accessibility"] *= 0.6
-
-    if infra == "park":
-        scores["green_balance"] = min(1.0, (green_pct or 0) / 20.0)
-        if aqi >= 4:
-            scores["pollution_risk"] = 0.0
-
-    reason = build_reason_text(candidate, infra_type, dist_m, pop_proxy, dist_road, near_lake, lake_dist_m, green_pct, aqi, pm25, dist_same, scores)
-
-    return {
+    metrics = {
         "pop": float(pop_proxy),
         "dist_m": float(dist_m),
         "dist_road_m": float(dist_road),
@@ -522,30 +976,135 @@ def compute_candidate_metrics(candidate, infra_type, origin=(0,0)):
         "green_pct": float(green_pct) if green_pct is not None else None,
         "aqi": int(aqi),
         "pm25": float(pm25) if pm25 is not None else None,
-        "dist_to_same_infra_m": float(dist_same),
-        "raw_scores": scores,
-        "reason": reason
+        "dist_to_same_infra_m": float(dist_same)
+    }
+    if missing is not None:
+        for m in missing:
+            metrics[m] = None
+        if "lake_dist_m" in missing:
+            metrics["near_lake"] = None
+        if "aqi" in missing:
+            metrics["pm25"] = None
+        metrics["completeness"] = {m: m not in missing for m in METRIC_CRITERIA}
+        metrics["imputed"] = [METRIC_CRITERIA[m] for m in METRIC_CRITERIA if m in missing]
+
+    metrics["raw_scores"] = scores
+    metrics["reason"] = build_reason_text(
+        candidate, infra_type, dist_m, metrics["pop"], metrics["dist_road_m"], metrics["near_lake"],
+        metrics["lake_dist_m"], metrics["green_pct"], metrics["aqi"], metrics["pm25"],
+        metrics["dist_to_same_infra_m"], scores
+    )
+    return metrics
+
+
+def unscored_candidate(candidate, infra_type, origin):
+    """Metrics for a candidate whose enrichment missed the deadline entirely"""
+    dist_m = haversine_m(origin[0], origin[1], candidate.get("lat"), candidate.get("lon"))
+    base = {
+        "pop": 0.0,
+        "dist_road_m": float(METRIC_RADII["roads"]),
+        "near_lake": False,
+        "lake_dist_m": float(METRIC_RADII["water"]),
+        "green_pct": None,
+        "aqi": 3,
+        "pm25": None
+    }
+    return score_candidate(candidate, infra_type, dist_m, base, float(METRIC_RADII["amenity"]),
+                           list(METRIC_CRITERIA))
+
+
+def iter_enriched_candidates(candidates, infra_type, origin, layers=None, bases=None, deadline=None):
+    """Enrich candidates in parallel, yielding (index, candidate) as each finishes
+
+    Candidates still queued when the deadline passes are yielded fully imputed.
+    """
+    if bases is None:
+        bases = [None] * len(candidates)
+    futures = {
+        _enrich_pool.submit(compute_candidate_metrics, cand, infra_type, origin, layers, base, deadline): i
+        for i, (cand, base) in enumerate(zip(candidates, bases))
     }
+    pending = set(futures.values())
+    # Per-metric waits stop at the deadline; the grace lets those partial results land
+    timeout = None if deadline is None else deadline.remaining() + DEADLINE_GRACE_S
+    try:
+        for fut in as_completed(futures, timeout=timeout):
+            i = futures[fut]
+            candidates[i].update(fut.result())
+            pending.discard(i)
+            yield i, candidates[i]
+    except FutureTimeout:
+        for fut, i in futures.items():
+            if i in pending:
+                fut.cancel()
+                print(f"⏱️ Candidate {i} not enriched within deadline")
+                candidates[i].update(unscored_candidate(candidates[i], infra_type, origin))
+                yield i, candidates[i]
+
+
+def enrich_candidates(candidates, infra_type, origin, layers=None, bases=None, deadline=None):
+    """✅ Enrich candidates in parallel; output keeps the input order"""
+    for _ in iter_enriched_candidates(candidates, infra_type, origin, layers, bases, deadline):
+        pass
+    return list(candidates)
+
+
+def _candidate_metrics_multi(candidate, infra_types, origin, layers, base, deadline):
+    """Base metrics once, then only the amenity distance + scoring per infra type"""
+    if base is None:
+        base = compute_base_metrics(candidate.get("lat"), candidate.get("lon"), layers, deadline)
+    return {t: compute_candidate_metrics(candidate, t, origin, layers, base, deadline) for t in infra_types}
+
+
+def enrich_candidates_multi(candidates, infra_types, origin, layers=None, bases=None, deadline=None):
+    """✅ Enrich the same candidates for several infra types in one pass
+
+    Returns {infra_type: [enriched copies in input order]}; the shared base
+    metrics are computed once per candidate, not once per type.
+    """
+    if bases is None:
+        bases = [None] * len(candidates)
+    futures = [
+        _enrich_pool.submit(_candidate_metrics_multi, cand, infra_types, origin, layers, base, deadline)
+        for cand, base in zip(candidates, bases)
+    ]
+    out = {t: [] for t in infra_types}
+    for cand, fut in zip(candidates, futures):
+        try:
+            per_type = fut.result(timeout=None if deadline is None else deadline.remaining() + DEADLINE_GRACE_S)
+        except FutureTimeout:
+            fut.cancel()
+            print("⏱️ Candidate not enriched within deadline")
+            per_type = {t: unscored_candidate(cand, t, origin) for t in infra_types}
+        for t in infra_types:
+            out[t].append({**cand, **per_type[t]})
+    return out
 
 
 def build_reason_text(candidate, infra_type, dist_m, pop_proxy, dist_road, near_lake, lake_dist_m, green_pct, aqi, pm25, dist_same, scores):
     parts = []
 
-    if pop_proxy > 120:
+    if pop_proxy is None:
+        parts.append("Building density data not available")
+    elif pop_proxy > 120:
         parts.append("High building density nearby (strong demand)")
     elif pop_proxy > 50:
         parts.append("Moderate building density nearby")
     else:
         parts.append("Low building density nearby")
 
-    if dist_road < 100:
+    if dist_road is None:
+        parts.append("Road access data not available")
+    elif dist_road < 100:
         parts.append("Excellent road access")
     elif dist_road < 500:
         parts.append("Good road connectivity")
     else:
         parts.append("Limited road access")
 
-    if near_lake:
+    if near_lake is None:
+        parts.append("Flood-zone data not available")
+    elif near_lake:
         parts.append(f"Close to water body ({int(lake_dist_m)}m) — flood risk")
     else:
         parts.append("Safe from flood zones")
@@ -562,12 +1121,16 @@ def build_reason_text(candidate, infra_type, dist_m, pop_proxy, dist_road, near_
     aqi_labels = {1: "Good", 2: "Fair", 3: "Moderate", 4: "Poor", 5: "Very Poor"}
     aqi_label = aqi_labels.get(aqi, "Unknown")
     
-    if pm25 is not None:
+    if aqi is None:
+        parts.append("Air quality data not available")
+    elif pm25 is not None:
         parts.append(f"Air quality: {aqi_label} (AQI: {aqi}, PM2.5: {pm25:.0f} µg/m³)")
     else:
         parts.append(f"Air quality: {aqi_label} (AQI: {aqi})")
 
-    if dist_same is not None and dist_same < 800:
+    if dist_same is None:
+        parts.append("Nearby facility data not available")
+    elif dist_same < 800:
         parts.append(f"Similar facility {int(dist_same)}m away — redundancy risk")
     else:
         parts.append("No similar facility nearby")
@@ -587,40 +1150,7 @@ def build_reason_text(candidate, infra_type, dist_m, pop_proxy, dist_road, near_
 # NORMALIZE & RANK
 # ------------------------------------------------
 
-def normalize_scores_and_rank(candidates, topk=3):
-    keys = ["accessibility", "population_need", "lake_protection", "green_balance", "pollution_risk", "redundancy"]
-    vals = {k: [c["raw_scores"].get(k, 0.0) for c in candidates] for k in keys}
-
-    weights = {
-        "accessibility": 0.16,
-        "population_need": 0.22,
-        "lake_protection": 0.20,
-        "green_balance": 0.16,
-        "pollution_risk": 0.14,
-        "redundancy": 0.12
-    }
-
-    for c in candidates:
-        score = 0.0
-        for k in keys:
-            v = c["raw_scores"].get(k, 0.0)
-            arr = vals[k]
-            mn = min(arr) if arr else 0.0
-            mx = max(arr) if arr else 1.0
-            if mx - mn > 1e-9:
-                v_norm = (v - mn) / (mx - mn)
-            else:
-                v_norm = v
-            score += weights.get(k, 0.0) * v_norm
-        c["score"] = float(score * 100)
-
-    sorted_list = sorted(candidates, key=lambda x: x.get("score", 0.0), reverse=True)
-    
-    for i, cand in enumerate(sorted_list[:topk if topk else len(sorted_list)]):
-        rank = i + 1
-        cand["rank"] = rank
-        cand["reason"] = f"🏆 Rank {rank} - Score: {cand['score']:.0f}/100. {cand['reason']}"
-    
-    if topk is None:
-        return sorted_list
-    return sorted_list[:topk]
+@timed("rank")
+def normalize_scores_and_rank(candidates, topk=3, weights=None):
+    """✅ Vectorized min-max normalization + weighted ranking (see scoring.py)"""
+    return rank_candidates(candidates, weights=weights, topk=topk)
@@ -0,0 +1,170 @@
+# backend/warming.py
+"""Usage-driven cache warming: recompute popular searches before their results expire.
+
+Every /recommend records its (location, infra, radius, weights) in the usage
+table. A background thread wakes every WARM_INTERVAL_S, takes the hottest
+searches whose cached result is missing or expires within WARM_AHEAD_S, and
+recomputes them at background priority until WARM_CALL_BUDGET upstream calls
+are spent. Only one worker process warms per interval.
+
+The recompute callable (app.batch_recommendations) is handed in by the caller
+rather than imported, so `python app.py` doesn't load a second copy of app.
+Warming skips the grid-cell metric cache: cells are written alongside the
+results they feed, so reusing them would "refresh" a result from day-old data.
+
+    python warming.py Koramangala "HSR Layout" --infra hospital,school    # warm localities now
+    python warming.py --cycle                                             # run one usage-driven cycle
+"""
+import argparse
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from cache import CACHE_DURATION, claim_warm_cycle, hot_searches
+from metrics import trace
+from scheduler import priority
+from scoring import parse_weights
+
+WARMING = os.environ.get("CACHE_WARMING", "1") != "0"
+WARM_INTERVAL_S = int(os.environ.get("WARM_INTERVAL_S", "900"))
+WARM_CALL_BUDGET = int(os.environ.get("WARM_CALL_BUDGET", "300"))   # upstream calls per cycle
+WARM_AHEAD_S = 2 * 3600     # refresh results expiring within this
+WARM_TOP_N = 50             # searches considered per cycle
+WARM_MIN_SCORE = 2.0        # decayed request count; one-off searches are never warmed
+
+_started = False
+_start_lock = threading.Lock()
+_last_cycle = {}
+
+
+def due_searches(now=None):
+    """Hot searches whose cached result is missing or about to expire"""
+    now = time.time() if now is None else now
+    return [s for s in hot_searches(WARM_TOP_N)
+            if s["score"] >= WARM_MIN_SCORE
+            and (s["cached_at"] is None or s["cached_at"] + CACHE_DURATION - now < WARM_AHEAD_S)]
+
+
+def group_searches(searches):
+    """[((lat, lon, radius, variant), [infra, ...])] so each area's candidates are computed once"""
+    groups = OrderedDict()
+    for s in searches:
+        groups.setdefault((s["lat"], s["lon"], s["radius"], s["variant"]), []).append(s["infra"])
+    return list(groups.items())
+
+
+def warm(recompute, groups, budget=WARM_CALL_BUDGET, refresh=True):
+    """Recompute and cache each group at background priority until the call budget is spent
+
+    recompute: app.batch_recommendations. The budget is checked between groups,
+    so a cycle overshoots by at most one area.
+    """
+    spent, warmed, skipped = 0, 0, 0
+    with priority("background"):
+        for (lat, lon, radius, variant), infras in groups:
+            if spent >= budget:
+                skipped += len(infras)
+                continue
+            with trace("warm") as t:
+                try:
+                    recompute(lat, lon, infras, radius, parse_weights(variant or None), variant,
+                              refresh=refresh)
+                    warmed += len(infras)
+                except Exception as e:
+                    print(f"⚠️ Warming {lat:.5f},{lon:.5f} failed: {e}")
+            spent += sum(u["calls"] for u in t.summary()["upstream"].values())
+    if skipped:
+        print(f"💸 Warm budget spent ({spent} calls); {skipped} searches left for the next cycle")
+    return {"warmed": warmed, "skipped": skipped, "upstream_calls": spent}
+
+
+def warm_cycle(recompute, force=False):
+    """One usage-driven pass; None when another worker already ran this interval"""
+    if not force and not claim_warm_cycle(WARM_INTERVAL_S * 0.9):
+        return None
+    due = due_searches()
+    if not due:
+        return {"warmed": 0, "skipped": 0, "upstream_calls": 0}
+    print(f"🔥 Warming {len(due)} popular searches")
+    result = warm(recompute, group_searches(due))
+    _last_cycle.clear()
+    _last_cycle.update(result, finished=int(time.time()))
+    return result
+
+
+def _loop(recompute):
+    while True:
+        time.sleep(WARM_INTERVAL_S)
+        try:
+            warm_cycle(recompute)
+        except Exception as e:
+            print(f"⚠️ Warm cycle failed: {e}")
+
+
+def start_warmer(recompute):
+    """Start the background warming thread once per process (no-op with CACHE_WARMING=0)"""
+    global _started
+    with _start_lock:
+        if _started or not WARMING:
+            return
+        _started = True
+    threading.Thread(target=_loop, args=(recompute,), name="cache-warmer", daemon=True).start()
+
+
+def warming_stats():
+    return {"enabled": WARMING, "interval_s": WARM_INTERVAL_S, "call_budget": WARM_CALL_BUDGET,
+            "due": len(due_searches()), "last_cycle": dict(_last_cycle)}
+
+
+# ------------------------------------------------
+# CLI
+# ------------------------------------------------
+
+def warm_places(recompute, places, infras, radius=2500, weights=None, refresh=False, budget=None):
+    """Geocode each locality and warm every infra type for it"""
+    from scoring import weights_signature
+    from utils_geo import nominatim_lookup
+
+    variant = weights_signature(parse_weights(weights))
+    groups = []
+    with priority("background"):
+        for place in places:
+            loc = nominatim_lookup(place)
+            if not loc:
+                print(f"⚠️ Place not found: {place}")
+                continue
+            groups.append(((float(loc["lat"]), float(loc["lon"]), radius, variant), list(infras)))
+    return warm(recompute, groups, budget=float("inf") if budget is None else budget, refresh=refresh)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Warm the /recommend cache")
+    parser.add_argument("places", nargs="*", help="localities to warm (or @file with one per line)")
+    parser.add_argument("--infra", default="hospital,school,park")
+    parser.add_argument("--radius", type=int, default=2500)
+    parser.add_argument("--weights", help="profile name or key:value,... (see scoring.py)")
+    parser.add_argument("--force", action="store_true", help="recompute even if a fresh result is cached")
+    parser.add_argument("--budget", type=int, help="stop after this many upstream calls")
+    parser.add_argument("--cycle", action="store_true", help="run one usage-driven warming cycle now")
+    args = parser.parse_args(argv)
+    from app import batch_recommendations
+
+    if args.cycle:
+        print(f"✅ {warm_cycle(batch_recommendations, force=True)}")
+        return
+    places = []
+    for p in args.places:
+        if p.startswith("@"):
+            with open(p[1:], encoding="utf-8") as f:
+                places += [line.strip() for line in f if line.strip()]
+        else:
+            places.append(p)
+    if not places:
+        parser.error("give localities to warm, or --cycle")
+    infras = [t.strip() for t in args.infra.split(",") if t.strip()]
+    print(f"✅ {warm_places(batch_recommendations, places, infras, args.radius, args.weights, args.force, args.budget)}")
+
+
+if __name__ == "__main__":
+    main()
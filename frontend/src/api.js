@@ -8,8 +8,68 @@ export async function autocomplete(q) {
 
 
 export async function recommend({ place, infra, radius, lat, lon }) {
-  let url = `${BASE}/recommend?place=${encodeURIComponent(place)}&infra=${infra}&radius=${radius}`;
+  // fields=map: only the candidate keys the map and popups render
+  let url = `${BASE}/recommend?place=${encodeURIComponent(place)}&infra=${infra}&radius=${radius}&fields=map`;
   if (lat && lon) url += `&lat=${lat}&lon=${lon}`;
   const r = await fetch(url);
   return r.json();
 }
+
+
+// Streams /recommend as NDJSON: onEvent is called for "candidates",
+// each enriched "candidate" and the final "result"; resolves with the result.
+// deadlineMs bounds the search; late metrics come back imputed.
+export async function recommendStream({ place, infra, radius, lat, lon, deadlineMs }, onEvent) {
+  let url = `${BASE}/recommend?place=${encodeURIComponent(place)}&infra=${infra}&radius=${radius}&stream=1&fields=map`;
+  if (lat && lon) url += `&lat=${lat}&lon=${lon}`;
+  if (deadlineMs) url += `&deadline_ms=${deadlineMs}`;
+  const r = await fetch(url);
+  if (!r.body || !(r.headers.get("content-type") || "").includes("ndjson")) {
+    const res = await r.json();
+    onEvent({ event: "result", ...res });
+    return res;
+  }
+
+  const reader = r.body.getReader();
+  const decoder = new TextDecoder();
+  let buf = "";
+  let result = null;
+  for (;;) {
+    const { done, value } = await reader.read();
+    if (value) buf += decoder.decode(value, { stream: true });
+    let nl;
+    while ((nl = buf.indexOf("\n")) >= 0) {
+      const line = buf.slice(0, nl).trim();
+      buf = buf.slice(nl + 1);
+      if (!line) continue;
+      const ev = JSON.parse(line);
+      if (ev.event === "result") result = ev;
+      onEvent(ev);
+    }
+    if (done) break;
+  }
+  return result;
+}
+
+
+// One call for several infra types over the same area: { results: { [infra]: { good, danger } } }
+export async function recommendBatch({ place, infras, radius, lat, lon }) {
+  let url = `${BASE}/recommend/batch?place=${encodeURIComponent(place)}&infra=${infras.join(",")}&radius=${radius}`;
+  if (lat && lon) url += `&lat=${lat}&lon=${lon}`;
+  const r = await fetch(url);
+  return r.json();
+}
+
+
+// Re-rank an already computed search under new weights from its stored metrics
+// (no upstream calls, fast enough for slider drags). weights: { key: value } or a profile name.
+// Pass the origin returned with the /recommend result to skip geocoding.
+export async function rerank({ place, infra, radius, lat, lon, weights }) {
+  const w = typeof weights === "string"
+    ? weights
+    : Object.entries(weights).map(([k, v]) => `${k}:${v}`).join(",");
+  let url = `${BASE}/rerank?infra=${infra}&radius=${radius}&weights=${encodeURIComponent(w)}`;
+  url += lat && lon ? `&lat=${lat}&lon=${lon}` : `&place=${encodeURIComponent(place)}`;
+  const r = await fetch(url);
+  return r.json();
+}
@@ -8,6 +8,9 @@ export default function PopupCard({ info, type }) {
     .map((b) => b.trim())
     .filter((b) => b.length > 2);
 
+  // Per-metric flags on every scored candidate; missing only if a fields= projection left them out
+  const flags = info.completeness ? Object.values(info.completeness) : null;
+
   return (
     <div
       style={{
@@ -42,6 +45,13 @@ export default function PopupCard({ info, type }) {
         ))}
       </ul>
 
+      {flags && (
+        <div style={{ fontSize: "13px", color: "#555" }}>
+          Data completeness: {flags.filter(Boolean).length}/{flags.length} metrics
+          {info.imputed && info.imputed.length > 0 && ` (estimated: ${info.imputed.join(", ")})`}
+        </div>
+      )}
+
       <a
         href={`https://www.google.com/maps?q=${info.lat},${info.lon}`}
         target="_blank"
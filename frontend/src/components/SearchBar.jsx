@@ -1,5 +1,8 @@
 import React, { useState } from "react";
-import { autocomplete, recommend } from "../api";
+import { autocomplete, recommendStream } from "../api";
+
+// Rank from whatever data is in after this long rather than waiting on slow upstreams
+const RECOMMEND_DEADLINE_MS = 8000;
 
 export default function SearchBar({ onResults }) {
   const [text, setText] = useState("");
@@ -32,8 +35,19 @@ export default function SearchBar({ onResults }) {
     }
     setLoading(true);
     try {
-      const r = await recommend({ place: text, infra, radius, lat, lon });
-      onResults(r.good || [], r.danger || []);
+      // Show candidate markers as soon as they arrive, then the ranked result
+      const partial = [];
+      await recommendStream({ place: text, infra, radius, lat, lon, deadlineMs: RECOMMEND_DEADLINE_MS }, (ev) => {
+        if (ev.event === "candidates") {
+          partial.splice(0, partial.length, ...ev.candidates);
+          onResults([...partial], []);
+        } else if (ev.event === "candidate") {
+          partial[ev.index] = ev.candidate;
+          onResults([...partial], []);
+        } else if (ev.event === "result") {
+          onResults(ev.good || [], ev.danger || []);
+        }
+      });
     } catch (error) {
       console.error("Error:", error);
       alert("Failed to fetch recommendations.");